@@ -1,19 +1,47 @@
 import os
 import math
 import threading
+import time
 import random
 import itertools
+import heapq
 import json
 import csv
+import hashlib
+import importlib.util
+import io
+import re
+import sqlite3
+try:
+    import fcntl
+except ImportError:         # Windows: msvcrt bayt kilidi kullanılır
+    fcntl = None
+    import msvcrt
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import tkinter as tk
-from tkinter import messagebox, ttk, filedialog
+from tkinter import messagebox, ttk, filedialog, simpledialog
 
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
-from tkintermapview import TkinterMapView
-from docplex.mp.model import Model
+from tkintermapview import TkinterMapView, osm_to_decimal, decimal_to_osm
+from PIL import Image, ImageTk
+try:
+    from docplex.mp.model import Model
+    from docplex.mp.solution import SolveSolution
+    from docplex.mp.constants import EffortLevel
+except ImportError:         # CPLEX yoksa açık kaynak arka uçlar (HiGHS) kullanılır
+    Model = None
+try:
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+    import pyarrow.parquet as pq
+except ImportError:         # pyarrow yoksa yalnızca JSON/GeoJSON/CSV okunur
+    pa = None
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import numpy as np
 import requests, json   # en üstteki import bloğuna ekleyebilirsiniz
 
 # Make constants available in this namespace to avoid undefined errors
@@ -44,6 +72,7 @@ POI_COLOR = {
     "Parking":"#fd7e14",   # turuncu
     "Fuel":   "#007bff"    # mavi
 }
+HOME_MARKER_COLOR     = "green"     # ev / araç konumu
 SELECTED_HOME_COLOR   = "#17a2b8"   # turkuaz
 SELECTED_STATION_COLOR = "#6f42c1"  # mor
 
@@ -58,6 +87,76 @@ TRIP_PER_EV_RANGE = (1, 5)
 
 SEED_CONST = 123   
 
+# İstasyon başına şarj ünitesi (open_results_window: Parking → 4, Fuel → 2)
+CHARGERS_PER_STATION = {"Home": 1, "Parking": 4, "Fuel": 2}
+
+# Gün içi simülasyon parametreleri (dakika / km/h)
+SIM_DAY_MIN        = 24 * 60
+SIM_AVG_SPEED_KMH  = 30        # şehir içi ortalama hız
+SIM_FIRST_DEP_MIN  = (8 * 60, 90)   # ilk çıkış ~ N(08:00, 90 dk)
+SIM_MEAN_DWELL_MIN = 120       # varışta ortalama bekleme (üstel)
+SIM_MAX_WAIT_MIN   = 15        # hizmet seviyesi: ≤ 15 dk kuyruk
+
+# Talep kümeleme: ızgara hücresi (m) ve tam model alt sınırı için Lagrange iterasyonu
+AGG_CELL_M = 250
+AGG_BOUND_ITER = 100
+
+# EV örneklemesi: tabakalandırma ızgarası (m)
+EV_STRATA_CELL_M = 500
+
+# GA: aşılan her kWh kapasite için ceza (k€)
+CAP_PENALTY = 1e3
+
+# Ev işaretçileri: görünür alan dışı çizilmez, düşük yakınlaştırmada kümelenir
+HOME_MARKER_LIMIT = 400         # bu sayının üstünde görünür ev → küme
+HOME_CLUSTER_ZOOM = 15          # bu yakınlaştırmanın altında her zaman küme
+CLUSTER_CELL_PX = 64            # küme ızgarası hücresi (piksel)
+VIEW_POLL_MS = 250              # görünüm değişikliği yoklama aralığı
+
+# Ev noktası yükleyici: parça boyutu ve arayüz ilerleme güncelleme aralığı
+HOME_CHUNK = 65536
+LOAD_PROGRESS_S = 0.3
+
+# İkili senaryo dosyası: başlık + 64 bayta hizalı ham diziler (mmap ile okunur)
+SCENARIO_MAGIC = b"EVSCN\x00\x01\x00"
+SCENARIO_ALIGN = 64
+
+# Kalıcı önbellekler kaynak ağacının dışında, kullanıcı önbellek dizininde tutulur
+CACHE_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+                         or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "EVChargingStationPlanner")
+
+# EV × aday mesafe deposu: diskte float32 memmap, OSRM table karoları ile doldurulur
+DIST_DIR = os.path.join(CACHE_DIR, "dist_cache")
+DIST_SOURCE = "osrm-table/driving"
+DIST_TILE_ROWS = 99             # OSRM demo sunucusu: istek başına ≤ 100 koordinat
+
+# Yerel harita karoları (MBTiles); harita önce buradan okur.
+# Karo sunucusu EV_TILE_SERVER ortam değişkeniyle değiştirilebilir (ör. kendi sunucunuz).
+TILE_SERVER = os.environ.get("EV_TILE_SERVER", "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+TILE_DB_PATH = os.path.join(CACHE_DIR, "map_tiles.mbtiles")
+TILE_CACHE_MAX_MB = 512         # LRU üst sınırı
+PREFETCH_ZOOM = (12, 16)        # ön indirme için varsayılan yakınlaştırma aralığı
+PREFETCH_MAX_TILES = 20000      # tek seferde indirilecek en fazla karo
+OSM_PREFETCH_MAX_TILES = 500    # tile.openstreetmap.org: toplu indirme kullanım politikasına aykırı
+PREFETCH_RATE = 2.0             # ön indirmede saniyede en fazla karo isteği
+
+# OSRM rota geometrisi: kalıcı önbellek (kodlanmış polyline) ve eşzamanlı istek
+OSRM_ROUTE_URL = "https://router.project-osrm.org/route/v1/driving/"
+ROUTE_DB_PATH = os.path.join(CACHE_DIR, "route_cache.sqlite")
+ROUTE_WORKERS = 4               # aynı anda en fazla OSRM isteği
+
+# Kenar sayımı: koordinatlar 1e-5° ızgarasına yuvarlanıp int64'e paketlenir
+EDGE_GRID_PER_DEG = 100_000
+
+# Isı haritası: kullanım oranı eşikleri ve renkleri (yeşil → kırmızı)
+HEAT_BANDS = (0.25, 0.50, 0.75)
+HEAT_COLORS = ("#28a745", "#ffc107", "#fd7e14", "#dc3545")
+HEAT_LINE_PX = 4                # çizgi kalınlığı (piksel)
+HEAT_MAX_PX = 2048              # tek görüntünün en büyük kenarı
+HEAT_LOD_ZOOMS = range(10, 17)  # sadeleştirilmiş seviyeler; üstünde tam çözünürlük
+HEAT_SIMPLIFY_PX = 1.0          # seviye ızgarası hücresi (o yakınlaştırmada piksel)
+
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371.0
     phi1, phi2 = map(math.radians, (lat1, lat2))
@@ -80,6 +179,42 @@ def road_distance_km(lat1, lon1, lat2, lon2):
         # ağ hatası, kota, vs.
         return haversine(lat1, lon1, lat2, lon2)
 
+def road_distance_tile(lat, lon, c_lat, c_lon):
+    """
+    Road km from each of the (lat, lon) points to one candidate with a
+    single OSRM table request; None if the request fails, so the caller
+    can fall back without caching the result.
+    """
+    try:
+        coords = ";".join(f"{b},{a}" for a, b in zip(lat, lon)) + f";{c_lon},{c_lat}"
+        url = (f"https://router.project-osrm.org/table/v1/driving/{coords}"
+               f"?sources={';'.join(map(str, range(len(lat))))}&destinations={len(lat)}"
+               f"&annotations=distance")
+        rows = requests.get(url, timeout=10).json()["distances"]
+        km = np.array([r[0] for r in rows], dtype=float) / 1000.0
+        if np.isnan(km).any():
+            raise ValueError("unroutable point")
+        return km
+    except Exception:
+        return None
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Element-wise (broadcasting) haversine in km for NumPy arrays."""
+    R = 6371.0
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2) - np.radians(lon1)
+    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """Vectorized haversine (km): len(lat1) × len(lat2) matrix."""
+    lat1 = np.asarray(lat1, dtype=float)[:, None]
+    lon1 = np.asarray(lon1, dtype=float)[:, None]
+    lat2 = np.asarray(lat2, dtype=float)[None, :]
+    lon2 = np.asarray(lon2, dtype=float)[None, :]
+    return haversine_np(lat1, lon1, lat2, lon2)
+
 class Vehicle:
     def __init__(self):
         self.brand = "Generic"
@@ -122,6 +257,2667 @@ class Nissan(Vehicle):
         self.charge_rate = 50
         self.consumption_rate = 0.16
 
+VEHICLE_CLASSES = (Renault, Ford, Tesla, Nissan)
+
+# Araç kataloğu (veri dosyası); yoksa yukarıdaki sınıflar kullanılır
+VEHICLE_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "Data", "vehicles.json")
+
+@dataclass(frozen=True)
+class VehicleCatalog:
+    """Vehicle models as parallel arrays; a model code is an index into them."""
+    brand: tuple
+    battery_capacity: np.ndarray      # kWh
+    charge_rate: np.ndarray           # kW
+    consumption_rate: np.ndarray      # kWh/km
+    share: np.ndarray                 # pazar payı (toplamı 1)
+
+    def __len__(self):
+        return len(self.brand)
+
+    @classmethod
+    def load(cls, path=VEHICLE_CATALOG_PATH):
+        """From a JSON list of models; the built-in Vehicle classes if the file is missing."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except OSError:
+            rows = [vars(c()) for c in VEHICLE_CLASSES]
+        share = np.array([r.get("share", 1.0) for r in rows], dtype=float)
+        return cls(tuple(r["brand"] for r in rows),
+                   *(np.array([r[k] for r in rows], dtype=float)
+                     for k in ("battery_capacity", "charge_rate", "consumption_rate")),
+                   share / share.sum())
+
+VEHICLE_CATALOG = VehicleCatalog.load()
+
+def sample_evs(lat, lon, evr, rng, catalog=VEHICLE_CATALOG, strata_m=None):
+    """
+    Picks round(evr %) of the homes as EVs and draws a model per EV from
+    the catalog's market shares. With strata_m, homes are grouped into
+    strata_m-metre grid cells and each cell gets its proportional share
+    of the sample (largest remainders), so sparse districts are not
+    skipped by chance; within a cell the choice is uniform. Returns
+    (sorted home indices, model codes).
+    """
+    n = len(lat)
+    k = min(n, max(1, int(n * evr / 100)))
+    if not strata_m:
+        idx = rng.choice(n, size=k, replace=False)
+    else:
+        lat, lon = np.asarray(lat), np.asarray(lon)
+        dlat = strata_m / 111_320.0
+        dlon = dlat / max(math.cos(math.radians(float(lat.mean()))), 1e-6)
+        # yoğun ızgara numarası (en küçük köşeden); çok seyrek/geniş alanda sıkıştır
+        gi = ((lat - lat.min()) / dlat).astype(np.int64)
+        gj = ((lon - lon.min()) / dlon).astype(np.int64)
+        w = int(gj.max()) + 1
+        cell = gi * w + gj
+        if (int(gi.max()) + 1) * w <= 4 * n:
+            cnt = np.bincount(cell)
+        else:
+            _, cell, cnt = np.unique(cell, return_inverse=True, return_counts=True)
+            cell = cell.ravel()
+        exact = k * cnt / n
+        quota = np.floor(exact).astype(np.int64)
+        extra = k - quota.sum()
+        quota[np.argsort(quota - exact, kind="stable")[:extra]] += 1
+        # her hücrede rastgele anahtarı en küçük quota[c] ev seçilir. Tüm evler
+        # sıralanmaz: payından biraz geniş bir olasılıkla aday süzülür (yetmeyen
+        # hücrede hepsi aday olur), yalnızca adaylar (hücre + anahtar) sıralanır.
+        u = rng.random(n, dtype=np.float32)
+        p = np.where(quota > 0, (quota + 3 * np.sqrt(quota) + 3) / np.maximum(cnt, 1), 0.0)
+        p = p.astype(np.float32)
+        while True:
+            cand = np.flatnonzero(u < p[cell])
+            got = np.bincount(cell[cand], minlength=len(cnt))
+            short = got < quota
+            if not short.any():
+                break
+            p[short] = 2.0
+        c = cell[cand]
+        order = cand[np.argsort(c + u[cand].astype(float))]     # hücre, sonra anahtar
+        c = cell[order]
+        rank = np.arange(len(order)) - (np.cumsum(got) - got)[c]
+        idx = order[rank < quota[c]]
+    idx = np.sort(idx)
+    return idx, rng.choice(len(catalog), size=len(idx), p=catalog.share).astype(np.uint8)
+
+@dataclass(frozen=True)
+class Fleet:
+    """
+    Selected EVs as a struct of arrays (index i = i-th selected EV): the
+    model code plus that model's battery, charge rate and consumption,
+    gathered once from the catalog so demand and energy math runs on the
+    whole fleet at once. vehicle(i) builds a Vehicle object only for the
+    UI.
+    """
+    catalog: VehicleCatalog
+    model: np.ndarray                 # EV → model code (uint8)
+    battery_capacity: np.ndarray
+    charge_rate: np.ndarray
+    consumption_rate: np.ndarray
+
+    def __len__(self):
+        return len(self.model)
+
+    @classmethod
+    def from_models(cls, model, catalog=VEHICLE_CATALOG):
+        model = np.asarray(model, dtype=np.uint8)
+        return cls(catalog, model, catalog.battery_capacity[model],
+                   catalog.charge_rate[model], catalog.consumption_rate[model])
+
+    @property
+    def brand(self):
+        return np.asarray(self.catalog.brand)[self.model]
+
+    def vehicle(self, i):
+        v = Vehicle()
+        v.brand = self.catalog.brand[self.model[i]]
+        v.battery_capacity = float(self.battery_capacity[i])
+        v.charge_rate = float(self.charge_rate[i])
+        v.consumption_rate = float(self.consumption_rate[i])
+        return v
+
+# Olay türleri (heap girdisi: (zaman_dk, ev, tür, veri))
+_EV_DEPART, _EV_ARRIVE, _EV_AT_STATION, _EV_CHARGED = range(4)
+
+def simulate_charging_day(ev_idx, trip_km, dest_lat, dest_lon,
+                          battery, charge_rate, consumption,
+                          st_lat, st_lon, st_chargers,
+                          seed=SEED_CONST, max_wait_min=SIM_MAX_WAIT_MIN):
+    """
+    Heap-based discrete-event simulation of one day of EV trips.
+
+    Trips are given as flat arrays ordered by EV and trip number
+    (ev_idx, trip_km, dest_*); vehicles as per-EV arrays; stations as
+    coordinates plus charger counts. An EV whose SOC drops below
+    MIN_SOC_KWH on arrival drives to the nearest open station, waits
+    for a free charger (FIFO) and charges to full at its charge_rate.
+    Events after SIM_DAY_MIN are dropped; EVs still queued at the horizon
+    count with their censored wait. Returns a report dict with queue waits, service level and
+    per-station occupancy.
+    """
+    ev_idx  = np.asarray(ev_idx, dtype=np.int64)
+    trip_km = np.asarray(trip_km, dtype=float)
+    n_ev, n_trip, n_st = len(battery), len(trip_km), len(st_lat)
+    rng = np.random.default_rng(seed)
+
+    # --- EV başına ilk / son yolculuk indeksi
+    first = np.searchsorted(ev_idx, np.arange(n_ev), side="left")
+    end   = np.searchsorted(ev_idx, np.arange(n_ev), side="right")
+
+    # --- Varış noktasına en yakın istasyon (parça parça, bellek dostu)
+    near_st = np.zeros(n_trip, dtype=np.int64)
+    near_km = np.zeros(n_trip)
+    if n_st:
+        for lo in range(0, n_trip, 50_000):
+            hi = min(lo + 50_000, n_trip)
+            dm = haversine_matrix(dest_lat[lo:hi], dest_lon[lo:hi], st_lat, st_lon)
+            near_st[lo:hi] = dm.argmin(axis=1)
+            near_km[lo:hi] = dm[np.arange(hi - lo), near_st[lo:hi]]
+
+    # --- Zamanlar (dk): ilk çıkış, yolculuk süresi, varış sonrası bekleme
+    mu, sigma = SIM_FIRST_DEP_MIN
+    t0     = np.clip(rng.normal(mu, sigma, n_ev), 5 * 60, 20 * 60)
+    travel = trip_km / SIM_AVG_SPEED_KMH * 60.0
+    dwell  = rng.exponential(SIM_MEAN_DWELL_MIN, n_trip) + 10.0
+    detour = near_km / SIM_AVG_SPEED_KMH * 60.0
+
+    # Döngüde numpy skaler erişimi yavaş → düz listeler
+    first, end, t0 = first.tolist(), end.tolist(), t0.tolist()
+    trip_km, travel, dwell = trip_km.tolist(), travel.tolist(), dwell.tolist()
+    near_st, near_km, detour = near_st.tolist(), near_km.tolist(), detour.tolist()
+    batt = [float(b) for b in battery]
+    rate = [max(float(r), 1e-6) for r in charge_rate]
+    cons = [float(c) for c in consumption]
+    chargers = [int(c) for c in st_chargers]
+    soc = batt[:]
+    next_trip = first[:]
+
+    busy      = [0] * n_st
+    queues    = [deque() for _ in range(n_st)]
+    max_queue = [0] * n_st
+    sessions  = [0] * n_st
+    busy_min  = [0.0] * n_st
+    energy    = [0.0] * n_st
+    waits     = []
+    stranded  = 0
+
+    heap = [(t0[e], e, _EV_DEPART, first[e]) for e in range(n_ev) if first[e] < end[e]]
+    heapq.heapify(heap)
+    push, pop = heapq.heappush, heapq.heappop
+
+    def start_charge(t, e, j):
+        need = batt[e] - max(soc[e], 0.0)
+        dur  = need / rate[e] * 60.0
+        sessions[j] += 1
+        energy[j]   += need
+        busy_min[j] += max(0.0, min(t + dur, SIM_DAY_MIN) - t)
+        push(heap, (t + dur, e, _EV_CHARGED, j))
+
+    while heap:
+        t, e, kind, k = pop(heap)
+        if t > SIM_DAY_MIN:          # ufuk sonu: sonraki olaylar ertesi güne ait
+            break
+        if kind == _EV_DEPART:
+            push(heap, (t + travel[k], e, _EV_ARRIVE, k))
+
+        elif kind == _EV_ARRIVE:
+            soc[e] -= trip_km[k] * cons[e]
+            next_trip[e] = k + 1
+            if soc[e] < MIN_SOC_KWH and n_st:
+                soc[e] -= near_km[k] * cons[e]
+                if soc[e] < 0:
+                    stranded += 1
+                push(heap, (t + detour[k], e, _EV_AT_STATION, near_st[k]))
+            elif k + 1 < end[e]:
+                push(heap, (t + dwell[k], e, _EV_DEPART, k + 1))
+
+        elif kind == _EV_AT_STATION:
+            j = k
+            if busy[j] < chargers[j]:
+                busy[j] += 1
+                waits.append(0.0)
+                start_charge(t, e, j)
+            else:
+                queues[j].append((e, t))
+                max_queue[j] = max(max_queue[j], len(queues[j]))
+
+        else:   # _EV_CHARGED
+            j = k
+            soc[e] = batt[e]
+            if next_trip[e] < end[e]:
+                push(heap, (t, e, _EV_DEPART, next_trip[e]))
+            if queues[j]:
+                e2, t_arr = queues[j].popleft()
+                waits.append(t - t_arr)
+                start_charge(t, e2, j)
+            else:
+                busy[j] -= 1
+
+    # Gün sonunda hâlâ kuyrukta olanlar ufka kadar beklemiş sayılır (sansürlü);
+    # max_wait_min'i aşan talepler hizmet dışı sayılır.
+    for q in queues:
+        waits.extend(SIM_DAY_MIN - t_arr for _, t_arr in q)
+    w = np.asarray(waits) if waits else np.zeros(0)
+    n_req = len(waits)
+    served_ok = int(np.count_nonzero(w <= max_wait_min))
+    return {
+        "n_ev": n_ev,
+        "n_trips": n_trip,
+        "requests": n_req,
+        "stranded": stranded,
+        "mean_wait_min": float(w.mean()) if n_req else 0.0,
+        "p95_wait_min": float(np.percentile(w, 95)) if n_req else 0.0,
+        "max_wait_min": float(w.max()) if n_req else 0.0,
+        "service_level": served_ok / n_req if n_req else 1.0,
+        "stations": [
+            {"sessions": sessions[j],
+             "max_queue": max_queue[j],
+             "energy_kwh": round(energy[j], 2),
+             "utilization": busy_min[j] / (max(chargers[j], 1) * SIM_DAY_MIN)}
+            for j in range(n_st)
+        ],
+    }
+
+# ----------------------------------------------------------------------
+#  Solver çekirdekleri (GUI'den bağımsız; işçi süreçlerinde de çalışır)
+# ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class LocationSolution:
+    """
+    Immutable result of one solve. Per-EV arrays (assigned candidate,
+    road distance, energy) and the summary KPIs are computed once by the
+    solver thread; the results window only renders them.
+    """
+    method: str
+    obj: float
+    lower_bound: object           # float veya None
+    open_idx: tuple               # açık aday indeksleri
+    assign: np.ndarray            # EV → aday indeksi
+    dist_km: np.ndarray           # EV → atanan istasyona mesafe
+    energy_kwh: np.ndarray        # EV → o mesafenin enerjisi
+    n_semi: int
+    n_fast: int
+    n_chargers: int
+    energy_total: float
+
+    @classmethod
+    def build(cls, method, obj, open_idx, assign, d, consumption, poi, lower_bound=None):
+        """d: EV × candidate km, consumption: kWh/km per EV, poi: type per candidate."""
+        assign = np.asarray(assign, dtype=np.int64)
+        dist = np.asarray(d)[np.arange(len(assign)), assign].astype(float)
+        energy = dist * np.asarray(consumption, dtype=float)
+        for a in (assign, dist, energy):
+            a.flags.writeable = False
+        open_idx = tuple(sorted(int(j) for j in open_idx))
+        semi = sum(1 for j in open_idx if poi[j] == "Parking")
+        fast = sum(1 for j in open_idx if poi[j] == "Fuel")
+        return cls(method, float(obj), lower_bound, open_idx, assign, dist, energy,
+                   semi, fast,
+                   semi * CHARGERS_PER_STATION["Parking"] + fast * CHARGERS_PER_STATION["Fuel"],
+                   float(energy.sum()))
+
+# ----------------------------------------------------------------------
+#  Çözücüden bağımsız MIP katmanı (matris biçimi → CPLEX / HiGHS / LP-MPS)
+# ----------------------------------------------------------------------
+MIP_BACKENDS = ["CPLEX", "HiGHS", "SciPy (HiGHS)"]
+
+class MipSpec:
+    """
+    Backend-neutral MILP in matrix form: min c·x subject to
+    row_lo ≤ A x ≤ row_hi and lb ≤ x ≤ ub, with integrality flags.
+    Variables are added in named blocks and constraints as COO arrays,
+    so a model is built with NumPy and handed to a backend in one call.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.blocks = []                  # (ad, başlangıç, şekil)
+        self.c, self.lb, self.ub, self.integer = [], [], [], []
+        self.rows, self.cols, self.vals = [], [], []
+        self.row_lo, self.row_hi, self.row_blocks = [], [], []
+        self.n_vars = self.n_rows = 0
+
+    def add_vars(self, name, shape, cost, lb=0.0, ub=1.0, integer=True):
+        """Adds a block of variables; returns the flat index array (in `shape`)."""
+        size = int(np.prod(shape))
+        start = self.n_vars
+        self.blocks.append((name, start, tuple(shape)))
+        self.c.append(np.broadcast_to(np.asarray(cost, dtype=float), shape).ravel())
+        self.lb.append(np.full(size, lb, dtype=float))
+        self.ub.append(np.full(size, ub, dtype=float))
+        self.integer.append(np.full(size, integer, dtype=bool))
+        self.n_vars += size
+        return np.arange(start, start + size).reshape(shape)
+
+    def add_rows(self, name, rows, cols, vals, lo, hi):
+        """Adds len(lo) rows; rows are local (0-based) indices within this block."""
+        lo = np.asarray(lo, dtype=float).ravel()
+        self.rows.append(np.asarray(rows, dtype=np.int64).ravel() + self.n_rows)
+        self.cols.append(np.asarray(cols, dtype=np.int64).ravel())
+        self.vals.append(np.broadcast_to(np.asarray(vals, dtype=float),
+                                         np.shape(self.rows[-1])).ravel())
+        self.row_lo.append(lo)
+        self.row_hi.append(np.broadcast_to(np.asarray(hi, dtype=float), lo.shape).ravel())
+        self.row_blocks.append((name, self.n_rows, len(lo)))
+        self.n_rows += len(lo)
+
+    def arrays(self):
+        """(c, lb, ub, integer, rows, cols, vals, row_lo, row_hi) as flat arrays."""
+        cat = lambda parts, dt: np.concatenate(parts) if parts else np.zeros(0, dtype=dt)
+        return (cat(self.c, float), cat(self.lb, float), cat(self.ub, float),
+                cat(self.integer, bool), cat(self.rows, np.int64), cat(self.cols, np.int64),
+                cat(self.vals, float), cat(self.row_lo, float), cat(self.row_hi, float))
+
+    def csc(self):
+        """Column-wise (start, index, value) of A."""
+        _, _, _, _, rows, cols, vals, _, _ = self.arrays()
+        order = np.lexsort((rows, cols))
+        start = np.r_[0, np.cumsum(np.bincount(cols, minlength=self.n_vars))]
+        return start, rows[order], vals[order]
+
+    def var_name(self, k):
+        for name, start, shape in reversed(self.blocks):
+            if k >= start:
+                idx = np.unravel_index(k - start, shape)
+                return "_".join([name] + [str(int(v)) for v in idx])
+        raise IndexError(k)
+
+    def row_name(self, r):
+        for name, start, size in reversed(self.row_blocks):
+            if r >= start:
+                return f"{name}_{r - start}"
+        raise IndexError(r)
+
+def _as_km(d):
+    """Distance matrix as a float array; float32 input is not widened."""
+    d = np.asarray(d)
+    return d if d.dtype.kind == "f" else d.astype(float)
+
+def build_location_spec(D, d, fixed, capacity, max_st, conflicts, must_open=()):
+    """The capacitated location model of _solve_model as a MipSpec."""
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    n, K = d.shape
+    spec = MipSpec("ev_location_extended")
+    x = spec.add_vars("x", (K,), fixed)
+    spec.lb[0][list(must_open)] = 1.0          # ön işlemde açık sabitlenenler
+    y = spec.add_vars("y", (n, K), D[:, None] * d)
+
+    # Σ_j y_ij = 1
+    spec.add_rows("assign", np.repeat(np.arange(n), K), y.ravel(), 1.0, np.ones(n), 1.0)
+    # y_ij - x_j ≤ 0
+    link = np.arange(n * K)
+    spec.add_rows("link", np.r_[link, link], np.r_[y.ravel(), np.tile(x, n)],
+                  np.r_[np.ones(n * K), -np.ones(n * K)], np.full(n * K, -np.inf), 0.0)
+    # Σ_i D_i y_ij - cap x_j ≤ 0
+    spec.add_rows("cap", np.r_[np.tile(np.arange(K), n), np.arange(K)],
+                  np.r_[y.ravel(), x], np.r_[np.repeat(D, K), np.full(K, -float(capacity))],
+                  np.full(K, -np.inf), 0.0)
+    # x_a + x_b ≤ 1
+    if len(conflicts):
+        pairs = np.asarray(conflicts, dtype=np.int64)
+        spec.add_rows("radius", np.repeat(np.arange(len(pairs)), 2), x[pairs.ravel()],
+                      1.0, np.full(len(pairs), -np.inf), 1.0)
+    # Σ_j x_j ≤ max_st
+    spec.add_rows("card", np.zeros(K), x, 1.0, [-np.inf], float(max_st))
+    return spec
+
+def _solve_spec_cplex(spec, log_output=False):
+    import cplex
+    c, lb, ub, integer, *_ , row_lo, row_hi = spec.arrays()
+    cpx = cplex.Cplex()
+    if not log_output:
+        for stream in (cpx.set_log_stream, cpx.set_results_stream,
+                       cpx.set_warning_stream, cpx.set_error_stream):
+            stream(None)
+    cpx.objective.set_sense(cpx.objective.sense.minimize)
+    cpx.variables.add(obj=c.tolist(), lb=lb.tolist(), ub=ub.tolist(),
+                      types="".join(np.where(integer, "I", "C")))
+    # satır bazında (indeks, katsayı) listeleri — terim başına nesne yok
+    _, _, _, _, rows, cols, vals, _, _ = spec.arrays()
+    order = np.argsort(rows, kind="stable")
+    cuts = np.cumsum(np.bincount(rows, minlength=spec.n_rows))[:-1]
+    lin = [[ci.tolist(), vi.tolist()] for ci, vi in
+           zip(np.split(cols[order], cuts), np.split(vals[order], cuts))]
+    lo = np.where(np.isfinite(row_lo), row_lo, -cplex.infinity)
+    hi = np.where(np.isfinite(row_hi), row_hi, cplex.infinity)
+    has_lo, has_hi = np.isfinite(row_lo), np.isfinite(row_hi)
+    senses = np.where(lo == hi, "E",
+                      np.where(has_lo & has_hi, "R", np.where(has_lo, "G", "L")))
+    rhs = np.where(senses == "L", hi, lo)
+    rng = np.where(senses == "R", hi - lo, 0.0)
+    cpx.linear_constraints.add(lin_expr=lin, senses="".join(senses),
+                               rhs=rhs.tolist(), range_values=rng.tolist())
+    cpx.solve()
+    if cpx.solution.get_status() not in (cpx.solution.status.MIP_optimal,
+                                         cpx.solution.status.optimal_tolerance,
+                                         cpx.solution.status.optimal):
+        return None
+    return np.array(cpx.solution.get_values()), cpx.solution.get_objective_value()
+
+def _solve_spec_highs(spec, log_output=False):
+    import highspy
+    c, lb, ub, integer, *_ , row_lo, row_hi = spec.arrays()
+    start, index, value = spec.csc()
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", bool(log_output))
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = spec.n_vars, spec.n_rows
+    lp.col_cost_, lp.col_lower_, lp.col_upper_ = c, lb, ub
+    lp.row_lower_, lp.row_upper_ = row_lo, row_hi
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = start, index, value
+    lp.integrality_ = [highspy.HighsVarType.kInteger if f else highspy.HighsVarType.kContinuous
+                       for f in integer]
+    h.passModel(lp)
+    h.run()
+    if h.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+        return None
+    return np.array(h.getSolution().col_value), h.getInfo().objective_function_value
+
+def _solve_spec_scipy(spec, log_output=False):
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import csc_matrix
+    c, lb, ub, integer, *_ , row_lo, row_hi = spec.arrays()
+    A = csc_matrix(spec.csc()[::-1], shape=(spec.n_rows, spec.n_vars))
+    res = milp(c, constraints=LinearConstraint(A, row_lo, row_hi),
+               integrality=integer.astype(int), bounds=Bounds(lb, ub),
+               options={"disp": bool(log_output)})
+    if res.x is None:
+        return None
+    return res.x, res.fun
+
+_BACKEND_MODULE = {"CPLEX": "cplex", "HiGHS": "highspy", "SciPy (HiGHS)": "scipy"}
+
+def backend_available(backend):
+    """True when the Python package behind a MIP backend is importable."""
+    return importlib.util.find_spec(_BACKEND_MODULE[backend]) is not None
+
+def solve_spec(spec, backend="CPLEX", log_output=False):
+    """Solves a MipSpec with the chosen backend; returns (values, objective) or None."""
+    solver = {"CPLEX": _solve_spec_cplex, "HiGHS": _solve_spec_highs,
+              "SciPy (HiGHS)": _solve_spec_scipy}[backend]
+    return solver(spec, log_output=log_output)
+
+def _fmt_num(v):
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+def write_lp(spec, path):
+    """Writes the model in CPLEX LP format (readable by CPLEX, HiGHS, CBC, SCIP)."""
+    c, lb, ub, integer, rows, cols, vals, row_lo, row_hi = spec.arrays()
+    names = [spec.var_name(k) for k in range(spec.n_vars)]
+    order = np.argsort(rows, kind="stable")
+    cuts = np.cumsum(np.bincount(rows, minlength=spec.n_rows))[:-1]
+
+    def expr(idx, coef):
+        terms = [f"{'+' if v >= 0 else '-'} {_fmt_num(abs(v))} {names[k]}"
+                 for k, v in zip(idx, coef) if v != 0]
+        # LP satırları kısa tutulur (ayrıştırıcı sınırları)
+        return "\n   ".join(" ".join(terms[i:i + 8]) for i in range(0, len(terms), 8)) or "0 x_0"
+
+    with open(path, "w", encoding="ascii") as f:
+        f.write(f"\\ {spec.name}\nMinimize\n obj: ")
+        nz = np.flatnonzero(c)
+        f.write(expr(nz.tolist(), c[nz].tolist()) + "\nSubject To\n")
+        for r, (ci, vi) in enumerate(zip(np.split(cols[order], cuts), np.split(vals[order], cuts))):
+            lhs = expr(ci.tolist(), vi.tolist())
+            lo, hi = row_lo[r], row_hi[r]
+            if lo == hi:
+                f.write(f" {spec.row_name(r)}: {lhs} = {_fmt_num(hi)}\n")
+            else:
+                if np.isfinite(hi):
+                    f.write(f" {spec.row_name(r)}: {lhs} <= {_fmt_num(hi)}\n")
+                if np.isfinite(lo):
+                    f.write(f" {spec.row_name(r)}_lo: {lhs} >= {_fmt_num(lo)}\n")
+        f.write("Bounds\n")
+        for k in range(spec.n_vars):
+            if not (integer[k] and lb[k] == 0 and ub[k] == 1):
+                lo = _fmt_num(lb[k]) if np.isfinite(lb[k]) else "-inf"
+                hi = _fmt_num(ub[k]) if np.isfinite(ub[k]) else "+inf"
+                f.write(f" {lo} <= {names[k]} <= {hi}\n")
+        binaries = [names[k] for k in range(spec.n_vars)
+                    if integer[k] and lb[k] == 0 and ub[k] == 1]
+        generals = [names[k] for k in range(spec.n_vars)
+                    if integer[k] and not (lb[k] == 0 and ub[k] == 1)]
+        for title, group in (("Binaries", binaries), ("Generals", generals)):
+            if group:
+                f.write(f"{title}\n")
+                for i in range(0, len(group), 10):
+                    f.write(" " + " ".join(group[i:i + 10]) + "\n")
+        f.write("End\n")
+
+def write_mps(spec, path):
+    """Writes the model in free MPS format."""
+    c, lb, ub, integer, rows, cols, vals, row_lo, row_hi = spec.arrays()
+    start, index, value = spec.csc()
+    rnames = [spec.row_name(r) for r in range(spec.n_rows)]
+    sense = np.where(row_lo == row_hi, "E",
+                     np.where(np.isfinite(row_hi), "L", "G"))
+    with open(path, "w", encoding="ascii") as f:
+        f.write(f"NAME {spec.name}\nROWS\n N obj\n")
+        for r in range(spec.n_rows):
+            f.write(f" {sense[r]} {rnames[r]}\n")
+        f.write("COLUMNS\n")
+        in_int = False
+        for k in range(spec.n_vars):
+            if integer[k] != in_int:
+                f.write(f" M{k} 'MARKER' '{'INTORG' if integer[k] else 'INTEND'}'\n")
+                in_int = bool(integer[k])
+            name = spec.var_name(k)
+            if c[k] != 0:
+                f.write(f" {name} obj {_fmt_num(c[k])}\n")
+            for r, v in zip(index[start[k]:start[k + 1]].tolist(),
+                            value[start[k]:start[k + 1]].tolist()):
+                f.write(f" {name} {rnames[r]} {_fmt_num(v)}\n")
+        if in_int:
+            f.write(f" M{spec.n_vars} 'MARKER' 'INTEND'\n")
+        f.write("RHS\n")
+        for r in range(spec.n_rows):
+            rhs = row_hi[r] if sense[r] in "EL" else row_lo[r]
+            if rhs != 0:
+                f.write(f" rhs {rnames[r]} {_fmt_num(rhs)}\n")
+        ranged = [r for r in range(spec.n_rows)
+                  if sense[r] == "L" and np.isfinite(row_lo[r])]
+        if ranged:
+            f.write("RANGES\n")
+            for r in ranged:
+                f.write(f" rng {rnames[r]} {_fmt_num(row_hi[r] - row_lo[r])}\n")
+        f.write("BOUNDS\n")
+        for k in range(spec.n_vars):
+            name = spec.var_name(k)
+            if integer[k] and lb[k] == 0 and ub[k] == 1:
+                f.write(f" BV bnd {name}\n")
+                continue
+            if lb[k] != 0:
+                f.write(f" LO bnd {name} {_fmt_num(lb[k])}\n" if np.isfinite(lb[k])
+                        else f" MI bnd {name}\n")
+            if np.isfinite(ub[k]):
+                f.write(f" UP bnd {name} {_fmt_num(ub[k])}\n")
+        f.write("ENDATA\n")
+
+class IncrementalLocationMIP:
+    """
+    Docplex model of the capacitated location problem that stays alive
+    between runs. Candidates are identified by a stable key: adding one
+    appends a single x_j, its y_ij column and constraints to the existing
+    model, removing one fixes x_j = 0. The previous solution is handed to
+    CPLEX as a MIP start, so what-if edits re-solve from a warm model.
+    """
+
+    def __init__(self, D, capacity, max_st, name="ev_location_extended"):
+        self.m = Model(name=name)
+        self.D = [float(v) for v in D]
+        self.capacity = capacity
+        self.max_st = max_st
+        self.I = range(len(self.D))
+        self.keys = []            # sütun sırası (eklenme sırası)
+        self.active = set()
+        self.x, self.y = {}, {}   # key → x_j, key → [y_ij]
+        self.obj = self.m.linear_expr()
+        self.assign_ct = []
+        self.card_ct = None
+        self.last = None          # önceki çözüm: [(key, 1'e eşit değişken)]
+
+    def _add_column(self, key, fixed, col):
+        m = self.m
+        x = m.binary_var(name=f"x_{key}")
+        y = m.binary_var_list(len(self.D), name=f"y_{key}")
+        self.obj.add_term(x, fixed)
+        self.obj.add(m.scal_prod(y, [D_i * float(d_ij) for D_i, d_ij in zip(self.D, col)]))
+        m.add_constraints([y_i <= x for y_i in y])
+        m.add_constraint(m.scal_prod(y, self.D) <= self.capacity * x)
+        self.keys.append(key)
+        self.active.add(key)
+        self.x[key], self.y[key] = x, y
+        return x, y
+
+    def build(self, keys, fixed, d, conflicts):
+        """Bulk build for the initial candidates; d is I×J, conflicts are key pairs."""
+        m = self.m
+        for jj, key in enumerate(keys):
+            self._add_column(key, fixed[jj], d[:, jj])
+        self.assign_ct = m.add_constraints(
+            [m.sum(self.y[k][i] for k in keys) == 1 for i in self.I])
+        self.card_ct = m.add_constraint(m.sum(self.x[k] for k in keys) <= self.max_st)
+        for a, b in conflicts:
+            m.add_constraint(self.x[a] + self.x[b] <= 1)
+        m.minimize(self.obj)
+
+    def add_candidate(self, key, fixed, col, conflicts_with=()):
+        """Adds one candidate column (or re-opens a removed one)."""
+        if key in self.x:
+            self.x[key].ub = 1
+            self.active.add(key)
+            return
+        m = self.m
+        x, y = self._add_column(key, fixed, col)
+        for ct, y_i in zip(self.assign_ct, y):
+            ct.lhs = ct.lhs + y_i
+        self.card_ct.lhs = self.card_ct.lhs + x
+        for k in conflicts_with:
+            m.add_constraint(x + self.x[k] <= 1)
+        m.minimize(self.obj)
+
+    def remove_candidate(self, key):
+        """Closes a candidate for good (x_j = 0) without rebuilding the model."""
+        self.x[key].lb = 0
+        self.x[key].ub = 0
+        self.active.discard(key)
+
+    def solve_pool(self, k, log_output=False):
+        """
+        Up to k best distinct open sets: after each solve a no-good cut
+        excludes that set. The cuts are removed afterwards and the warm
+        start is reset to the optimum, so the live model is unchanged.
+        """
+        m = self.m
+        pool, cuts, first = [], [], None
+        for _ in range(k):
+            res = self.solve(log_output=log_output)
+            if res is None:
+                break
+            pool.append(res)
+            first = first or self.last
+            S = set(res["open"])
+            cuts.append(m.add_constraint(
+                m.sum(1 - self.x[kk] for kk in S) +
+                m.sum(self.x[kk] for kk in self.active if kk not in S) >= 1))
+        m.remove_constraints(cuts)
+        self.last = first
+        return pool
+
+    def fix_open(self, keys):
+        """x_j = 1 for the given active keys, free again for the rest."""
+        for k in self.active:
+            self.x[k].lb = 1 if k in keys else 0
+
+    def solve(self, log_output=False):
+        m = self.m
+        if self.last:
+            m.clear_mip_starts()
+            ws = SolveSolution(m)
+            for key, var in self.last:
+                if key in self.active:        # kaldırılan adaylar başlangıçta yer almaz
+                    ws.add_var_value(var, 1)
+            m.add_mip_start(ws, effort_level=EffortLevel.Repair)
+
+        sol = m.solve(log_output=log_output)
+        if not sol:
+            return None
+
+        keys = [k for k in self.keys if k in self.active]
+        x_val = sol.get_values([self.x[k] for k in keys])
+        y_val = np.array([sol.get_values(self.y[k]) for k in keys])     # K×I
+        best  = y_val.argmax(axis=0)
+        self.last = [(k, self.x[k]) for k, v in zip(keys, x_val) if v > 0.5]
+        self.last += [(keys[jj], self.y[keys[jj]][i]) for i, jj in enumerate(best)]
+        return {
+            "open":   [k for k, v in zip(keys, x_val) if v > 0.5],
+            "assign": [keys[jj] for jj in best],
+            "obj":    m.objective_value,
+        }
+
+def solve_location_mip(D, d, fixed, capacity, max_st, conflicts,
+                       backend="CPLEX", log_output=False, must_open=()):
+    """
+    Capacitated location MIP (same model as the Docplex method).
+    D: demand per EV (kWh), d: I×J distance matrix (km), fixed: J fixed
+    costs (k€), conflicts: (j, k) pairs closer than the minimum radius,
+    must_open: columns fixed to x_j = 1 by presolve_candidates.
+    The model is built once as a MipSpec and solved by `backend`.
+    Returns {'open', 'assign', 'obj'} or None when infeasible.
+    """
+    d = _as_km(d)
+    n, K = d.shape
+    spec = build_location_spec(D, d, fixed, capacity, max_st, conflicts, must_open)
+    sol = solve_spec(spec, backend, log_output=log_output)
+    if sol is None:
+        return None
+    values, obj = sol
+    y = values[K:].reshape(n, K)
+    return {
+        "open":   np.flatnonzero(values[:K] > 0.5).tolist(),
+        "assign": y.argmax(axis=1).tolist(),
+        "obj":    obj,
+    }
+
+def location_pool(D, d, fixed, capacity, max_st, conflicts, k,
+                  backend="CPLEX", must_open=()):
+    """k best distinct open sets of the location MIP via iterated no-good cuts."""
+    d = _as_km(d)
+    n, K = d.shape
+    spec = build_location_spec(D, d, fixed, capacity, max_st, conflicts, must_open)
+    pool = []
+    for _ in range(k):
+        sol = solve_spec(spec, backend)
+        if sol is None:
+            break
+        values, obj = sol
+        S = values[:K] > 0.5
+        pool.append({"open": np.flatnonzero(S).tolist(),
+                     "assign": values[K:].reshape(n, K).argmax(axis=1).tolist(),
+                     "obj": obj})
+        # Σ_{j∈S} (1 - x_j) + Σ_{j∉S} x_j ≥ 1
+        spec.add_rows("nogood", np.zeros(K), np.arange(K), np.where(S, -1.0, 1.0),
+                      [1.0 - S.sum()], np.inf)
+    return pool
+
+def aggregate_demand(lat, lon, D, capacity, cell_m=AGG_CELL_M):
+    """
+    Grid bucketing of EV homes into weighted demand points. Cells whose
+    demand would not fit a single station are split into sub-groups of
+    at most `capacity` kWh. Returns (labels, point_D): labels maps every
+    EV to its demand point, point_D is the merged demand per point.
+    """
+    lat, lon, D = (np.asarray(a, dtype=float) for a in (lat, lon, D))
+    # yerel metrik koordinatlar → hücre indeksi
+    ky = np.floor(lat * 111_320.0 / cell_m).astype(np.int64)
+    kx = np.floor(lon * 111_320.0 * math.cos(math.radians(lat.mean())) / cell_m).astype(np.int64)
+    _, cell = np.unique(np.stack([ky, kx], axis=1), axis=0, return_inverse=True)
+    cell = cell.ravel()
+
+    # hücre içi kümülatif talep → kapasiteyi aşmayan alt gruplar
+    order = np.lexsort((np.arange(len(D)), cell))
+    c_sorted, d_sorted = cell[order], D[order]
+    start = np.r_[0, np.flatnonzero(np.diff(c_sorted)) + 1]
+    offset = np.cumsum(d_sorted) - d_sorted
+    offset -= np.repeat(offset[start], np.diff(np.r_[start, len(D)]))
+    room = capacity - (D.max() if len(D) else 0.0)
+    sub = np.floor(offset / room).astype(np.int64) if room > 0 else np.arange(len(D))
+    _, grp = np.unique(np.stack([c_sorted, sub], axis=1), axis=0, return_inverse=True)
+
+    labels = np.empty(len(D), dtype=np.int64)
+    labels[order] = grp.ravel()
+    return labels, np.bincount(labels, weights=D)
+
+def solve_aggregated(D, d, labels, point_D, fixed, capacity, max_st, conflicts,
+                     backend="CPLEX", must_open=()):
+    """
+    Solves the reduced model on demand points, then re-assigns every EV
+    individually to the chosen stations with capacitated_assignment.
+    Point distances are D-weighted means of the members' distances, so
+    the reduced objective equals the cost of its own group assignment,
+    which is feasible for the EV-level model; the re-assignment is kept
+    only when it has no overflow and costs less. Groups cannot be split,
+    so the reduced model may be infeasible where the EV-level one is not.
+    The report's lower_bound is the Lagrangian bound of the EV-level
+    model, so gap bounds the distance of the result from the full-model
+    optimum. Returns (result, report) or (None, None) when infeasible.
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    n_pts, n_st = len(point_D), d.shape[1]
+    cost = np.column_stack([np.bincount(labels, weights=D * d[:, j], minlength=n_pts)
+                            for j in range(n_st)])
+    d_pts = cost / np.where(point_D > 0, point_D, 1.0)[:, None]
+
+    agg = solve_location_mip(point_D, d_pts, fixed, capacity, max_st, conflicts,
+                             backend=backend, must_open=must_open)
+    if agg is None:
+        return None, None
+    open_j = agg["open"]
+    fixed_open = sum(fixed[j] for j in open_j)
+
+    # EV düzeyinde yeniden atama (yalnızca seçilen istasyonlar; MIP yok)
+    group = np.asarray(agg["assign"])[labels]
+    travel, sub, overflow = capacitated_assignment(D, d[:, open_j], capacity)
+    full_obj = fixed_open + travel
+    if overflow > 0 or full_obj >= agg["obj"]:
+        assign, full_obj = group.tolist(), agg["obj"]     # grup ataması her zaman uygundur
+    else:
+        assign = [open_j[k] for k in sub]
+
+    # Tam (EV düzeyi) model için geçerli alt sınır; yarıçap çakışmaları ve sabitlenen
+    # adaylar gevşetilir, bu yüzden sınır yine geçerlidir
+    lb = lagrangian_solve(D, d, fixed, capacity, max_st, [],
+                          n_iter=AGG_BOUND_ITER)["lower_bound"]
+    report = {
+        "n_ev": len(D), "n_points": n_pts,
+        "agg_obj": agg["obj"], "full_obj": full_obj,
+        "reassign_gain": agg["obj"] - full_obj,
+        "reassign_overflow": overflow,
+        "lower_bound": lb,
+        "gap": (full_obj - lb) / max(abs(full_obj), 1e-9),
+    }
+    result = {"open": list(open_j), "assign": assign, "obj": full_obj}
+    return result, report
+
+def presolve_candidates(D, d, fixed, capacity, max_st, conflicts):
+    """
+    Reduction tests on the candidate set before any solver sees it.
+    Candidate j is dropped when a kept candidate k conflicts with it (so
+    the two are never open together), is no more expensive, is at least
+    as close to every EV and has no conflicts beyond j's: swapping j for
+    k in any solution keeps it feasible and does not raise the cost.
+    Ties are broken by index so that exactly one of two twins survives.
+    Afterwards every remaining candidate is fixed open when the others
+    cannot cover total demand on their own. Returns (keep, must_open,
+    report); indices refer to the original columns.
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    fixed = np.asarray(fixed, dtype=float)
+    n, K = d.shape
+    nbr = [set() for _ in range(K)]
+    for a, b in conflicts:
+        nbr[a].add(b); nbr[b].add(a)
+
+    alive = set(range(K))
+    changed = True
+    while changed:
+        changed = False
+        for j in sorted(alive, key=lambda j: (-fixed[j], -j)):
+            rivals = [k for k in nbr[j] & alive
+                      if fixed[k] <= fixed[j] and (nbr[k] & alive) - {j} <= nbr[j]]
+            if not rivals:
+                continue
+            closer = (d[:, rivals] <= d[:, [j]]).all(axis=0)
+            for k, ok in zip(rivals, closer.tolist()):
+                # eşit maliyet ve mesafede yalnızca küçük indeksli aday kalır
+                if ok and (fixed[k] < fixed[j] or (d[:, k] < d[:, j]).any() or k < j):
+                    alive.discard(j)
+                    changed = True
+                    break
+
+    keep = sorted(alive)
+    # Kapasite örtüsü: j olmadan açılabilecek en fazla istasyon talebi karşılamıyorsa x_j = 1
+    spare = min(max_st, len(keep) - 1) * capacity
+    must_open = keep[:] if 0 < len(keep) <= max_st and spare < D.sum() - 1e-9 else []
+
+    n_conf = lambda ks: sum(1 for a, b in conflicts if a in ks and b in ks)
+    kept = set(keep)
+    report = {
+        "n_cand": K, "n_removed": K - len(keep), "n_fixed_open": len(must_open),
+        "vars_before": K + n * K, "vars_after": len(keep) + n * len(keep),
+        "rows_before": n + n * K + K + len(conflicts) + 1,
+        "rows_after": n + n * len(keep) + len(keep) + n_conf(kept) + 1,
+    }
+    return keep, must_open, report
+
+def _transport_flow(D, d, cap):
+    """
+    Exact transportation solve for splittable demand: successive shortest
+    paths on the condensed station graph, where moving flow of EV i from
+    station j to j' costs d[i, j'] - d[i, j]. Returns (flow, unserved_kwh).
+    """
+    n, K = d.shape
+    flow = np.zeros((n, K))
+    rem_d = np.asarray(D, dtype=float).copy()
+    rem_c = np.asarray(cap, dtype=float).copy()
+    eps = 1e-9
+    big = np.inf
+    cols = np.arange(K)
+
+    # 0) Kapasite bağlamadığı sürece SSP her EV'yi en yakın istasyona,
+    #    ucuzdan pahalıya sırayla atar → bu kısım toplu uygulanır.
+    near = d.argmin(axis=1)
+    order = np.argsort(d[np.arange(n), near], kind="stable")
+    onehot = np.zeros((n, K))
+    onehot[np.arange(n), near[order]] = rem_d[order]
+    over = (np.cumsum(onehot, axis=0) > rem_c[None, :] + eps).any(axis=1)
+    cut = int(over.argmax()) if over.any() else n
+    bulk = order[:cut]
+    flow[bulk, near[bulk]] = rem_d[bulk]
+    np.subtract.at(rem_c, near[bulk], rem_d[bulk])
+    rem_d[bulk] = 0.0
+
+    # İstasyon üyelikleri ve kaydırma grafiği yalnızca değişen satırlarda
+    # yenilenir; kaynak tarafı sütun başına sıralı EV listesinde ilerler.
+    members = [set() for _ in range(K)]
+    for i, j in zip(bulk.tolist(), near[bulk].tolist()):
+        members[j].add(i)
+    w = np.full((K, K), big)
+    w_i = np.zeros((K, K), dtype=np.int64)
+
+    def refresh(a):
+        if members[a]:
+            rows = np.fromiter(members[a], dtype=np.int64)
+            delta = d[rows] - d[rows, a][:, None]
+            k = delta.argmin(axis=0)
+            w[a], w_i[a] = delta[k, cols], rows[k]
+        else:
+            w[a] = big
+        w[a, a] = big
+
+    def join(b, i):
+        """EV i gained flow at b: only its own shift costs can lower w[b]."""
+        if i in members[b]:
+            return
+        members[b].add(i)
+        delta = d[i] - d[i, b]
+        delta[b] = big
+        better = delta < w[b]
+        w[b, better], w_i[b, better] = delta[better], i
+
+    for a in range(K):
+        refresh(a)
+    col_order = np.argsort(d, axis=0)
+    ptr = np.zeros(K, dtype=np.int64)
+
+    while True:
+        # kaynak → istasyon: talebi kalan en ucuz EV (sütun sırasında ilerle)
+        dist = np.full(K, big)
+        src_i = np.zeros(K, dtype=np.int64)
+        for j in range(K):
+            while ptr[j] < n and rem_d[col_order[ptr[j], j]] <= eps:
+                ptr[j] += 1
+            if ptr[j] < n:
+                src_i[j] = col_order[ptr[j], j]
+                dist[j] = d[src_i[j], j]
+        if not np.isfinite(dist).any():
+            break                                   # tüm talep atandı
+        pred = np.full(K, -1)
+
+        # Bellman-Ford (negatif kenarlar olabilir, negatif döngü olmaz)
+        for _ in range(K):
+            cand = dist[:, None] + w
+            frm = cand.argmin(axis=0)
+            new = cand[frm, cols]
+            better = new < dist - 1e-12
+            if not better.any():
+                break
+            dist[better] = new[better]
+            pred[better] = frm[better]
+
+        open_c = np.where(rem_c > eps, dist, big)
+        t = int(open_c.argmin())
+        if not np.isfinite(open_c[t]):
+            break                                   # kapasite tükendi
+
+        # yolu geri izle (kenar başına kaydırılan EV), taşınacak miktarı bul
+        path, j = [], t
+        while pred[j] >= 0 and len(path) <= K:
+            path.append((pred[j], j, w_i[pred[j], j]))
+            j = pred[j]
+        i0 = src_i[j]
+        amount = min(rem_d[i0], rem_c[t])
+        for a, _, i in path:
+            amount = min(amount, flow[i, a])
+
+        flow[i0, j] += amount
+        join(j, i0)
+        dirty = set()
+        for a, b, i in path:
+            flow[i, a] -= amount
+            flow[i, b] += amount
+            if flow[i, a] <= eps:
+                flow[i, a] = 0.0
+                members[a].discard(i)
+                if (w_i[a] == i).any():         # yalnızca en iyi kaydırma adayı çıktıysa
+                    dirty.add(a)
+            join(b, i)
+        rem_d[i0] -= amount
+        rem_c[t] -= amount
+        for a in dirty:
+            refresh(a)
+
+    return flow, float(rem_d[rem_d > eps].sum())
+
+def capacitated_assignment(D, d, capacity):
+    """
+    Assigns every EV to one open station (columns of d) without exceeding
+    `capacity`: regret-based greedy first, exact transportation solve as
+    fallback when the greedy gets stuck (rounded to the largest share).
+    Returns (travel_cost, assign, overflow_kwh).
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    n, K = d.shape
+    cost = D[:, None] * d
+    pref = np.argsort(cost, axis=1)
+    if K > 1:
+        srt = np.take_along_axis(cost, pref[:, :2], axis=1)
+        regret = srt[:, 1] - srt[:, 0]
+    else:
+        regret = np.zeros(n)
+
+    # 1) Pişmanlık sırasına göre açgözlü atama
+    rem = [float(capacity)] * K
+    assign = np.full(n, -1, dtype=np.int64)
+    stuck = False
+    order = np.argsort(-regret, kind="stable")
+    for i, prefs, dem in zip(order.tolist(), pref[order].tolist(), D[order].tolist()):
+        for j in prefs:
+            if rem[j] >= dem:
+                rem[j] -= dem
+                assign[i] = j
+                break
+        else:
+            stuck = True
+            break
+    if not stuck:
+        return float(cost[np.arange(n), assign].sum()), assign, 0.0
+
+    # 2) Toplam kapasite yetersizse kesin çözüm de uygun olamaz → en yakın atama
+    if D.sum() > K * capacity:
+        assign = pref[:, 0]
+    else:
+        # 3) Kesin ulaştırma problemi (bölünebilir talep) + yuvarlama
+        flow, _ = _transport_flow(D, d, [capacity] * K)
+        assign = np.where(flow.max(axis=1) > 0, flow.argmax(axis=1), d.argmin(axis=1))
+    load = np.bincount(assign, weights=D, minlength=K)
+    overflow = float(np.clip(load - capacity, 0, None).sum())
+    return float(cost[np.arange(n), assign].sum()), assign, overflow
+
+def ga_search(D, d, fixed, st_pair, max_st, radius, capacity,
+              pop_size=20, n_gen=15, cx_p=0.9, mut_p=0.1, log=print, must_open=()):
+    """
+    Genetic search over open/closed chromosomes; st_pair holds the
+    station–station distances in metres. EVs are assigned under the same
+    station capacity as the MIP; genes in must_open stay 1. Returns
+    (best, fitness).
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    J = list(range(len(fixed)))
+    cache = {}                 # açık küme → uygunluk değeri
+
+    def random_chrom():
+        k_max = min(max_st, len(J))
+        k_open = random.randint(1, k_max)
+        ones = random.sample(J, k_open)
+        return [1 if j in ones else 0 for j in J]
+
+    def repair(ch):
+        """Açık istasyon sayısı > max_st ise rastgele kapat."""
+        for j in must_open:
+            ch[j] = 1
+        ones = [j for j, v in enumerate(ch) if v and j not in must_open]
+        while ones and len(ones) + len(must_open) > max_st:
+            ch[random.choice(ones)] = 0
+            ones = [j for j, v in enumerate(ch) if v and j not in must_open]
+        return ch
+
+    def fitness(ch):
+        if sum(ch) == 0:
+            return 1e9
+        open_idx = tuple(j for j, v in enumerate(ch) if v)
+        if open_idx in cache:
+            return cache[open_idx]
+
+        # 2.1 EV’ler kapasiteye uyarak açık istasyonlara atanıyor
+        travel, _, overflow = capacitated_assignment(D, d[:, open_idx], capacity)
+
+        # 2.2 Sabit kurulum maliyeti
+        fixed_cost = sum(fixed[j] for j in open_idx)
+
+        # 2.3 Radius ihlali CEZASI  (hav. + önbellek)
+        penalty = CAP_PENALTY * overflow
+        for a, b in itertools.combinations(open_idx, 2):
+            if st_pair[a][b] < radius:          # metre cinsinden
+                penalty += 1e5                  # büyük ceza
+
+        cache[open_idx] = fixed_cost + travel + penalty
+        return cache[open_idx]
+
+    pop  = [repair(random_chrom()) for _ in range(pop_size)]
+    best = min(pop, key=fitness)
+
+    for gen in range(n_gen):
+        new_pop = []
+        while len(new_pop) < pop_size:
+            p1, p2 = random.sample(pop, 2)
+
+            # --- Crossover
+            if random.random() < cx_p:
+                cut = random.randint(1, max(len(J) - 2, 1))
+                child = repair(p1[:cut] + p2[cut:])
+            else:
+                child = p1[:]
+
+            # --- Mutation
+            if random.random() < mut_p:
+                m = random.randint(0, len(J) - 1)
+                child[m] ^= 1
+                child = repair(child)
+
+            new_pop.append(child)
+
+        # Elitizm
+        pop  = sorted(new_pop, key=fitness)[:pop_size - 1] + [best]
+        best = min(pop + [best], key=fitness)
+        if log:
+            log(f"[GA] gen {gen+1}/{n_gen}  best = {fitness(best):.2f}")
+
+    return best, fitness(best)
+
+def _lr_station_values(D, d, lam, capacity):
+    """
+    Station subproblems of the Lagrangian: for every candidate j the LP
+    knapsack min Σ_i (D_i d_ij - λ_i) y_ij s.t. Σ_i D_i y_ij ≤ capacity,
+    solved for all columns at once. Returns (v_j, y) with y fractional.
+    """
+    n, K = d.shape
+    pos = D > 0
+    # kWh başına indirgenmiş maliyet; sıfır talepli EV yalnızca λ_i > 0 ise alınır
+    ratio = np.where(pos[:, None], d - (lam / np.where(pos, D, 1.0))[:, None],
+                     np.where(lam > 0, -np.inf, np.inf)[:, None])
+    order = np.argsort(ratio, axis=0)
+    r_s = np.take_along_axis(ratio, order, axis=0)
+    w_s = D[order]
+    neg = r_s < 0
+    cum = np.cumsum(np.where(neg, w_s, 0.0), axis=0)
+    take = np.where(neg & (cum <= capacity), 1.0, 0.0)
+    # sınırdaki kesirli kalem
+    part = neg & (cum > capacity) & (cum - w_s < capacity)
+    take = np.where(part, (capacity - (cum - w_s)) / np.where(w_s > 0, w_s, 1.0), take)
+    y = np.zeros((n, K))
+    np.put_along_axis(y, order, take, axis=0)
+    c = D[:, None] * d - lam[:, None]
+    return (c * y).sum(axis=0), y
+
+def lagrangian_solve(D, d, fixed, capacity, max_st, conflicts,
+                     n_iter=300, progress=None):
+    """
+    Lagrangian relaxation of the capacitated location model: assignment
+    rows Σ_j y_ij = 1 are dualized, station subproblems are LP knapsacks,
+    radius conflicts are dropped from the bound. Multipliers follow
+    Polyak subgradient steps; each relaxed open set is repaired into a
+    feasible one and priced with capacitated_assignment. progress(it, lb,
+    ub) is called every iteration. Returns {'open', 'assign', 'obj',
+    'lower_bound'} (obj is None if no feasible set was found).
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    fixed = np.asarray(fixed, dtype=float)
+    n, K = d.shape
+    nbr = [set() for _ in range(K)]
+    for a, b in conflicts:
+        nbr[a].add(b); nbr[b].add(a)
+
+    priced = {}
+    def price(open_idx):
+        if open_idx not in priced:
+            travel, assign, overflow = capacitated_assignment(D, d[:, open_idx], capacity)
+            cost = fixed[list(open_idx)].sum() + travel if overflow <= 1e-9 else np.inf
+            priced[open_idx] = (cost, [open_idx[k] for k in assign])
+        return priced[open_idx]
+
+    def repair(score):
+        """Open by ascending score, respecting radius, max_st and total capacity."""
+        chosen = []
+        for j in np.argsort(score, kind="stable").tolist():
+            if len(chosen) >= max_st:
+                break
+            if nbr[j] & set(chosen):
+                continue
+            if score[j] < 0 or len(chosen) * capacity < D.sum():
+                chosen.append(j)
+        return tuple(sorted(chosen))
+
+    lam = D * d.min(axis=1)                 # başlangıç: en yakın istasyon maliyeti
+    lb, ub, best = -np.inf, np.inf, None
+    theta, stall = 2.0, 0
+
+    for it in range(1, n_iter + 1):
+        v, y = _lr_station_values(D, d, lam, capacity)
+        g_val = fixed + v
+        idx = np.argsort(g_val, kind="stable")[:max_st]
+        idx = idx[g_val[idx] < 0]
+        L = lam.sum() + g_val[idx].sum()
+        if L > lb + 1e-9:
+            lb, stall = L, 0
+        else:
+            stall += 1
+            if stall >= 20:
+                theta, stall = theta / 2, 0
+
+        cost, assign = price(repair(g_val))
+        if cost < ub:
+            ub, best = cost, (repair(g_val), assign)
+
+        if progress:
+            progress(it, lb, ub)
+        if np.isfinite(ub) and ub - lb <= 1e-4 * max(abs(ub), 1.0) or theta < 1e-4:
+            break
+
+        # alt-gradyan: 1 - Σ_j x_j y_ij
+        grad = 1.0 - y[:, idx].sum(axis=1)
+        norm = float(grad @ grad)
+        if norm < 1e-12:
+            break
+        target = ub if np.isfinite(ub) else lb + abs(lb) * 0.1 + 1.0
+        lam = lam + theta * (target - L) / norm * grad
+
+    if best is None:
+        return {"open": [], "assign": [], "obj": None, "lower_bound": lb}
+    return {"open": list(best[0]), "assign": best[1], "obj": ub, "lower_bound": lb}
+
+# ----------------------------------------------------------------------
+#  Benders ayrıştırması (ana problem: x; alt problemler: ulaştırma LP'si)
+# ----------------------------------------------------------------------
+_BENDERS_SHARED = {}
+
+def _benders_init(shared):
+    """Pool initializer: keeps D, d and capacity per worker."""
+    _BENDERS_SHARED.clear()
+    _BENDERS_SHARED.update(shared)
+
+def _transport_duals(d, flow, cap):
+    """
+    Per-kWh capacity prices β of an optimal transportation flow: β is zero
+    at stations with spare capacity and, at full ones, the shortest
+    re-routing cost to a station that still has room (condensed graph
+    a → b weighted by min_i d_ib - d_ia over EVs served by a).
+    """
+    n, K = d.shape
+    w = np.full((K, K), np.inf)
+    for a in range(K):
+        rows = flow[:, a] > 1e-9
+        if rows.any():
+            w[a] = (d[rows] - d[rows, a][:, None]).min(axis=0)
+        w[a, a] = np.inf
+    full = flow.sum(axis=0) >= np.asarray(cap, dtype=float) - 1e-7
+
+    def relax(beta, mask):
+        for _ in range(K):
+            new = np.minimum(beta, (w + beta[None, :]).min(axis=1))
+            new[~mask] = beta[~mask]
+            if np.allclose(new, beta, equal_nan=True):
+                break
+            beta = new
+        return beta
+
+    beta = relax(np.where(full, np.inf, 0.0), full)
+    lost = ~np.isfinite(beta)
+    if lost.any():
+        # serbest kapasiteye ulaşamayan (tamamen dolu) bileşen: kendi içinde
+        # potansiyel, sonra gelen kenarları bozmayacak kadar yukarı kaydır
+        beta[lost] = 0.0
+        beta = relax(beta, lost)
+        shift = -beta[lost].min()
+        into = (beta[~lost][:, None] - w[np.ix_(~lost, lost)] - beta[lost][None, :])
+        if into.size:
+            shift = max(shift, float(np.max(into, initial=-np.inf)))
+        beta[lost] += max(shift, 0.0)
+    return np.maximum(beta, 0.0)
+
+def _benders_cut(open_idx):
+    """
+    Transportation subproblem for one open set. Returns (open_idx, travel,
+    unserved, u_sum, coef): the optimality cut θ ≥ u_sum - Σ_j coef_j x_j
+    over all candidates, with coef_j = cap β_j + Σ_i v_ij.
+    """
+    sh = _BENDERS_SHARED
+    D, d, cap = sh["D"], sh["d"], sh["capacity"]
+    S = list(open_idx)
+    flow, unserved = _transport_flow(D, d[:, S], [cap] * len(S))
+    travel = float((flow * d[:, S]).sum())
+    beta = np.zeros(d.shape[1])
+    beta[S] = _transport_duals(d[:, S], flow, [cap] * len(S))
+    # u_i = min_{j açık} D_i (d_ij + β_j)
+    u = (D[:, None] * (d[:, S] + beta[S][None, :])).min(axis=1)
+
+    # Kapalı j için β_j serbesttir: cap β_j + Σ_i max(0, u_i - D_i (d_ij + β_j))
+    # katsayısını küçülten değer, j'yi tercih eden talebin cap'e eşit olduğu fiyat.
+    closed = np.setdiff1d(np.arange(d.shape[1]), S)
+    if len(closed):
+        pos = D > 0
+        save = np.where(pos[:, None], u[:, None] / np.where(pos, D, 1.0)[:, None]
+                        - d[:, closed], -np.inf)
+        order = np.argsort(-save, axis=0)
+        s_sorted = np.take_along_axis(save, order, axis=0)
+        cum = np.cumsum(np.where(s_sorted > 0, D[order], 0.0), axis=0)
+        k = np.minimum((cum < cap).sum(axis=0), len(D) - 1)
+        beta[closed] = np.clip(s_sorted[k, np.arange(len(closed))], 0.0, None)
+    v = np.clip(u[:, None] - D[:, None] * (d + beta[None, :]), 0.0, None).sum(axis=0)
+    return tuple(S), travel, unserved, float(u.sum()), cap * beta + v
+
+def benders_solve(D, d, fixed, capacity, max_st, conflicts, backend="CPLEX",
+                  max_iter=100, neighbours=None, workers=None, tol=1e-6, progress=None):
+    """
+    Benders decomposition of the capacitated location model. The master
+    keeps only x and θ and is re-solved on `backend`; for each master
+    solution and up to `neighbours` one-flip variants (default: one per
+    spare worker) the splittable
+    transportation subproblem is solved in a process pool and returns an
+    optimality cut. Capacity cover Σ_j cap x_j ≥ ΣD is the only
+    feasibility cut this subproblem can produce and is in the master from
+    the start. progress(it, lb, ub) is called every iteration. The best
+    open set is rounded to single-station assignments with
+    capacitated_assignment (exact restricted MIP if that overflows); the
+    reported gap compares that integral cost with the bound. Returns
+    {'open', 'assign', 'obj', 'lower_bound', 'gap', 'iterations'} or None
+    when the master is infeasible or no single-station assignment of the
+    best open set fits the capacity.
+    """
+    D, d = np.asarray(D, dtype=float), _as_km(d)
+    fixed = np.asarray(fixed, dtype=float)
+    n, K = d.shape
+    theta0 = float((D * d.min(axis=1)).sum())
+    need = D.sum()
+    conflicts = [tuple(p) for p in conflicts]
+    nbr = [set() for _ in range(K)]
+    for a, b in conflicts:
+        nbr[a].add(b); nbr[b].add(a)
+
+    def admissible(S):
+        return (0 < len(S) <= max_st and len(S) * capacity >= need - 1e-9
+                and not any(nbr[j] & set(S) for j in S))
+
+    def master():
+        spec = MipSpec("benders_master")
+        x = spec.add_vars("x", (K,), fixed)
+        th = spec.add_vars("theta", (1,), 1.0, lb=theta0, ub=np.inf, integer=False)
+        spec.add_rows("card", np.zeros(K), x, 1.0, [-np.inf], float(max_st))
+        spec.add_rows("cover", np.zeros(K), x, float(capacity), [need], np.inf)
+        if conflicts:
+            pairs = np.asarray(conflicts, dtype=np.int64)
+            spec.add_rows("radius", np.repeat(np.arange(len(pairs)), 2), x[pairs.ravel()],
+                          1.0, np.full(len(pairs), -np.inf), 1.0)
+        if cuts:
+            rhs, coef = zip(*cuts)
+            m = len(cuts)
+            spec.add_rows("opt", np.repeat(np.arange(m), K + 1),
+                          np.tile(np.r_[x, th], m),
+                          np.column_stack([np.asarray(coef), np.ones(m)]).ravel(),
+                          np.asarray(rhs), np.inf)
+        return solve_spec(spec, backend)
+
+    def flips(S):
+        """Close each open station, then open the most promising closed ones."""
+        cur = d[:, list(S)].min(axis=1)
+        gain = (D[:, None] * np.clip(cur[:, None] - d, 0.0, None)).sum(axis=0) - fixed
+        out = [tuple(j for j in S if j != k) for k in S if len(S) > 1]
+        out += [tuple(sorted(S + (k,))) for k in np.argsort(-gain).tolist() if k not in S]
+        return [T for T in out if len(T) * capacity >= need - 1e-9][:neighbours]
+
+    workers = workers or os.cpu_count() or 1
+    if neighbours is None:
+        neighbours = max(workers - 1, 1)
+    cuts, seen = [], {}
+    lb, ub, best = -np.inf, np.inf, None
+    pool = None
+    if workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_benders_init,
+                                   initargs=({"D": D, "d": d, "capacity": capacity},))
+    else:
+        _benders_init({"D": D, "d": d, "capacity": capacity})
+    try:
+        for it in range(1, max_iter + 1):
+            sol = master()
+            if sol is None:
+                return None
+            values, obj = sol
+            lb = max(lb, obj)
+            S = tuple(np.flatnonzero(values[:K] > 0.5).tolist())
+            if S in seen:                   # kesim S'de sıkı → ana problem = gerçek maliyet
+                if progress:
+                    progress(it, lb, ub)
+                break
+
+            batch = [T for T in [S] + flips(S) if T not in seen]
+            results = pool.map(_benders_cut, batch) if pool else map(_benders_cut, batch)
+            for T, travel, unserved, u_sum, coef in results:
+                seen[T] = travel
+                cuts.append((u_sum, coef))
+                if unserved <= 1e-6 and admissible(T):
+                    cost = fixed[list(T)].sum() + travel
+                    if cost < ub:
+                        ub, best = cost, T
+
+            if progress:
+                progress(it, lb, ub)
+            if ub - lb <= tol * max(abs(ub), 1.0):
+                break
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if best is None:
+        return None
+    S = list(best)
+    travel, assign, overflow = capacitated_assignment(D, d[:, S], capacity)
+    obj = float(fixed[S].sum() + travel)
+    if overflow > 1e-9:
+        # yuvarlama kapasiteyi aştı → açık küme üzerinde tam tekil atama
+        full = solve_location_mip(D, d[:, S], fixed[S], capacity, len(S), [],
+                                  backend=backend)
+        if full is None:            # bölünemez talep bu kümeye sığmıyor
+            return None
+        assign, obj = full["assign"], full["obj"]
+    return {
+        "open":   S,
+        "assign": [S[k] for k in assign],
+        "obj":    obj,
+        "lower_bound": lb,
+        "gap":    (obj - lb) / max(abs(obj), 1e-9),
+        "iterations": it,
+    }
+
+# ----------------------------------------------------------------------
+#  Monte Carlo ensemble (süreç havuzu; salt-okunur veri başlatıcıda)
+# ----------------------------------------------------------------------
+_ENSEMBLE_SHARED = {}
+
+def _ensemble_init(shared):
+    """Pool initializer: keeps the read-only scenario data per worker."""
+    _ENSEMBLE_SHARED.clear()
+    _ENSEMBLE_SHARED.update(shared)
+
+def _ensemble_replication(seed):
+    """
+    One replication: sample EVs and vehicles, draw a day of trips,
+    rebuild D_i and solve. Distances are haversine so that replications
+    do not hit the routing service.
+    """
+    sh = _ENSEMBLE_SHARED
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    lat, lon, hc_km = sh["lat"], sh["lon"], sh["hc_km"]
+    n_home = len(lat)
+
+    # 1) EV örneklemesi + araç
+    k = max(1, int(n_home * sh["evr"] / 100))
+    homes = rng.choice(n_home, size=k, replace=False)
+    cons  = sh["consumption"][rng.choice(len(sh["share"]), size=k, p=sh["share"])]
+
+    # 2) Günlük yolculuklar (her yolculuk bir öncekinin varışından başlar)
+    n_trips = rng.integers(TRIP_PER_EV_RANGE[0], TRIP_PER_EV_RANGE[1] + 1, size=k)
+    D = np.zeros(k)
+    origin = homes.copy()
+    for t in range(int(n_trips.max())):
+        active = n_trips > t
+        dest = rng.integers(0, n_home, size=k)
+        km = haversine_np(lat[origin], lon[origin], lat[dest], lon[dest])
+        D += np.where(active, km * cons, 0.0)
+        origin = np.where(active, dest, origin)
+    D = np.round(D, 2)
+
+    # 3) Çözüm
+    d = hc_km[homes]
+    if sh["method"] == "Docplex MIP":
+        res = solve_location_mip(D, d, sh["fixed"], sh["capacity"], sh["max_st"],
+                                 sh["conflicts"], backend=sh["backend"])
+        if res is None:
+            return {"seed": seed, "demand": float(D.sum()), "open": None, "obj": None}
+        open_idx, obj = res["open"], res["obj"]
+    elif sh["method"] == "Lagrangian Relaxation":
+        res = lagrangian_solve(D, d, sh["fixed"], sh["capacity"], sh["max_st"], sh["conflicts"])
+        if res["obj"] is None:
+            return {"seed": seed, "demand": float(D.sum()), "open": None, "obj": None}
+        open_idx, obj = res["open"], res["obj"]
+    elif sh["method"] == "Benders Decomposition":
+        # replikasyonlar zaten paralel: alt problemler bu süreçte çözülür
+        res = benders_solve(D, d, sh["fixed"], sh["capacity"], sh["max_st"], sh["conflicts"],
+                            backend=sh["backend"], workers=1)
+        if res is None:
+            return {"seed": seed, "demand": float(D.sum()), "open": None, "obj": None}
+        open_idx, obj = res["open"], res["obj"]
+    else:
+        best, obj = ga_search(D, d, sh["fixed"], sh["st_pair"], sh["max_st"],
+                              sh["radius"], sh["capacity"], log=None)
+        open_idx = [j for j, v in enumerate(best) if v]
+    return {"seed": seed, "demand": float(D.sum()), "open": open_idx, "obj": float(obj)}
+
+def run_ensemble(shared, seeds, workers=None):
+    """Yields replication results from a process pool as they finish."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_ensemble_init,
+                             initargs=(shared,)) as pool:
+        futures = [pool.submit(_ensemble_replication, s) for s in seeds]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+# ----------------------------------------------------------------------
+#  Harita işaretçi katmanı (varlık kimliğine göre; yalnızca farklar çizilir)
+# ----------------------------------------------------------------------
+class MarkerLayer:
+    """
+    Map markers keyed by entity id. Each key remembers the style it was
+    drawn with, (lat, lon, text, color); put/sync only touch markers whose
+    style changed: a new colour is applied to the existing circle item,
+    a new text through set_text, and only a moved or new key creates a
+    marker.
+    """
+
+    def __init__(self, map_widget):
+        self.map = map_widget
+        self.markers = {}         # anahtar → CanvasPositionMarker
+        self.style = {}           # anahtar → (lat, lon, text, color)
+
+    def put(self, key, lat, lon, text, color, command=None):
+        """Creates or updates one marker; returns True if anything was redrawn."""
+        new = (lat, lon, text, color)
+        old = self.style.get(key)
+        if old == new:
+            return False
+        m = self.markers.get(key)
+        if m is None or old[:2] != new[:2]:
+            if m is not None:
+                m.delete()
+            m = self.map.set_marker(lat, lon, text=text, marker_color_circle=color,
+                                    marker_color_outside="white", command=command)
+        else:
+            if old[3] != color:
+                m.marker_color_circle = color
+                if m.big_circle is not None:
+                    self.map.canvas.itemconfig(m.big_circle, fill=color)
+            if old[2] != text:
+                m.set_text(text)
+        self.markers[key], self.style[key] = m, new
+        return True
+
+    def sync(self, items, command=None):
+        """
+        items: {key: (lat, lon, text, color)}; keys missing from items are
+        removed. command(key) builds the click callback for every marker
+        that is (re)created. Returns the number of markers created, changed
+        or removed.
+        """
+        gone = self.markers.keys() - items.keys()
+        for key in gone:
+            self.remove(key)
+        changed = len(gone)
+        for key, (lat, lon, text, color) in items.items():
+            old = self.style.get(key)
+            recreate = old is None or old[:2] != (lat, lon)    # put yeni marker açar
+            cb = command(key) if command and recreate else None
+            changed += self.put(key, lat, lon, text, color, cb)
+        return changed
+
+    def remove(self, key):
+        m = self.markers.pop(key, None)
+        self.style.pop(key, None)
+        if m is not None:
+            m.delete()
+
+    def clear(self):
+        for key in list(self.markers):
+            self.remove(key)
+
+class HomeMarkerRenderer:
+    """
+    Viewport-culled, zoom-clustered home markers on top of a MarkerLayer.
+    Homes are indexed by latitude (sorted array + searchsorted), so a
+    refresh only looks at points inside the visible tile range. Below
+    `cluster_zoom`, or when more than `max_markers` homes are visible,
+    they are drawn as grid clusters of about `cell_px` pixels with their
+    counts; clicking a cluster zooms into it.
+    """
+
+    def __init__(self, map_widget, home_command=None, max_markers=HOME_MARKER_LIMIT,
+                 cluster_zoom=HOME_CLUSTER_ZOOM, cell_px=CLUSTER_CELL_PX):
+        self.map = map_widget
+        self.layer = MarkerLayer(map_widget)
+        self.home_command = home_command
+        self.max_markers, self.cluster_zoom, self.cell_px = max_markers, cluster_zoom, cell_px
+        self.set_points([], [], [])
+
+    def set_points(self, ids, lat, lon):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(np.asarray(lat, dtype=float), kind="stable")
+        self.order = order
+        self.lat_sorted = np.asarray(lat, dtype=float)[order]
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.selected = np.zeros(len(self.ids), dtype=bool)
+        self._view = None
+
+    def set_selected(self, ids):
+        self.selected = np.isin(self.ids, np.fromiter(ids, dtype=np.int64))
+        self._view = None
+
+    def clear(self):
+        self.layer.clear()
+        self._view = None
+
+    def _visible(self, pad=0.1):
+        """Indices of homes inside the current (padded) viewport, and the zoom."""
+        z = int(round(self.map.zoom))
+        (x0, y0), (x1, y1) = self.map.upper_left_tile_pos, self.map.lower_right_tile_pos
+        px, py = (x1 - x0) * pad, (y1 - y0) * pad
+        lat_top, lon_left = osm_to_decimal(x0 - px, y0 - py, self.map.zoom)
+        lat_bot, lon_right = osm_to_decimal(x1 + px, y1 + py, self.map.zoom)
+        lo, hi = np.searchsorted(self.lat_sorted, [lat_bot, lat_top])
+        idx = self.order[lo:hi]
+        return idx[(self.lon[idx] >= lon_left) & (self.lon[idx] <= lon_right)], z
+
+    def refresh(self, force=False):
+        """Redraws if the view moved (or force); returns the number of markers touched."""
+        if not hasattr(self.map, "upper_left_tile_pos"):
+            return 0
+        view = (tuple(np.round(self.map.upper_left_tile_pos, 2)),
+                tuple(np.round(self.map.lower_right_tile_pos, 2)), self.map.zoom)
+        if not force and view == self._view:
+            return 0
+        self._view = view
+        idx, z = self._visible()
+
+        items, commands = {}, {}
+        if z >= self.cluster_zoom and len(idx) <= self.max_markers:
+            for i in idx.tolist():
+                hid = int(self.ids[i])
+                items[("H", hid)] = (self.lat[i], self.lon[i], str(hid),
+                                     SELECTED_HOME_COLOR if self.selected[i] else HOME_MARKER_COLOR)
+        elif len(idx):
+            # Web Mercator karo koordinatlarında ~cell_px piksellik ızgara
+            n = 2.0 ** z
+            tx = (self.lon[idx] + 180.0) / 360.0 * n
+            ty = (1.0 - np.arcsinh(np.tan(np.radians(self.lat[idx]))) / math.pi) / 2.0 * n
+            cell = self.cell_px / 256.0
+            keys = np.stack([np.floor(tx / cell), np.floor(ty / cell)], axis=1).astype(np.int64)
+            uniq, inv, cnt = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+            inv = inv.ravel()
+            c_lat = np.bincount(inv, weights=self.lat[idx]) / cnt
+            c_lon = np.bincount(inv, weights=self.lon[idx]) / cnt
+            c_sel = np.bincount(inv, weights=self.selected[idx].astype(float)) > 0
+            for k, (cx, cy) in enumerate(uniq.tolist()):
+                key = ("C", z, cx, cy)
+                if cnt[k] == 1:
+                    i = int(idx[inv == k][0])
+                    hid = int(self.ids[i])
+                    key = ("H", hid)
+                    items[key] = (self.lat[i], self.lon[i], str(hid),
+                                  SELECTED_HOME_COLOR if self.selected[i] else HOME_MARKER_COLOR)
+                else:
+                    items[key] = (float(c_lat[k]), float(c_lon[k]), f"{int(cnt[k])} homes",
+                                  SELECTED_HOME_COLOR if c_sel[k] else HOME_MARKER_COLOR)
+                    commands[key] = (float(c_lat[k]), float(c_lon[k]), z)
+        return self.layer.sync(items, command=lambda key: self._command(key, commands))
+
+    def _command(self, key, commands):
+        if key[0] == "H":
+            return self.home_command(key[1]) if self.home_command else None
+        lat, lon, z = commands[key]
+
+        def zoom_in(marker=None):
+            self.map.set_position(lat, lon)
+            self.map.set_zoom(min(z + 2, 19))
+        return zoom_in
+
+# ----------------------------------------------------------------------
+#  Ev noktası yükleyici (akışla okuma → önceden ayrılmış float64 diziler)
+# ----------------------------------------------------------------------
+_JSON_SEP = re.compile(r"[\s,]*")
+
+def iter_json_array(f, chunk_size=1 << 20):
+    """
+    Yields the elements of the JSON array starting at f's position, one
+    raw_decode at a time over a sliding text buffer, so the whole array
+    is never held in memory. Elements are expected to be objects.
+    """
+    dec = json.JSONDecoder()
+    buf, pos, started = "", 0, False
+    while True:
+        chunk = f.read(chunk_size)
+        buf, pos = buf[pos:] + chunk, 0
+        while True:
+            pos = _JSON_SEP.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                pos, started = pos + 1, True
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break                       # eleman parçanın sonunda bölündü
+            yield obj
+        if not chunk:
+            return
+
+def _iter_json_points(f):
+    for pt in iter_json_array(f):
+        yield pt['lat'], pt['lon']
+
+# Point geometrisi: "coordinates": [lon, lat ...]; Polygon/LineString '[[' ile başlar
+_GEOJSON_POINT = re.compile(
+    r'"coordinates"\s*:\s*\[\s*([-+\d.eE]+)\s*,\s*([-+\d.eE]+)(?=\s*[,\]])')
+
+def _iter_geojson_points(f, chunk_size=1 << 20):
+    """
+    Point features of a GeoJSON FeatureCollection, streamed: a regex scan
+    over each text chunk picks the coordinate pairs without building the
+    feature dicts. Unmatched text at the end of a chunk is carried over.
+    """
+    tail = ""
+    while True:
+        chunk = f.read(chunk_size)
+        buf, end = tail + chunk, 0
+        for m in _GEOJSON_POINT.finditer(buf):
+            yield m.group(2), m.group(1)
+            end = m.end()
+        if not chunk:
+            return
+        tail = buf[max(end, len(buf) - 256):]
+
+def _iter_csv_points(f):
+    reader = csv.reader(f)
+    header = next(reader)
+    i_lat, i_lon = header.index('lat'), header.index('lon')
+    for row in reader:
+        if row:
+            yield row[i_lat], row[i_lon]
+
+def _wkb_points(arr):
+    """(lon, lat) from a binary array of 2D WKB points, read straight from its data buffer."""
+    _, offsets, data = arr.buffers()
+    width = np.int64 if pa.types.is_large_binary(arr.type) else np.int32
+    offsets = np.frombuffer(offsets, dtype=width)[arr.offset:arr.offset + len(arr) + 1]
+    data = np.frombuffer(data, dtype=np.uint8)
+    start = offsets[:-1]
+    if arr.null_count or not np.all(np.diff(offsets) == 21):
+        raise ValueError("geometry column must hold 2D points only")
+    kind = data[start[:, None] + np.arange(1, 5)]
+    little = data[start] == 1
+    if not (np.all(little) or not np.any(little)):
+        raise ValueError("mixed WKB byte orders")
+    code = kind.copy().view("<u4" if little.all() else ">u4").ravel()
+    if not np.all(code == 1):
+        raise ValueError("geometry column must hold 2D points only")
+    xy = data[start[:, None] + np.arange(5, 21)].copy().view("<f8" if little.all() else ">f8")
+    return xy[:, 0], xy[:, 1]
+
+def load_arrow_points(path):
+    """
+    (lat, lon) from a GeoParquet or Arrow/Feather file, memory-mapped. Plain
+    lat/lon columns are used when present, otherwise the (primary) geometry
+    column as WKB points or GeoArrow x/y structs.
+    """
+    if pa is None:
+        raise ImportError("reading Parquet/Arrow files needs pyarrow")
+    if path.lower().endswith((".parquet", ".geoparquet")):
+        table = pq.read_table(path, memory_map=True)
+    else:
+        table = pa_feather.read_table(path, memory_map=True)
+    if "lat" in table.column_names and "lon" in table.column_names:
+        return (table.column("lat").to_numpy().astype(float, copy=False),
+                table.column("lon").to_numpy().astype(float, copy=False))
+    geo = json.loads((table.schema.metadata or {}).get(b"geo", b"{}"))
+    col = table.column(geo.get("primary_column", "geometry")).combine_chunks()
+    if pa.types.is_struct(col.type):
+        lon, lat = col.field("x").to_numpy(), col.field("y").to_numpy()
+    else:
+        lon, lat = _wkb_points(col)
+    return lat.astype(float, copy=False), lon.astype(float, copy=False)
+
+def load_points(path, progress=None, chunk=HOME_CHUNK):
+    """
+    Streams (lat, lon) points from a JSON array, GeoJSON FeatureCollection
+    or CSV file into float64 arrays; Parquet/Arrow files are read column-
+    wise by load_arrow_points. Capacity is preallocated from the file size
+    and doubled when exceeded. After every `chunk` points progress(lat,
+    lon, fraction) gets views of what has been read so far. Returns (lat, lon).
+    """
+    if path.lower().endswith((".parquet", ".geoparquet", ".arrow", ".feather")):
+        lat, lon = load_arrow_points(path)
+        if progress:
+            progress(lat, lon, 1.0)
+        return lat, lon
+    total = max(os.path.getsize(path), 1)
+    with open(path, "rb") as raw:
+        geojson = raw.peek(256).lstrip()[:1] == b"{"      # FeatureCollection nesnesi
+        f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        if path.lower().endswith(".csv"):
+            points = _iter_csv_points(f)
+        else:
+            points = _iter_geojson_points(f) if geojson else _iter_json_points(f)
+        cap = max(chunk, total // 40)           # ~40 bayt/nokta tahmini
+        lat, lon = np.empty(cap), np.empty(cap)
+        n = 0
+        for batch in iter(lambda: list(itertools.islice(points, chunk)), []):
+            arr = np.asarray(batch, dtype=float)
+            if n + len(arr) > cap:
+                cap = max(2 * cap, n + len(arr))
+                lat, lon = np.resize(lat, cap), np.resize(lon, cap)
+            lat[n:n + len(arr)], lon[n:n + len(arr)] = arr[:, 0], arr[:, 1]
+            n += len(arr)
+            if progress:
+                progress(lat[:n], lon[:n], min(raw.tell() / total, 1.0))
+    return lat[:n].copy(), lon[:n].copy()
+
+# ----------------------------------------------------------------------
+#  İkili senaryo dosyası (tipli diziler; açılışta bellek eşlemeli)
+# ----------------------------------------------------------------------
+def write_scenario(path, arrays, meta):
+    """
+    Writes {name: ndarray} and a JSON-able meta dict to one file:
+    magic, u64 header length, JSON header (meta + dtype/shape/offset per
+    array), then the raw C-ordered arrays, each at a SCENARIO_ALIGN
+    boundary so they can be memory-mapped in place.
+    """
+    arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+    table, offset = {}, 0
+    for name, a in arrays.items():
+        table[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset += -(-a.nbytes // SCENARIO_ALIGN) * SCENARIO_ALIGN
+    header = json.dumps({"meta": meta, "arrays": table}).encode("utf-8")
+    base = -(-(len(SCENARIO_MAGIC) + 8 + len(header)) // SCENARIO_ALIGN) * SCENARIO_ALIGN
+    with open(path, "wb") as f:
+        f.write(SCENARIO_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, a in arrays.items():
+            f.seek(base + table[name]["offset"])
+            a.tofile(f)
+        f.truncate(base + offset)
+
+class ScenarioFile:
+    """
+    Read side of write_scenario. Only the header is parsed on open;
+    scenario[name] returns a read-only np.memmap, so large arrays such as
+    the distance matrix are paged in by the OS only where they are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(SCENARIO_MAGIC)) != SCENARIO_MAGIC:
+                raise ValueError(f"{os.path.basename(path)} is not a scenario file")
+            n = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(n).decode("utf-8"))
+        self.meta, self.table = header["meta"], header["arrays"]
+        self.base = -(-(len(SCENARIO_MAGIC) + 8 + n) // SCENARIO_ALIGN) * SCENARIO_ALIGN
+
+    def __contains__(self, name):
+        return name in self.table
+
+    def __getitem__(self, name):
+        e = self.table[name]
+        shape, dtype = tuple(e["shape"]), np.dtype(e["dtype"])
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=self.base + e["offset"],
+                         shape=shape)
+
+# ----------------------------------------------------------------------
+#  EV × aday mesafe deposu (diskte float32 memmap; süreçler arası paylaşılır)
+# ----------------------------------------------------------------------
+class _FileLock:
+    """Exclusive inter-process lock on a side file (fcntl.flock / msvcrt.locking)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:     # LK_LOCK ~10 s denedikten sonra vazgeçer
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        self.f.close()
+        self.f = None
+
+class DistanceStore:
+    """
+    Road distances from a fixed set of EV homes to any number of
+    candidates, in <directory>/<key>.f32 with key = hash(EV coordinates,
+    routing source). The file is candidate-major: one float32 row of
+    n_ev km per candidate slot, so adding a candidate appends a row. A
+    JSON sidecar maps candidate coordinates to slots and records how many
+    EV rows of each slot are filled; rows are computed DIST_TILE_ROWS at a
+    time, so an interrupted fill resumes where it stopped, in this or
+    another process. The sidecar is re-read and written under a file lock
+    whenever slots are assigned or fill counts advance, so processes on
+    the same EV sample share one slot table. A tile whose request fails
+    is filled with haversine km for this session only and is requested
+    again by the next store.
+    """
+
+    def __init__(self, lat, lon, directory=DIST_DIR, source=DIST_SOURCE):
+        self.lat = np.ascontiguousarray(lat, dtype=float)
+        self.lon = np.ascontiguousarray(lon, dtype=float)
+        self.n = len(self.lat)
+        self.key = self.key_for(self.lat, self.lon, source)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{self.key}.f32")
+        self.index_path = os.path.join(directory, f"{self.key}.json")
+        self.lock_path = os.path.join(directory, f"{self.key}.lock")
+        self.index = self._load_index()
+        self.mm = None
+        self.fallback = {}        # slot → bu oturumda yazılmış (dosyada dolu sayılmayan) satır
+
+    @staticmethod
+    def key_for(lat, lon, source=DIST_SOURCE):
+        lat = np.ascontiguousarray(lat, dtype=float)
+        lon = np.ascontiguousarray(lon, dtype=float)
+        return hashlib.sha1(lat.tobytes() + lon.tobytes() + source.encode()).hexdigest()[:20]
+
+    @staticmethod
+    def _ckey(lat, lon):
+        return f"{lat:.6f},{lon:.6f}"
+
+    def _map(self, n_slots):
+        """(Re)maps the file with room for n_slots candidate rows (caller holds the lock)."""
+        if self.n == 0 or n_slots == 0:
+            return
+        size = n_slots * self.n * 4
+        if self.mm is not None:         # Windows: eşlenmiş dosya yeniden boyutlandırılamaz
+            self.mm.flush()
+            self.mm = None
+        with open(self.path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.mm = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(n_slots, self.n))
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"n_ev": self.n, "slots": {}, "filled": []}
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def _slots(self, cands):
+        """Slots of the (lat, lon) candidates; new ones are appended under the lock."""
+        keys = [self._ckey(a, b) for a, b in cands]
+        new = any(k not in self.index["slots"] for k in keys)
+        stale = self.mm is None or self.mm.shape[0] < len(self.index["filled"])
+        if new or (self.n and stale):
+            with _FileLock(self.lock_path):
+                self.index = self._load_index()       # başka süreçlerin eklediği slotlar
+                slots, filled = self.index["slots"], self.index["filled"]
+                if new:
+                    for k in keys:
+                        if k not in slots:
+                            slots[k] = len(filled)
+                            filled.append(0)
+                    self._save_index()
+                self._map(len(filled))                # dosya yalnızca kilit altında büyür
+        return [self.index["slots"][k] for k in keys]
+
+    def _mark_filled(self, j, n_filled):
+        """Advances slot j's fill count in the shared sidecar."""
+        with _FileLock(self.lock_path):
+            self.index = self._load_index()
+            self.index["filled"][j] = max(self.index["filled"][j], n_filled)
+            self._save_index()
+
+    def columns(self, cands, tile_fn=road_distance_tile, tile=DIST_TILE_ROWS):
+        """Slots of the (lat, lon) candidates, filling any missing rows tile by tile."""
+        slots = self._slots(cands)
+        if self.n == 0:
+            return slots
+        for (c_lat, c_lon), j in zip(cands, slots):
+            done = self.index["filled"][j]
+            start = max(done, self.fallback.get(j, 0))
+            if start >= self.n:
+                continue
+            for i0 in range(start, self.n, tile):
+                i1 = min(i0 + tile, self.n)
+                km = tile_fn(self.lat[i0:i1], self.lon[i0:i1], c_lat, c_lon)
+                if km is not None and done == i0:
+                    done = i1
+                else:                   # başarısız istek dolu sayılmaz, sonra yeniden denenir
+                    if km is None:
+                        km = haversine_np(self.lat[i0:i1], self.lon[i0:i1], c_lat, c_lon)
+                    self.fallback[j] = i1
+                self.mm[j, i0:i1] = km
+            self.mm.flush()
+            if done > self.index["filled"][j]:
+                self._mark_filled(j, done)
+        return slots
+
+    def has(self, lat, lon):
+        self.index = self._load_index()
+        j = self.index["slots"].get(self._ckey(lat, lon))
+        return j is not None and self.index["filled"][j] >= self.n
+
+    def put(self, lat, lon, km):
+        """Stores an already known distance row (e.g. from a saved scenario)."""
+        j, = self._slots([(lat, lon)])
+        if self.n == 0:
+            return
+        self.mm[j] = km
+        self.mm.flush()
+        self.fallback.pop(j, None)
+        self._mark_filled(j, self.n)
+
+    def rows(self, slots):
+        """Candidate-major float32 rows (len(slots) × n_ev) read from the map."""
+        if self.mm is None or not slots:
+            return np.zeros((len(slots), self.n), dtype=np.float32)
+        return np.asarray(self.mm[slots])
+
+    def matrix(self, slots):
+        """EV × candidate km matrix for the given slots: a float32 transposed
+        view of the rows read, with no further copy (solvers accept float32)."""
+        return self.rows(slots).T
+
+# ----------------------------------------------------------------------
+#  Yerel karo deposu (MBTiles/SQLite, LRU) ve ondan okuyan harita
+# ----------------------------------------------------------------------
+class MBTilesStore:
+    """
+    Raster tiles in an MBTiles file (tiles/metadata tables, TMS row order),
+    plus a tile_lru side table with the last access time and size of each
+    tile. When the stored bytes exceed max_bytes the least recently used
+    tiles are dropped down to 90 % of the limit. One connection is shared
+    by the map's loader threads behind a lock.
+    """
+
+    def __init__(self, path, max_bytes=TILE_CACHE_MAX_MB * 2**20, name="osm"):
+        self.path, self.max_bytes = path, max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER,
+                                              tile_row INTEGER, tile_data BLOB);
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                ON tiles (zoom_level, tile_column, tile_row);
+            CREATE TABLE IF NOT EXISTS tile_lru (zoom_level INTEGER, tile_column INTEGER,
+                                                 tile_row INTEGER, last_used REAL, size INTEGER,
+                                                 PRIMARY KEY (zoom_level, tile_column, tile_row));
+            CREATE INDEX IF NOT EXISTS lru_index ON tile_lru (last_used);
+        """)
+        if self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0] == 0:
+            self.db.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                [("name", name), ("format", "png"), ("type", "baselayer")])
+        self.n_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM tile_lru").fetchone()[0]
+
+    @staticmethod
+    def _key(z, x, y):
+        return z, x, (1 << z) - 1 - y          # XYZ → TMS satırı
+
+    def get(self, z, x, y):
+        """Tile bytes or None; a hit refreshes the tile's LRU time."""
+        key = self._key(z, x, y)
+        with self.lock:
+            row = self.db.execute("SELECT tile_data FROM tiles WHERE zoom_level=? "
+                                  "AND tile_column=? AND tile_row=?", key).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE tile_lru SET last_used=? WHERE zoom_level=? "
+                                "AND tile_column=? AND tile_row=?", (time.time(), *key))
+        return None if row is None else row[0]
+
+    def has(self, z, x, y):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? "
+                                   "AND tile_row=?", self._key(z, x, y)).fetchone() is not None
+
+    def put(self, z, x, y, data):
+        key = self._key(z, x, y)
+        with self.lock:
+            old = self.db.execute("SELECT size FROM tile_lru WHERE zoom_level=? AND tile_column=? "
+                                  "AND tile_row=?", key).fetchone()
+            self.db.execute("BEGIN")
+            self.db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (*key, data))
+            self.db.execute("INSERT OR REPLACE INTO tile_lru VALUES (?, ?, ?, ?, ?)",
+                            (*key, time.time(), len(data)))
+            self.db.execute("COMMIT")
+            self.n_bytes += len(data) - (old[0] if old else 0)
+            if self.n_bytes > self.max_bytes:
+                self._evict(int(0.9 * self.max_bytes))
+
+    def _evict(self, target):
+        """Drops least recently used tiles until at most target bytes remain (lock held)."""
+        self.db.execute("BEGIN")
+        for z, col, row, size in self.db.execute(
+                "SELECT zoom_level, tile_column, tile_row, size FROM tile_lru "
+                "ORDER BY last_used").fetchall():
+            if self.n_bytes <= target:
+                break
+            self.db.execute("DELETE FROM tiles WHERE zoom_level=? AND tile_column=? "
+                            "AND tile_row=?", (z, col, row))
+            self.db.execute("DELETE FROM tile_lru WHERE zoom_level=? AND tile_column=? "
+                            "AND tile_row=?", (z, col, row))
+            self.n_bytes -= size
+        self.db.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def fetch_tile(server, z, x, y, timeout=10):
+    """Downloads one tile; returns its bytes, or None if the server has none."""
+    url = server.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+    resp = requests.get(url, timeout=timeout,
+                        headers={"User-Agent": "EVChargingStationPlanner/1.0"})
+    return resp.content if resp.status_code == 200 else None
+
+def tile_range(lat_min, lat_max, lon_min, lon_max, zooms):
+    """(z, x, y) of every tile covering the bounding box at the given zooms."""
+    for z in zooms:
+        x0, y0 = decimal_to_osm(lat_max, lon_min, z)
+        x1, y1 = decimal_to_osm(lat_min, lon_max, z)
+        for x in range(int(x0), int(x1) + 1):
+            for y in range(int(y0), int(y1) + 1):
+                yield z, x, y
+
+def prefetch_tiles(store, server, tiles, progress=None, rate=PREFETCH_RATE):
+    """
+    Downloads the missing tiles into store, at most `rate` requests per
+    second; returns (fetched, skipped, failed).
+    """
+    fetched = skipped = failed = 0
+    next_t = time.monotonic()
+    for n, (z, x, y) in enumerate(tiles, start=1):
+        if store.has(z, x, y):
+            skipped += 1
+        else:
+            wait = next_t - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_t = max(next_t, time.monotonic()) + 1.0 / rate
+            try:
+                data = fetch_tile(server, z, x, y)
+            except requests.RequestException:
+                data = None
+            if data is None:
+                failed += 1
+            else:
+                store.put(z, x, y, data)
+                fetched += 1
+        if progress and n % 10 == 0:
+            progress(n, fetched, skipped, failed)
+    return fetched, skipped, failed
+
+class CachedMapView(TkinterMapView):
+    """
+    TkinterMapView that reads tiles through an MBTilesStore. A miss is
+    downloaded and written back unless `offline` is set, in which case
+    the grey empty tile is shown and the tile is asked for again on the
+    next redraw.
+    """
+
+    def __init__(self, *args, tile_store=None, offline=False, **kwargs):
+        self.tile_store, self.offline = tile_store, offline
+        super().__init__(*args, **kwargs)
+
+    def request_image(self, zoom, x, y, db_cursor=None):
+        data = self.tile_store.get(zoom, x, y)
+        if data is None and not self.offline:
+            try:
+                data = fetch_tile(self.tile_server, zoom, x, y)
+            except requests.RequestException:
+                data = None
+            if data is not None:
+                self.tile_store.put(zoom, x, y, data)
+        if data is None:
+            return self.empty_tile_image
+        try:
+            image_tk = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+        except Exception:
+            return self.empty_tile_image
+        self.tile_image_cache[f"{zoom}{x}{y}"] = image_tk
+        return image_tk
+
+# ----------------------------------------------------------------------
+#  Rota geometrisi önbelleği (OD çifti → mesafe + kodlanmış polyline)
+# ----------------------------------------------------------------------
+def decode_polyline(encoded, precision=5):
+    """Google/OSRM encoded polyline → [(lat, lon), ...]."""
+    coords, idx, lat, lon, factor = [], 0, 0, 0, 10.0 ** precision
+    while idx < len(encoded):
+        for axis in (0, 1):
+            shift = result = 0
+            while True:
+                b = ord(encoded[idx]) - 63
+                idx += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+            else:
+                lon += delta
+        coords.append((lat / factor, lon / factor))
+    return coords
+
+def fetch_route(p1, p2, timeout=5):
+    """
+    One OSRM request for a leg: (road km, encoded polyline). Raises on
+    network or routing errors so callers can fall back without caching.
+    """
+    url = (f"{OSRM_ROUTE_URL}{p1[1]},{p1[0]};{p2[1]},{p2[0]}"
+           f"?overview=full&geometries=polyline")
+    route = requests.get(url, timeout=timeout).json()["routes"][0]
+    return route["distance"] / 1000.0, route["geometry"]
+
+class RouteCache:
+    """
+    Persistent OD route cache in SQLite: directed (origin, dest) pairs,
+    keyed on coordinates rounded to 1e-6 degrees, map to the road distance
+    and the encoded polyline from one OSRM call. routes() deduplicates a
+    batch of pairs and fetches only the missing ones concurrently. Failed
+    legs fall back to the straight line and are not stored, so they are
+    retried on the next run.
+    """
+
+    def __init__(self, path, workers=ROUTE_WORKERS):
+        self.workers = workers
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS routes (od TEXT PRIMARY KEY, dist_km REAL, polyline TEXT);
+        """)
+        self.memo = {}            # od → (km, [(lat, lon), ...])
+
+    @staticmethod
+    def _od(p1, p2):
+        return f"{p1[0]:.6f},{p1[1]:.6f};{p2[0]:.6f},{p2[1]:.6f}"
+
+    def _lookup(self, od):
+        hit = self.memo.get(od)
+        if hit is None:
+            with self.lock:
+                row = self.db.execute("SELECT dist_km, polyline FROM routes WHERE od=?",
+                                      (od,)).fetchone()
+            if row is not None:
+                hit = self.memo[od] = (row[0], decode_polyline(row[1]))
+        return hit
+
+    def _fetch(self, od, p1, p2):
+        try:
+            km, enc = fetch_route(p1, p2)
+        except Exception:
+            return haversine(p1[0], p1[1], p2[0], p2[1]), [tuple(p1), tuple(p2)]
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO routes VALUES (?, ?, ?)", (od, km, enc))
+        hit = self.memo[od] = (km, decode_polyline(enc))
+        return hit
+
+    def route(self, p1, p2):
+        """(road km, [(lat, lon), ...]) for one leg."""
+        od = self._od(p1, p2)
+        return self._lookup(od) or self._fetch(od, p1, p2)
+
+    def routes(self, pairs):
+        """{(p1, p2): (km, path)} for the distinct pairs; misses are fetched in parallel."""
+        out, todo = {}, {}
+        for p1, p2 in set(pairs):
+            od = self._od(p1, p2)
+            hit = self._lookup(od)
+            if hit is None:
+                todo[(p1, p2)] = od
+            else:
+                out[(p1, p2)] = hit
+        if todo:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._fetch, od, *pair): pair for pair, od in todo.items()}
+                for fut in as_completed(futures):
+                    out[futures[fut]] = fut.result()
+        return out
+
+# ----------------------------------------------------------------------
+#  Isı haritası (kenar sayımları tek bir raster görüntü olarak çizilir)
+# ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class EdgeCounts:
+    """
+    Undirected road-segment usage counts. Path vertices are snapped to a
+    1/grid degree lattice and packed into one int64 per point (lat and
+    lon cell ids in the high and low 32 bits), so the same road from two
+    routes merges exactly; counting is one np.unique over all segments.
+    """
+    seg: np.ndarray               # (m, 4): lat1, lon1, lat2, lon2 (ızgara noktaları)
+    count: np.ndarray             # (m,): segmenti kullanan yolculuk sayısı
+
+    def __len__(self):
+        return len(self.count)
+
+    @staticmethod
+    def pack(lat, lon, grid=EDGE_GRID_PER_DEG):
+        qlat = np.rint((np.asarray(lat) + 90.0) * grid).astype(np.int64)
+        qlon = np.rint((np.asarray(lon) + 180.0) * grid).astype(np.int64)
+        return (qlat << 32) | qlon
+
+    @staticmethod
+    def unpack(key, grid=EDGE_GRID_PER_DEG):
+        return (key >> 32) / grid - 90.0, (key & 0xFFFFFFFF) / grid - 180.0
+
+    @classmethod
+    def build(cls, paths, weights=None, grid=EDGE_GRID_PER_DEG):
+        """
+        paths: [(lat, lon), ...] per route; weights: trips that used each
+        route (default 1), so a repeated OD pair is counted once.
+        """
+        paths = [np.asarray(p, dtype=float).reshape(-1, 2) for p in paths]
+        weights = np.ones(len(paths), dtype=np.int64) if weights is None \
+            else np.asarray(weights, dtype=np.int64)
+        used = [k for k, p in enumerate(paths) if len(p) > 1]
+        if not used:
+            return cls(np.zeros((0, 4)), np.zeros(0, dtype=np.int64))
+        pts = np.concatenate([paths[k] for k in used])
+        lens = np.array([len(paths[k]) for k in used])
+        key = cls.pack(pts[:, 0], pts[:, 1], grid)
+        # ardışık noktalar segment olur; rota sınırlarını atla
+        valid = np.ones(len(key) - 1, dtype=bool)
+        valid[np.cumsum(lens)[:-1] - 1] = False
+        a, b = key[:-1][valid], key[1:][valid]
+        w = np.repeat(weights[used], lens - 1)
+        lo, hi = np.minimum(a, b), np.maximum(a, b)     # yönsüz
+        keep = lo != hi                                 # aynı hücreye düşen segment
+        pairs, inv = np.unique(np.stack([lo[keep], hi[keep]], axis=1), axis=0,
+                               return_inverse=True)
+        count = np.bincount(inv.ravel(), weights=w[keep], minlength=len(pairs)).astype(np.int64)
+        lat1, lon1 = cls.unpack(pairs[:, 0], grid)
+        lat2, lon2 = cls.unpack(pairs[:, 1], grid)
+        return cls(np.column_stack([lat1, lon1, lat2, lon2]), count)
+
+def world_px(lat, lon, z):
+    """Web Mercator world pixel coordinates (256 px tiles) at zoom z."""
+    n = 256.0 * 2.0 ** z
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+def world_latlon(x, y, z):
+    """Inverse of world_px: (lat, lon) of world pixel coordinates at zoom z."""
+    n = 256.0 * 2.0 ** z
+    lon = np.asarray(x) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * np.asarray(y) / n))))
+    return lat, lon
+
+def edge_lod_pyramid(edges, zooms=HEAT_LOD_ZOOMS, tol_px=HEAT_SIMPLIFY_PX):
+    """
+    {zoom: EdgeCounts} for the coarser heat-map zooms, built from the
+    deduplicated segments rather than per route: endpoints are snapped
+    to a tol_px pixel grid at each zoom, segments that collapse to one
+    cell are dropped and those landing on the same cell pair merge,
+    keeping the highest count. Mercator pixels halve with every zoom
+    step, so only the finest level is projected; each coarser level
+    shifts the previous level's unique cells and re-runs np.unique.
+    """
+    zooms = sorted(zooms, reverse=True)
+    if not len(edges) or not zooms:
+        return {z: EdgeCounts(np.zeros((0, 4)), np.zeros(0, dtype=np.int64)) for z in zooms}
+    x, y = world_px(edges.seg[:, [0, 2]], edges.seg[:, [1, 3]], zooms[0])
+    cx = np.floor(x / tol_px).astype(np.int64).ravel()
+    cy = np.floor(y / tol_px).astype(np.int64).ravel()
+    ends = np.arange(len(cx)).reshape(-1, 2)        # segment → uç nokta indeksleri
+    count, prev = edges.count, zooms[0]
+    levels = {}
+    for z in zooms:
+        cx, cy, prev = cx >> (prev - z), cy >> (prev - z), z
+        pts, pid = np.unique((cx << 32) | cy, return_inverse=True)
+        pid = pid.ravel()[ends]
+        a, b = pid.min(axis=1), pid.max(axis=1)
+        keep = a != b                               # tek hücreye düşen segment
+        pair, inv = np.unique(a[keep] * len(pts) + b[keep], return_inverse=True)
+        merged = np.zeros(len(pair), dtype=np.int64)
+        np.maximum.at(merged, inv.ravel(), count[keep])
+        cx, cy = pts >> 32, pts & 0xFFFFFFFF
+        ends, count = np.column_stack([pair // len(pts), pair % len(pts)]), merged
+        # hücre merkezleri → enlem/boylam
+        lat, lon = world_latlon((cx + 0.5) * tol_px, (cy + 0.5) * tol_px, z)
+        levels[z] = EdgeCounts(np.column_stack([lat[ends[:, 0]], lon[ends[:, 0]],
+                                                lat[ends[:, 1]], lon[ends[:, 1]]]), count)
+    return levels
+
+class HeatmapOverlay:
+    """
+    Road-usage heat map drawn as one RGBA image on the map canvas. Edge
+    counts are binned into the HEAT_BANDS colour bands and every segment
+    is rasterized with NumPy (samples every pixel along the segment,
+    written band by band so the hotter band wins, then widened to
+    `width` by a max filter over the image). Below the finest LOD zoom
+    the grid-snapped level for that zoom is drawn instead of the
+    full-resolution edges.
+    One image is cached per zoom level: the whole edge bounding box if it
+    fits in `max_px`, otherwise a padded window around the view that is
+    re-rendered once the view leaves it. The overlay registers itself in
+    the widget's path list, so it follows pans and zooms like a path.
+    """
+
+    def __init__(self, map_widget, width=HEAT_LINE_PX, max_px=HEAT_MAX_PX):
+        self.map = map_widget
+        self.width, self.max_px = width, max_px
+        self.lut = np.zeros((len(HEAT_COLORS) + 1, 4), dtype=np.uint8)
+        for k, c in enumerate(HEAT_COLORS, start=1):
+            self.lut[k] = (int(c[1:3], 16), int(c[3:5], 16), int(c[5:7], 16), 210)
+        self.cache = {}           # zoom → (PhotoImage, x0, y0, x1, y1) dünya pikseli
+        self.item = None
+        self.set_edges(EdgeCounts.build([]))
+        map_widget.canvas_path_list.append(self)
+
+    @staticmethod
+    def _banded(edges):
+        cnt = edges.count
+        band = (np.digitize(cnt / cnt.max(), HEAT_BANDS, right=True)
+                if len(cnt) else np.zeros(0, dtype=np.int64))
+        return edges.seg, band
+
+    def set_edges(self, edges, lod=None):
+        """edges: full-resolution EdgeCounts; lod: {zoom: EdgeCounts} simplified levels."""
+        self.full = self._banded(edges)
+        self.levels = {z: self._banded(e) for z, e in (lod or {}).items()}
+        self.cache.clear()
+        self.draw()
+
+    def _level(self, z):
+        """(seg, band) to draw at zoom z."""
+        if not self.levels or z > max(self.levels):
+            return self.full
+        level = self.levels[max(z, min(self.levels))]
+        return level if len(level[0]) else self.full
+
+    def clear(self):
+        self.set_edges(EdgeCounts.build([]))
+
+    def _render(self, z, seg, band, x0, y0, x1, y1):
+        """RGBA image of the segments inside world-pixel window [x0, x1) × [y0, y1)."""
+        w, h = x1 - x0, y1 - y0
+        ax, ay = world_px(seg[:, 0], seg[:, 1], z)
+        bx, by = world_px(seg[:, 2], seg[:, 3], z)
+        ax, bx, ay, by = ax - x0, bx - x0, ay - y0, by - y0
+        keep = ((np.maximum(ax, bx) >= 0) & (np.minimum(ax, bx) < w) &
+                (np.maximum(ay, by) >= 0) & (np.minimum(ay, by) < h))
+        ax, ay, bx, by, band = ax[keep], ay[keep], bx[keep], by[keep], band[keep] + 1
+        steps = np.ceil(np.hypot(bx - ax, by - ay)).astype(np.int64) + 1
+        owner = np.repeat(np.arange(len(steps)), steps)
+        t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) \
+            / np.maximum(steps - 1, 1)[owner]
+        px = ax[owner] + t * (bx - ax)[owner]
+        py = ay[owner] + t * (by - ay)[owner]
+
+        img = np.zeros((h, w), dtype=np.int8)
+        px, py = np.rint(px).astype(np.int64), np.rint(py).astype(np.int64)
+        band = band[owner].astype(np.int8)
+        inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+        px, py, band = px[inside], py[inside], band[inside]
+        for b in range(1, len(HEAT_COLORS) + 1):     # sıcak bant en son yazılır
+            m = band == b
+            img[py[m], px[m]] = b
+        # kalınlık: width × width pencerede en büyük bant (segment başına değil, görüntü başına)
+        if self.width > 1:
+            lo = (self.width - 1) // 2
+            pad = np.pad(img, ((self.width - 1 - lo, lo), (self.width - 1 - lo, lo)))
+            out = img.copy()
+            for dy in range(self.width):
+                for dx in range(self.width):
+                    np.maximum(out, pad[dy:dy + h, dx:dx + w], out=out)
+            img = out
+        return ImageTk.PhotoImage(Image.fromarray(self.lut[img], "RGBA"))
+
+    def _view(self, z):
+        """Current view in world pixels at zoom z, and canvas pixels per world pixel."""
+        (tx0, ty0), (tx1, ty1) = self.map.upper_left_tile_pos, self.map.lower_right_tile_pos
+        return (tx0 * 256, ty0 * 256, tx1 * 256, ty1 * 256), self.map.width / ((tx1 - tx0) * 256)
+
+    def draw(self, move=False):
+        if not len(self.full[0]) or not hasattr(self.map, "upper_left_tile_pos"):
+            if self.item is not None:
+                self.map.canvas.delete(self.item)
+                self.item = None
+            return
+        z = int(round(self.map.zoom))
+        (vx0, vy0, vx1, vy1), scale = self._view(z)
+        hit = self.cache.get(z)
+        if hit is None or not (hit[1] <= vx0 and hit[2] <= vy0 and vx1 <= hit[3] and vy1 <= hit[4]):
+            seg, band = self._level(z)
+            ax, ay = world_px(seg[:, [0, 2]], seg[:, [1, 3]], z)
+            x0, y0 = int(ax.min()) - self.width, int(ay.min()) - self.width
+            x1, y1 = int(ax.max()) + self.width + 1, int(ay.max()) + self.width + 1
+            if x1 - x0 > self.max_px or y1 - y0 > self.max_px:
+                pw, ph = (vx1 - vx0) / 2, (vy1 - vy0) / 2
+                x0, x1 = max(x0, int(vx0 - pw)), min(x1, int(vx1 + pw) + 1)
+                y0, y1 = max(y0, int(vy0 - ph)), min(y1, int(vy1 + ph) + 1)
+            if x1 <= x0 or y1 <= y0:           # kenarların hiçbiri görünmüyor
+                x0, y0, x1, y1 = int(vx0), int(vy0), int(vx0) + 1, int(vy0) + 1
+            hit = self.cache[z] = (self._render(z, seg, band, x0, y0, x1, y1), x0, y0, x1, y1)
+        photo, x0, y0 = hit[:3]
+        cx, cy = (x0 - vx0) * scale, (y0 - vy0) * scale
+        if self.item is None:
+            self.item = self.map.canvas.create_image(cx, cy, anchor="nw", image=photo, tag="path")
+        else:
+            self.map.canvas.coords(self.item, cx, cy)
+            self.map.canvas.itemconfig(self.item, image=photo)
+
+    def delete(self):
+        self.clear()
+
+# ----------------------------------------------------------------------
+#  Sanal tablo (yalnızca görünen satırlar Treeview'a yazılır)
+# ----------------------------------------------------------------------
+class VirtualTable(tb.Frame):
+    """
+    Treeview over columnar data that only materializes the visible rows.
+    columns: [(name, values, fmt)] with equal-length values; fmt formats
+    one cell (default str). Clicking a heading sorts by a cached argsort
+    of that column (again to reverse); the filter box narrows the view,
+    re-testing only the previous matches while the text keeps growing.
+    """
+
+    def __init__(self, master, columns, height=6, **kw):
+        super().__init__(master, **kw)
+        self.names = [c[0] for c in columns]
+        self.cols  = [np.asarray(c[1]) for c in columns]
+        self.fmts  = [c[2] if len(c) > 2 else str for c in columns]
+        self.n = len(self.cols[0]) if self.cols else 0
+        self.height = height
+
+        bar = tb.Frame(self)
+        bar.pack(fill=X, pady=(0, 2))
+        tb.Label(bar, text="Filter:").pack(side=LEFT)
+        self.filter_var = tk.StringVar(master=self)
+        tb.Entry(bar, textvariable=self.filter_var, width=24).pack(side=LEFT, padx=4)
+        self.count_var = tk.StringVar(master=self)
+        tb.Label(bar, textvariable=self.count_var).pack(side=RIGHT)
+        self.filter_var.trace_add("write", lambda *_: self._on_filter())
+
+        body = tb.Frame(self)
+        body.pack(fill=X, expand=YES)
+        self.tree = ttk.Treeview(body, columns=self.names, show='headings',
+                                 height=height, selectmode="browse")
+        for c in self.names:
+            self.tree.heading(c, text=c, command=lambda c=c: self.sort_by(c))
+            self.tree.column(c, anchor=CENTER)
+        self.sb = ttk.Scrollbar(body, orient="vertical", command=self._on_scroll)
+        self.sb.pack(side=RIGHT, fill=Y)
+        self.tree.pack(side=LEFT, fill=X, expand=YES)
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(seq, self._on_wheel)
+
+        # sabit sayıda satır öğesi; kaydırmada yalnızca değerleri değişir
+        self.items = [self.tree.insert('', 'end') for _ in range(height)]
+        self.shown = height
+        self.offset = 0
+        self._orders = {}               # sütun → argsort
+        self.sort_col, self.desc = None, False
+        self.mask, self._text, self._last_q = None, None, ""
+        self.view = np.arange(self.n)
+        self._render()
+
+    # ---- görünüm -----------------------------------------------------
+    def _rebuild_view(self):
+        order = self._order(self.sort_col) if self.sort_col else np.arange(self.n)
+        if self.desc:
+            order = order[::-1]
+        self.view = order if self.mask is None else order[self.mask[order]]
+        self.offset = 0
+        self._render()
+
+    def _order(self, name):
+        if name not in self._orders:
+            self._orders[name] = np.argsort(self.cols[self.names.index(name)], kind="stable")
+        return self._orders[name]
+
+    def _render(self):
+        total = len(self.view)
+        self.offset = max(0, min(self.offset, total - self.height))
+        rows = self.view[self.offset:self.offset + self.height]
+        for k, iid in enumerate(self.items):
+            if k < len(rows):
+                r = rows[k]
+                self.tree.item(iid, values=[f(c[r]) for f, c in zip(self.fmts, self.cols)])
+                if k >= self.shown:
+                    self.tree.move(iid, '', k)
+            elif k < self.shown:
+                self.tree.detach(iid)
+        self.shown = len(rows)
+        if total:
+            self.sb.set(self.offset / total, (self.offset + len(rows)) / total)
+        else:
+            self.sb.set(0.0, 1.0)
+        self.count_var.set(f"{total} / {self.n} rows")
+
+    def row_of(self, iid):
+        """Data row index of a visible item id."""
+        return int(self.view[self.offset + self.items.index(iid)])
+
+    # ---- olaylar -----------------------------------------------------
+    def sort_by(self, name):
+        self.desc = (not self.desc) if self.sort_col == name else False
+        self.sort_col = name
+        self._rebuild_view()
+
+    def _on_filter(self):
+        q = self.filter_var.get().strip().lower()
+        if not q:
+            self.mask = None
+        else:
+            if self._text is None:
+                self._text = np.array([" ".join(f(c[r]) for f, c in zip(self.fmts, self.cols))
+                                       for r in range(self.n)]).astype(str)
+                self._text = np.char.lower(self._text)
+            if self.mask is not None and self._last_q and q.startswith(self._last_q):
+                idx = np.flatnonzero(self.mask)          # yalnızca önceki eşleşmeler
+            else:
+                idx = np.arange(self.n)
+            self.mask = np.zeros(self.n, dtype=bool)
+            if len(idx):
+                self.mask[idx] = np.char.find(self._text[idx], q) >= 0
+        self._last_q = q
+        self._rebuild_view()
+
+    def _on_scroll(self, *args):
+        total = len(self.view)
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.offset += int(args[1]) * step
+        self._render()
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.offset -= 3
+        else:
+            self.offset += 3
+        self._render()
+        return "break"
+
 class ChargingStationOptimizer:
     def __init__(self):
         # Ana pencere
@@ -131,9 +2927,13 @@ class ChargingStationOptimizer:
         self.root.minsize(1000, 700)  # Set minimum window size
 
         # Home & station listeleri
-        self.home_poi = []
         self.station_candidates = []
-        self.selected_homes = []
+        self._next_cand_id = 1        # aday numarası; silme/temizlemeden sonra da hiç azalmaz
+        # evler yalnızca dizi olarak tutulur (kimlik, enlem, boylam); sözlük yok
+        self.home_id = np.zeros(0, dtype=np.int64)
+        self.home_lat = self.home_lon = np.zeros(0)
+        self.ev_home = np.zeros(0, dtype=np.int64)   # seçili EV → ev dizisi indeksi
+        self.fleet = Fleet.from_models([])   # seçili EV'lerin araç dizileri
         self.selected_stations = []
 
         # Sonuç değişkenleri
@@ -143,6 +2943,19 @@ class ChargingStationOptimizer:
         self.chargers_var = tk.StringVar(master=self.root, value="0")
         self.energy_var = tk.StringVar(master=self.root, value="0")
         self.solution_obj = 0.0
+        self.solution = None      # son çözümün değişmez LocationSolution kaydı
+
+        # Çalıştırmalar arası önbellek: aday başına mesafe sütunu,
+        # aday çifti yol mesafesi ve canlı Docplex modeli
+        self.dist_store = None     # seçili EV'ler için diskteki mesafe deposu
+        self._pair_km = {}
+        self.route_cache = RouteCache(ROUTE_DB_PATH)
+        self._mip_engine = None
+        self._mip_engine_key = None
+        self._timings = {}        # (yöntem, senaryo, ön işlem) → (kurulum s, çözüm s)
+        self._pool_cache = {}     # (senaryo özeti, k) → en iyi k açık küme (aday id)
+        self.alternatives = []
+        self._alt_d = None        # alternatiflerin çözüldüğü EV × aday mesafe matrisi
 
         # Grafik altyapısı
         self.figure = plt.Figure(figsize=(5,3), dpi=100)
@@ -256,6 +3069,8 @@ class ChargingStationOptimizer:
             ("Min Radius (m)",           'radius', 200, 5000, 1000),
             ("Max Stations",             'max_st', 1,   50,   15),
             ("Station Capacity (kWh/day)", 'capacity', 10,1000,50),
+            ("Ensemble Replications",   'reps', 2,   200,  20),
+            ("Alternatives (k-best)",   'kbest', 1,  10,   1),
         ]
         
         for i, (label, var, low, high, val) in enumerate(params):
@@ -286,11 +3101,36 @@ class ChargingStationOptimizer:
             .pack(anchor=W, pady=(0, 5))
         
         self.method_combo = tb.Combobox(options_frame,
-                                       values=["Docplex MIP", "Genetic Algorithm"],
+                                       values=["Docplex MIP", "Genetic Algorithm",
+                                               "Lagrangian Relaxation",
+                                               "Benders Decomposition"],
                                        state="readonly")
         self.method_combo.current(0)
         self.method_combo.pack(fill=X, pady=(0, 10))
 
+        tb.Label(options_frame, text="MIP Backend", font=("Segoe UI", 9, "bold"))\
+            .pack(anchor=W, pady=(0, 5))
+
+        self.backend_combo = tb.Combobox(options_frame, values=MIP_BACKENDS,
+                                         state="readonly")
+        self.backend_combo.current(0 if Model is not None else 1)
+        self.backend_combo.pack(fill=X, pady=(0, 10))
+
+        self.aggregate_var = tk.BooleanVar(master=self.root, value=False)
+        tb.Checkbutton(options_frame, text="Aggregate demand (grid)",
+                       variable=self.aggregate_var,
+                       bootstyle="round-toggle").pack(anchor=W, pady=(0, 10))
+
+        self.stratify_var = tk.BooleanVar(master=self.root, value=False)
+        tb.Checkbutton(options_frame, text="Stratify EV sample (grid)",
+                       variable=self.stratify_var,
+                       bootstyle="round-toggle").pack(anchor=W, pady=(0, 10))
+
+        self.presolve_var = tk.BooleanVar(master=self.root, value=False)
+        tb.Checkbutton(options_frame, text="Presolve candidates",
+                       variable=self.presolve_var,
+                       bootstyle="round-toggle").pack(anchor=W, pady=(0, 10))
+
         tb.Label(options_frame, text="Location Type", font=("Segoe UI", 9, "bold"))\
             .pack(anchor=W, pady=(0, 5))
         
@@ -317,6 +3157,16 @@ class ChargingStationOptimizer:
         
         tb.Button(actions_frame, text="Show Results", bootstyle="info",
                   command=self.open_results_window).pack(**button_style)
+
+        tb.Button(actions_frame, text="Run Ensemble", bootstyle="success-outline",
+                  command=self.run_ensemble).pack(**button_style)
+
+        scen_row = tb.Frame(actions_frame)
+        scen_row.pack(**button_style)
+        tb.Button(scen_row, text="Save Scenario", bootstyle="primary-outline",
+                  command=self.save_scenario).pack(side=LEFT, fill=X, expand=YES, padx=(0, 2))
+        tb.Button(scen_row, text="Open Scenario", bootstyle="primary-outline",
+                  command=self.open_scenario).pack(side=LEFT, fill=X, expand=YES, padx=(2, 0))
         
         # Utilities section at the bottom
         utils_frame = tb.LabelFrame(control_frame, text="Utilities", padding=10)
@@ -328,16 +3178,25 @@ class ChargingStationOptimizer:
         tb.Button(utils_frame, text="Show Heat-Map", bootstyle="danger",
                   command=self.build_heatmap).pack(**button_style)
 
+        tb.Button(utils_frame, text="Simulate Day", bootstyle="secondary",
+                  command=self.simulate_day).pack(**button_style)
+
+        tb.Button(utils_frame, text="Export Model (LP/MPS)", bootstyle="secondary",
+                  command=self.export_model).pack(**button_style)
+
+        tb.Button(utils_frame, text="Prefetch Map Tiles", bootstyle="secondary",
+                  command=self.prefetch_map_tiles).pack(**button_style)
+
     def show_legend(self):
         """Display a color legend for map markers"""
         # Define color legend items
         legend_items = [
-            ("green",   "Green",    "Home / Vehicle location"),
-            ("#ffc107", "Yellow",   "Home-type station candidate"),
-            ("#fd7e14", "Orange",   "Parking-type station candidate"),
-            ("#007bff", "Blue",     "Fuel-type (fast) candidate"),
-            ("#17a2b8", "Turquoise","Selected EV"),
-            ("#6f42c1", "Purple",   "Selected station"),
+            (HOME_MARKER_COLOR,      "Green",    "Home / Vehicle location"),
+            (POI_COLOR["Home"],      "Yellow",   "Home-type station candidate"),
+            (POI_COLOR["Parking"],   "Orange",   "Parking-type station candidate"),
+            (POI_COLOR["Fuel"],      "Blue",     "Fuel-type (fast) candidate"),
+            (SELECTED_HOME_COLOR,    "Turquoise","Selected EV"),
+            (SELECTED_STATION_COLOR, "Purple",   "Selected station"),
         ]
 
         top = tk.Toplevel(self.root)
@@ -417,17 +3276,10 @@ class ChargingStationOptimizer:
     def osrm_route(self, p1, p2):
         """
         Origin-dest (lat,lon)->(lat,lon) ikilisi için
-        OSRM’dan sadeleştirilmiş polyline (koordinat listesi) döner.
+        OSRM’dan polyline (koordinat listesi) döner; rota önbelleğinden okunur.
         Servise ulaşılamazsa iki nokta arası düz çizgi verir.
         """
-        try:
-            url = (f"https://router.project-osrm.org/route/v1/driving/"
-                f"{p1[1]},{p1[0]};{p2[1]},{p2[0]}?overview=full&geometries=geojson")
-            geom = requests.get(url, timeout=5).json()["routes"][0]["geometry"]["coordinates"]
-            # geojson -> [(lat,lon), ...]
-            return [(lat, lon) for lon, lat in geom]
-        except Exception:
-            return [p1, p2]
+        return self.route_cache.route(p1, p2)[1]
 
     def _build_map(self, parent):
         frame = tb.LabelFrame(parent, text="Map View", bootstyle="primary")
@@ -458,6 +3310,13 @@ class ChargingStationOptimizer:
                                      bootstyle="info-outline",
                                      command=self._change_map_type)
         map_type_menu.pack(side=LEFT)
+
+        # Ağ yoksa yalnızca yerel karo deposundan oku
+        self.offline_var = tk.BooleanVar(master=self.root, value=False)
+        tb.Checkbutton(map_controls, text="Offline tiles", variable=self.offline_var,
+                       bootstyle="round-toggle",
+                       command=lambda: setattr(self.map_widget, "offline",
+                                               self.offline_var.get())).pack(side=LEFT, padx=10)
         
         # Configure User-Agent for all HTTP requests from tkintermapview
         try:
@@ -468,8 +3327,13 @@ class ChargingStationOptimizer:
             pass
         
         # Create the map widget
-        self.map_widget = TkinterMapView(frame, corner_radius=0)
+        self.tile_store = MBTilesStore(TILE_DB_PATH)
+        self.map_widget = CachedMapView(frame, corner_radius=0, tile_store=self.tile_store)
+        self.map_widget.set_tile_server(TILE_SERVER)
         self.map_widget.grid(row=1, column=0, sticky=NSEW, padx=5, pady=5)
+        self.home_layer = HomeMarkerRenderer(self.map_widget, home_command=self._home_command)
+        self.cand_layer = MarkerLayer(self.map_widget)
+        self.heat_overlay = HeatmapOverlay(self.map_widget)
         
         # Initialize map
         try:
@@ -482,37 +3346,29 @@ class ChargingStationOptimizer:
             self.root.after(500, self._delayed_map_init)
             
         self.map_widget.add_left_click_map_command(self.on_map_click)
+        self.root.after(VIEW_POLL_MS, self._poll_view)
+
+    def _poll_view(self):
+        """Re-culls/re-clusters home markers whenever the map was panned or zoomed."""
+        try:
+            self.home_layer.refresh()
+        finally:
+            self.root.after(VIEW_POLL_MS, self._poll_view)
         
     def _delayed_map_init(self):
-        """Alternative map initialization with delay - sometimes helps with network issues"""
+        """Second initialization attempt: serve the map from the local tile store only."""
         try:
-            # Try different tile servers if the default one fails
-            servers = [
-                "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png",
-                "https://mt0.google.com/vt/lyrs=m&hl=en&x={x}&y={y}&z={z}",
-                "https://mt0.google.com/vt/lyrs=s&hl=en&x={x}&y={y}&z={z}"
-            ]
-            
-            for server in servers:
-                try:
-                    self.map_widget.set_tile_server(server)
-                    self.map_widget.set_position(41.0082, 28.9784)  # Istanbul
-                    self.map_widget.set_zoom(12)
-                    self.status_var.set(f"Map loaded successfully using alternate server")
-                    return
-                except Exception:
-                    continue
-                    
-            # If all servers failed, try one more time with a longer delay
+            self.offline_var.set(True)
+            self.map_widget.offline = True
+            self.map_widget.set_position(41.0082, 28.9784)  # Istanbul
+            self.map_widget.set_zoom(12)
+            self.status_var.set("Map loaded from the local tile cache (offline)")
+        except Exception:
             self.root.after(1000, self._final_map_init_attempt)
-            
-        except Exception as e:
-            self.status_var.set(f"Map loading error: {str(e)}")
-    
+
     def _final_map_init_attempt(self):
         """Last attempt to initialize the map with fallback options"""
         try:
-            self.map_widget.set_tile_server("https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
             self.map_widget.set_position(41.0082, 28.9784)
             self.map_widget.set_zoom(12)
             self.status_var.set("Map loaded successfully after retry")
@@ -521,18 +3377,66 @@ class ChargingStationOptimizer:
             self.status_var.set("Map loading failed. Please check your internet connection.")
             messagebox.showerror("Map Error", 
                               "Could not load map tiles. The application will still work, but the map display may be limited.\n\n"
-                              "Please check your internet connection and restart the application.")
+                              "Use 'Prefetch Map Tiles' while online to make the map available offline.")
             
     def _change_map_type(self, map_type):
         """Change the map tile server based on selection"""
         try:
             # Only support OpenStreetMap
-            self.map_widget.set_tile_server("https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+            self.map_widget.set_tile_server(TILE_SERVER)
             self.status_var.set("Using OpenStreetMap")
         except Exception as e:
             self.status_var.set(f"Error changing map type: {str(e)}")
             messagebox.showwarning("Map Error", f"Could not change map type: {str(e)}")
 
+    def prefetch_map_tiles(self):
+        """Downloads the tiles over the loaded homes' bounding box into the local store."""
+        if not len(self.home_lat):
+            messagebox.showwarning("No Homes", "Load home points first.")
+            return
+        zr = simpledialog.askstring("Prefetch Map Tiles", "Zoom range (min-max):",
+                                    initialvalue=f"{PREFETCH_ZOOM[0]}-{PREFETCH_ZOOM[1]}",
+                                    parent=self.root)
+        if not zr:
+            return
+        try:
+            z0, z1 = sorted(int(v) for v in zr.split("-"))
+        except ValueError:
+            messagebox.showerror("Invalid Range", f"Could not parse zoom range '{zr}'.")
+            return
+        lat, lon = self.home_lat, self.home_lon
+        tiles = list(tile_range(lat.min(), lat.max(), lon.min(), lon.max(),
+                                range(max(z0, 0), min(z1, 19) + 1)))
+        server = self.map_widget.tile_server
+        osm = "tile.openstreetmap.org" in server
+        limit = OSM_PREFETCH_MAX_TILES if osm else PREFETCH_MAX_TILES
+        if len(tiles) > limit:
+            messagebox.showwarning("Too Many Tiles",
+                                   f"{len(tiles)} tiles requested (limit {limit}). "
+                                   "Choose a smaller zoom range"
+                                   + (" or set EV_TILE_SERVER to a tile server that allows "
+                                      "bulk downloads." if osm else "."))
+            return
+        if not messagebox.askyesno("Prefetch Map Tiles",
+                                   f"Download up to {len(tiles)} tiles from\n{server}\n"
+                                   f"at {PREFETCH_RATE:g} tiles/s "
+                                   f"(about {len(tiles) / PREFETCH_RATE / 60:.0f} min)?"):
+            return
+
+        def progress(n, fetched, skipped, failed):
+            self.status_var.set(f"Prefetching tiles: {n}/{len(tiles)} "
+                                f"({fetched} new, {skipped} cached, {failed} failed)")
+
+        def work():
+            try:
+                fetched, skipped, failed = prefetch_tiles(self.tile_store, server, tiles, progress)
+                self.status_var.set(f"Prefetch done: {fetched} new, {skipped} cached, "
+                                    f"{failed} failed; store {self.tile_store.n_bytes / 2**20:.1f} MB")
+            except Exception as e:
+                self.status_var.set(f"Tile prefetch failed: {e}")
+
+        threading.Thread(target=work, daemon=True).start()
+
     def generate_daily_trips(self, rng_seed=None):
         """
         Her seçilen EV’e TRIP_PER_EV_RANGE kadar yolculuk atar;
@@ -545,38 +3449,47 @@ class ChargingStationOptimizer:
         self.trip_log = []
         global_seq = 0                    # gün içi kronolojik sıra
 
-        for i, sh in enumerate(self.selected_homes):
-            ev_id   = f"E{i+1:02d}"
-            v       = sh["vehicle"]
-            soc     = v.battery_capacity
-            origin  = (sh["home"]["lat"], sh["home"]["lon"])
-
-            n_trips = random.randint(*TRIP_PER_EV_RANGE)
-            trip_no = 1                   # --> EV’ye özgü sayaç
-
-            while trip_no <= n_trips:
-                # 1️⃣ HEDEF SEÇ – mevcut konumdan FARKLI olana kadar döngü
-                while True:
-                    dest_home = random.choice(self.home_poi)
-                    dest      = (dest_home["lat"], dest_home["lon"])
-                    if dest != origin:            # aynı koordinatsa yenisini dene
+        batt = self.fleet.battery_capacity.tolist()
+        rate = self.fleet.consumption_rate.tolist()
+        lat, lon, n_homes = self.home_lat, self.home_lon, len(self.home_lat)
+
+        def home(k):                      # ev indeksi → (lat, lon)
+            return float(lat[k]), float(lon[k])
+
+        # 1️⃣ HEDEFLER – her EV için önce tüm bacaklar çekilir (mesafeye bağlı değil);
+        #    bacaklar ev indeksleriyle tutulur, etiketler için koordinat araması gerekmez
+        legs = []                         # EV başına [(origin_k, dest_k), …]
+        for i in range(len(self.ev_home)):
+            o, ev_legs = int(self.ev_home[i]), []
+            for _ in range(random.randint(*TRIP_PER_EV_RANGE)):
+                while True:               # mevcut konumdan FARKLI olana kadar
+                    k = random.randrange(n_homes)
+                    if home(k) != home(o):
                         break
-
-                # 2️⃣ MESAFE + TÜKETİM
-                dist_km  = self.osrm_or_haversine(origin, dest)
-                cons_kwh = round(dist_km * v.consumption_rate, 2)
+                ev_legs.append((o, k))
+                o = k
+            legs.append(ev_legs)
+
+        # 2️⃣ MESAFELER – tüm OD çiftleri tek routes() çağrısıyla (eksikler paralel)
+        routes = self.route_cache.routes([(home(o), home(k)) for ev_legs in legs
+                                          for o, k in ev_legs])
+
+        # 3️⃣ SOC + LOG
+        diverted_at = []                  # (trip_log indeksi, şarja sapılan konum)
+        for i, ev_legs in enumerate(legs):
+            ev_id, soc = f"E{i+1:02d}", batt[i]
+            for trip_no, (o, k) in enumerate(ev_legs, start=1):   # EV’ye özgü sayaç
+                origin, dest = home(o), home(k)
+                dist_km  = routes[(origin, dest)][0]
+                cons_kwh = round(dist_km * rate[i], 2)
                 soc     -= cons_kwh
 
-                diverted, charger_id = False, ""
-                if soc < MIN_SOC_KWH:
-                    diverted = True
-                    nearest  = self.divert_to_charger({"lat": origin[0], "lon": origin[1]})
-                    charger_id = nearest["tag"]
-                    extra_dist = self.osrm_or_haversine(origin, (nearest["lat"], nearest["lon"]))
-                    soc -= round(extra_dist * v.consumption_rate, 2)
-                    soc  = v.battery_capacity       # “şarj oldu” kabulü
+                diverted = soc < MIN_SOC_KWH
+                if diverted:
+                    # şarja sapma bacağı SOC’u etkilemez: araç hemen “şarj oldu” kabul edilir
+                    diverted_at.append((len(self.trip_log), origin))
+                    soc = batt[i]
 
-                # 3️⃣ LOG
                 global_seq += 1
                 self.trip_log.append({
                     "seq"       : global_seq,        # kronolojik (isterseniz)
@@ -584,123 +3497,223 @@ class ChargingStationOptimizer:
                     "ev_id"     : ev_id,
                     "origin"    : origin,
                     "dest"      : dest,
-                    "origin_lbl": self.poi_label(*origin),
-                    "dest_lbl"  : self.poi_label(*dest),
+                    "origin_lbl": f"H{self.home_id[o]:02d}",
+                    "dest_lbl"  : f"H{self.home_id[k]:02d}",
                     "dist_km"   : round(dist_km, 2),
                     "cons_kwh"  : cons_kwh,
                     "rem_soc"   : round(soc, 2),
                     "diverted"  : diverted,
-                    "charger_id": charger_id
+                    "charger_id": ""
                 })
 
-                # 4️⃣ Sonraki yolculuk için güncelle
-                origin   = dest
-                trip_no += 1
+        # 4️⃣ ŞARJ NOKTALARI – sapılan tüm konumlar için en yakın aday tek seferde
+        nearest = self.divert_to_charger([p for _, p in diverted_at])
+        for (k, _), c in zip(diverted_at, nearest):
+            self.trip_log[k]["charger_id"] = c["tag"] if c else ""
 
     def build_edge_counts(self):
         """
         self.trip_log kullanarak yol segmentleri üzerinde kullanım
-        sayımlarını üretir: {(lat1,lon1,lat2,lon2): count, ...}
+        sayımlarını üretir (EdgeCounts: ızgaraya oturtulmuş segmentler + sayım).
         """
-        self.edge_freq = {}
-        for rec in self.trip_log:
-            path = self.osrm_route(rec["origin"], rec["dest"])
-            for a, b in zip(path, path[1:]):
-                # yönsüz hash – ( A,B ) ile ( B,A ) aynı olsun
-                key = tuple(sorted((a, b)))
-                self.edge_freq[key] = self.edge_freq.get(key, 0) + 1
+        # tekrar eden OD çiftleri bir kez, eksikler eşzamanlı getirilir
+        od = [(rec["origin"], rec["dest"]) for rec in self.trip_log]
+        routes = self.route_cache.routes(od)
+        uses = {}
+        for pair in od:
+            uses[pair] = uses.get(pair, 0) + 1
+        paths, weights = [routes[p][1] for p in uses], list(uses.values())
+        self.edge_freq = edges = EdgeCounts.build(paths, weights)
+        self.edge_lod = {}
+
+        def work():     # LOD seviyeleri arayüz iş parçacığı dışında; hazır olana dek tam çözünürlük
+            lod = edge_lod_pyramid(edges)
+            self.root.after(0, self._set_edge_lod, edges, lod)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _set_edge_lod(self, edges, lod):
+        if edges is not self.edge_freq:        # bu arada yeni sayım üretildi
+            return
+        self.edge_lod = lod
+        if len(self.heat_overlay.full[0]):      # ısı haritası açıksa seviyelere geç
+            self.heat_overlay.set_edges(edges, lod)
 
     def _haversine_demand(self):
         """Eski (basit) yöntem: her EV kendi evinden tüm diğer EV evlerine
         Haversine mesafesi kat edip geri dönecekmiş gibi toplam tüketim."""
-        D = []
-        n = len(self.selected_homes)
-        for i in range(n):
-            v_i  = self.selected_homes[i]['vehicle']
-            h_i  = self.selected_homes[i]['home']
-            total = 0
-            for j in range(n):
-                if i == j:             # kendisi → atla
-                    continue
-                h_j = self.selected_homes[j]['home']
-                dist = haversine(h_i['lat'], h_i['lon'], h_j['lat'], h_j['lon'])
-                total += dist * v_i.consumption_rate     # kWh
-            D.append(round(total, 2))
-        return D           # uzunluk = #EV
-
-    def poi_label(self, lat, lon):
-        """ Verilen koordinat ev veya istasyona aitse okunur bir
-            etiket (H12, S03-Parking …) döndürür; yoksa '' """
-        for h in self.home_poi:
-            if abs(h['lat']-lat) < 1e-6 and abs(h['lon']-lon) < 1e-6:
-                return f"H{h['id']:02d}"
-        for s in self.station_candidates:
-            if abs(s['lat']-lat) < 1e-6 and abs(s['lon']-lon) < 1e-6:
-                return s['tag']
-        return ''
+        lat, lon = self._ev_coords()
+        # köşegen (kendisi) sıfır km; satır toplamı × EV tüketimi
+        km = haversine_matrix(lat, lon, lat, lon).sum(axis=1)
+        return np.round(km * self.fleet.consumption_rate, 2).tolist()   # uzunluk = #EV
 
     def osrm_or_haversine(self, p1, p2):
-        """OSRM varsa gerçek yol uzunluğu, aksi hâlde haversine (km)."""
-        try:
-            import requests
-            url = (f"http://router.project-osrm.org/route/v1/driving/"
-                f"{p1[1]},{p1[0]};{p2[1]},{p2[0]}?overview=false")
-            r = requests.get(url, timeout=5).json()
-            return r["routes"][0]["distance"] / 1000.0  # m → km
-        except Exception:
-            return haversine(p1[0], p1[1], p2[0], p2[1])
+        """OSRM varsa gerçek yol uzunluğu, aksi hâlde haversine (km).
+        Aynı istekte gelen geometri önbelleğe yazılır (build_edge_counts kullanır)."""
+        return self.route_cache.route(p1, p2)[0]
 
     def load_homes(self):
         path = filedialog.askopenfilename(
-            title="Select Home POI JSON/CSV",
-            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")]
+            title="Select Home POI File",
+            filetypes=[("Point files", "*.json *.geojson *.csv *.parquet *.geoparquet *.arrow *.feather"),
+                       ("JSON / GeoJSON", "*.json *.geojson"), ("CSV files", "*.csv"),
+                       ("GeoParquet / Arrow", "*.parquet *.geoparquet *.arrow *.feather")]
         )
         if not path:
             return
+
+        # Marker'ları temizle
+        self.home_layer.clear()
+        self.cand_layer.clear()
+        last = [0.0]
+
+        def progress(lat, lon, frac):
+            # arayüz en fazla LOAD_PROGRESS_S'de bir güncellenir
+            now = time.perf_counter()
+            if now - last[0] >= LOAD_PROGRESS_S:
+                first, last[0] = last[0] == 0.0, now
+                self.root.after(0, self._show_partial_homes, lat, lon, frac, first)
+
+        def work():
+            try:
+                t0 = time.perf_counter()
+                lat, lon = load_points(path, progress)
+                ids = np.arange(1, len(lat) + 1)       # evler 1'den numaralı
+                self.root.after(0, self._set_homes, ids, lat, lon, time.perf_counter() - t0)
+            except Exception as e:
+                msg = f"Failed to load homes: {e}"
+                self.root.after(0, lambda: messagebox.showerror("Error", msg))
+
+        self.status_var.set(f"Loading {os.path.basename(path)}...")
+        threading.Thread(target=work, daemon=True).start()
+
+    def _show_partial_homes(self, lat, lon, frac, first):
+        """Progressive map fill while load_homes is still reading."""
+        if first:
+            self.map_widget.set_position(lat[0], lon[0])
+            self.map_widget.set_zoom(14)
+        self.home_layer.set_points(np.arange(1, len(lat) + 1), lat, lon)
+        self.home_layer.refresh(force=True)
+        self.status_var.set(f"Loading homes... {len(lat)} points ({frac:.0%})")
+
+    def _set_homes(self, ids, lat, lon, elapsed=None):
+        self.home_id, self.home_lat, self.home_lon = ids, lat, lon
+        # EV seçimi ve ona bağlı her şey eski ev listesine ait (clear_map ile aynı)
+        self.ev_home = np.zeros(0, dtype=np.int64)
+        self.fleet = Fleet.from_models([])
+        self.trip_log = []; self.edge_freq = EdgeCounts.build([]); self.edge_lod = {}
+        self.dist_store = None
+        self._mip_engine = self._mip_engine_key = None
+        self._pool_cache.clear()
+        self.alternatives, self._alt_d = [], None
+        self.solution = None
+        self.selected_stations.clear()
+        self.heat_overlay.clear()
+
+        # Haritayı home'ların ilkine kaydır
+        if len(lat):
+            self.map_widget.set_position(lat[0], lon[0])
+            self.map_widget.set_zoom(14)
+
+        # tıklayınca araç bilgisini göster
+        self.home_layer.set_points(ids, lat, lon)
+        self._update_markers()
+
+        self.status_var.set(f"{len(lat)} home points loaded"
+                            + (f" in {elapsed:.2f} s." if elapsed is not None else "."))
+
+    def save_scenario(self):
+        """Writes homes, candidates, the EV sample and cached distances to one binary file."""
+        if not len(self.home_lat):
+            messagebox.showwarning("No Homes", "Load home points first.")
+            return
+        path = filedialog.asksaveasfilename(title="Save Scenario", defaultextension=".evscn",
+                                            filetypes=[("EV scenario", "*.evscn")])
+        if not path:
+            return
+        cands = self.station_candidates
+        store = self._dist_store() if len(self.ev_home) else None
+        cached = [c for c in cands if store is not None and store.has(c['lat'], c['lon'])]
+        pairs = sorted(self._pair_km)
+        arrays = {
+            "home_id":    self.home_id,
+            "home_lat":   self.home_lat,
+            "home_lon":   self.home_lon,
+            "cand_id":    np.array([c['id'] for c in cands], dtype=np.int64),
+            "cand_lat":   np.array([c['lat'] for c in cands], dtype=float),
+            "cand_lon":   np.array([c['lon'] for c in cands], dtype=float),
+            "cand_poi":   np.array([POI_TYPE_NUM[c['poi']] for c in cands], dtype=np.uint8),
+            "ev_home":    self.ev_home + 1,                  # ev id'leri (1'den)
+            "ev_vehicle": self.fleet.model,
+            # aday başına bir satır: açılışta her sütun ayrı sayfalanır
+            "dist_cand":  np.array([c['id'] for c in cached], dtype=np.int64),
+            "dist_km":    (store.rows(store.columns([(c['lat'], c['lon']) for c in cached]))
+                           if cached else np.zeros((0, len(self.ev_home)), dtype=np.float32)),
+            "pair_ids":   np.array(pairs, dtype=np.int64).reshape(-1, 2),
+            "pair_km":    np.array([self._pair_km[k] for k in pairs], dtype=float),
+        }
+        meta = {"params": {v: getattr(self, f"{v}_var").get()
+                           for v in ("ev_rate", "radius", "max_st", "capacity")},
+                "vehicle_models": list(self.fleet.catalog.brand)}
         try:
-            loaded = []
-            if path.endswith('.json'):
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                for pt in data:
-                    loaded.append({'lat': pt['lat'], 'lon': pt['lon']})
-            else:
-                with open(path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        loaded.append({'lat': float(row['lat']), 'lon': float(row['lon'])})
-            self.home_poi = loaded
-
-            # Haritayı home'ların ilkine kaydır
-            if self.home_poi:
-                first = self.home_poi[0]
-                self.map_widget.set_position(first['lat'], first['lon'])
-                self.map_widget.set_zoom(14)
-
-            # Marker'ları temizle
-            self.map_widget.delete_all_marker()
-
-            # Evleri numaralandırarak ekle; tıklayınca araç bilgisini göster
-            for idx, h in enumerate(self.home_poi, start=1):
-                h['id'] = idx  
-                def show_info(marker=None, home=h, num=idx):
-                    veh = next((sh['vehicle'] for sh in self.selected_homes if sh['home']==home), None)
-                    if veh:
-                        marker.set_text(f"{veh.brand}\n{veh.battery_capacity} kWh\n{veh.charge_rate} kW")
-                    else:
-                        marker.set_text(str(num))
-
-                m = self.map_widget.set_marker(
-                    h['lat'], h['lon'],
-                    text=str(idx),
-                    marker_color_circle="green",
-                    marker_color_outside="white",
-                    command=show_info
-                )
-
-            self.status_var.set(f"{len(self.home_poi)} home points loaded.")
+            write_scenario(path, arrays, meta)
+            self.status_var.set(f"Scenario saved to {os.path.basename(path)}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save scenario: {e}")
+
+    def open_scenario(self):
+        """Restores a saved scenario; only distance rows missing from the store are read."""
+        path = filedialog.askopenfilename(title="Open Scenario",
+                                          filetypes=[("EV scenario", "*.evscn")])
+        if not path:
+            return
+        try:
+            scn = ScenarioFile(path)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load homes: {e}")
+            messagebox.showerror("Error", f"Failed to open scenario: {e}")
+            return
+        self.clear_map()
+        poi_name = {num: name for name, num in POI_TYPE_NUM.items()}
+
+        lat, lon = scn["home_lat"], scn["home_lon"]
+        self.home_id = np.asarray(scn["home_id"], dtype=np.int64)
+        self.home_lat, self.home_lon = np.asarray(lat), np.asarray(lon)
+        # EV ev kimlikleri → dizi indeksi (sıralı arama; ev başına sözlük yok)
+        order = np.argsort(self.home_id, kind="stable")
+        self.ev_home = order[np.searchsorted(self.home_id[order], scn["ev_home"])].astype(np.int64)
+        # model kodları kaydedildiği kataloğa göre; güncel kataloğa eşle
+        code = {b: k for k, b in enumerate(VEHICLE_CATALOG.brand)}
+        saved = scn.meta.get("vehicle_models", VEHICLE_CATALOG.brand)
+        self.fleet = Fleet.from_models([code[saved[m]] for m in scn["ev_vehicle"].tolist()])
+        for cid, a, b, p in zip(scn["cand_id"].tolist(), scn["cand_lat"].tolist(),
+                                scn["cand_lon"].tolist(), scn["cand_poi"].tolist()):
+            poi = poi_name[p]
+            self.station_candidates.append({'id': cid, 'tag': f"S{cid:02d}-{poi}",
+                                            'lat': a, 'lon': b, 'poi': poi})
+            self._next_cand_id = max(self._next_cand_id, cid + 1)
+        # mesafe deposu zaten doluysa (aynı EV örneklemi) hiçbir satır okunmaz
+        dist = scn["dist_km"]
+        by_cid = {c['id']: c for c in self.station_candidates}
+        if len(self.ev_home):
+            store = self._dist_store()
+            for j, cid in enumerate(scn["dist_cand"].tolist()):
+                c = by_cid[cid]
+                if not store.has(c['lat'], c['lon']):
+                    store.put(c['lat'], c['lon'], dist[j])
+        for (a, b), km in zip(scn["pair_ids"].tolist(), scn["pair_km"].tolist()):
+            self._pair_km[(a, b)] = km
+        for v, val in scn.meta.get("params", {}).items():
+            getattr(self, f"{v}_var").set(val)
+            getattr(self, f"{v}_disp").set(str(val))
+
+        if len(lat):
+            self.map_widget.set_position(lat[0], lon[0])
+            self.map_widget.set_zoom(14)
+        self.home_layer.set_points(self.home_id, lat, lon)
+        self._update_markers()
+        self.status_var.set(f"Scenario {os.path.basename(path)}: {len(lat)} homes, "
+                            f"{len(self.station_candidates)} candidates, "
+                            f"{len(self.ev_home)} EVs")
 
     def on_map_click(self, coords):
         # Maximum candidate control
@@ -722,7 +3735,10 @@ class ChargingStationOptimizer:
         # Adayı kaydet
 
         poi = self.poi_type.get()
-        idx = len(self.station_candidates) + 1        # 1-den başlayan sıra
+        # 1-den başlayan, silmelerden sonra da tekrar etmeyen sıra (canlı model,
+        # mesafe önbellekleri aday id'sine bağlı: id yeniden verilmemeli)
+        idx = self._next_cand_id
+        self._next_cand_id += 1
         tag = f"S{idx:02d}-{poi}"                     # ör. S01-Parking
         self.station_candidates.append({
             'id' : idx,       #  <-- kaydet
@@ -731,81 +3747,93 @@ class ChargingStationOptimizer:
             'lon': lon,
             'poi': poi
         })
+        self.alternatives, self._alt_d = [], None      # havuz eski aday kümesine ait
 
-        color = POI_COLOR[poi]
-        m = self.map_widget.set_marker(
-            lat, lon,
-            text=tag,
-            marker_color_circle=color,
-            marker_color_outside="white"
-        )
-        m.set_text(f"{tag}\nFixed Cost: {POI_FIXED_COST[poi]} k€")
+        self.cand_layer.put(idx, lat, lon, f"{tag}\nFixed Cost: {POI_FIXED_COST[poi]} k€",
+                            POI_COLOR[poi], command=self._candidate_command(idx))
         self.status_var.set(f"Added station candidate {tag} ({lat:.4f}, {lon:.4f})")
 
-    def _update_markers(self):
-        self.map_widget.delete_all_marker()
-
-        # ------------------ 1) EVLER ------------------
-        for idx, h in enumerate(self.home_poi, start=1):
-            is_selected = any(sh['home'] is h for sh in self.selected_homes)
+    def remove_candidate(self, cid, marker=None):
+        """Removes a candidate (marker click); the next run only closes its x_j."""
+        cand = next((c for c in self.station_candidates if c['id'] == cid), None)
+        if cand is None:
+            return
+        if not messagebox.askyesno("Remove Candidate", f"Remove candidate {cand['tag']}?"):
+            return
+        self.station_candidates.remove(cand)
+        self.selected_stations = [s for s in self.selected_stations if s['tag'] != cand['tag']]
+        self.solution = None      # atama indeksleri eski aday listesine ait
+        self.alternatives, self._alt_d = [], None
+        self.cand_layer.remove(cid)
+        self.status_var.set(f"Removed station candidate {cand['tag']}")
+
+    def _home_command(self, hid):
+        """Click on a home marker: toggles the vehicle info of that EV."""
+        def show_info(marker=None):
+            hit = np.flatnonzero(self.ev_home == hid - 1)       # id = indeks + 1
+            veh = self.fleet.vehicle(hit[0]) if len(hit) else None
+            if veh:
+                marker.set_text(f"{veh.brand}\n{veh.battery_capacity} kWh\n{veh.charge_rate} kW")
+            else:
+                marker.set_text(str(hid))
+        return show_info
 
-            color = "#17a2b8" if is_selected else "green"      # turkuaz / yeşil
-            label = str(h.get('id', idx))                      # H-ID
+    def _candidate_command(self, cid):
+        return lambda marker: self.remove_candidate(cid, marker)
 
-            self.map_widget.set_marker(
-                h['lat'], h['lon'],
-                text=label,
-                marker_color_circle=color,
-                marker_color_outside="white"
-            )
+    def _update_markers(self):
+        """Applies the current selection to the map; only changed markers are redrawn."""
+        # ------------------ 1) EVLER ------------------
+        # yalnızca görünür alandaki evler çizilir; uzakta/kalabalıkta kümelenir
+        self.home_layer.set_selected((self.ev_home + 1).tolist())
+        self.home_layer.refresh(force=True)
 
         # ------------ 2) İSTASYON ADAYLARI -------------
-        for idx, c in enumerate(self.station_candidates, start=1):
-            tag   = c['tag']                     # “S02-Parking” vb.
-            base  = POI_COLOR[c['poi']]          # sarı / turuncu / mavi
-            is_sel = any(
-                abs(s['lat'] - c['lat']) < 1e-6 and
-                abs(s['lon'] - c['lon']) < 1e-6
-                for s in self.selected_stations
-            )
-
-            color = "#6f42c1" if is_sel else base  # mor  ya da  POI rengi
-
-            self.map_widget.set_marker(
-                c['lat'], c['lon'],
-                text=tag,
-                marker_color_circle=color,
-                marker_color_outside="white"
-            )
+        sel_ids = {s.get('id') for s in self.selected_stations}
+        cands = {
+            c['id']: (c['lat'], c['lon'], c['tag'],                           # “S02-Parking” vb.
+                      SELECTED_STATION_COLOR if c['id'] in sel_ids else POI_COLOR[c['poi']])
+            for c in self.station_candidates
+        }
+        self.cand_layer.sync(cands, command=self._candidate_command)
 
     def ensure_selected_homes(self, evr, seed=None):
-        if self.selected_homes:
+        if len(self.ev_home):
             return                    # zaten seçildiyse dokunma
 
         if seed is not None:
-            random.seed(seed)         # ① rastgeleliği kilitle
+            random.seed(seed)         # ① yolculuk üretimi de aynı tohumdan
 
-        k = max(1, int(len(self.home_poi)*evr/100))
-        sampled = random.sample(self.home_poi, k)
+        rng = np.random.default_rng(seed)
+        t0 = time.perf_counter()
+        self.ev_home, models = sample_evs(
+            self.home_lat, self.home_lon, evr, rng,
+            strata_m=EV_STRATA_CELL_M if self.stratify_var.get() else None)
+        self.fleet = Fleet.from_models(models)
+        self.status_var.set(f"{len(self.ev_home)}/{len(self.home_lat)} homes sampled as EVs "
+                            f"in {time.perf_counter() - t0:.2f} s")
 
-        self.selected_homes = [
-            {"home": h,
-            "vehicle": random.choice([Renault, Ford, Tesla, Nissan])()}
-            for h in sampled
-        ]
+    def _ev_coords(self):
+        """(lat, lon) arrays of the selected EVs' homes."""
+        return self.home_lat[self.ev_home], self.home_lon[self.ev_home]
 
     def run_optimization(self):
-        if not self.home_poi or not self.station_candidates:
+        if not len(self.home_lat) or not self.station_candidates:
             messagebox.showinfo("Info", "Add home and station candidate points.")
             return
 
         method  = self.method_combo.get()
         evr     = self.ev_rate_var.get()
+        if method in ("Docplex MIP", "Benders Decomposition") and not self._check_backend():
+            return
 
         self.ensure_selected_homes(evr, seed=SEED_CONST)
 
-        self.generate_daily_trips()
-        self.build_edge_counts() 
+        # Yolculuklar ve kenar sayımları EV seçimi değişmedikçe korunur;
+        # aday ekleme/çıkarma sonrası yalnızca model güncellenir.
+        if not getattr(self, "trip_log", None):
+            self.generate_daily_trips()
+            self.build_edge_counts()
 
         for rec in self.trip_log:
             print(rec)
@@ -818,18 +3846,149 @@ class ChargingStationOptimizer:
 
         if method == "Docplex MIP":
             target = self._solve_model
+        elif method == "Lagrangian Relaxation":
+            target = self._solve_lagrangian
+        elif method == "Benders Decomposition":
+            target = self._solve_benders
         else:                                       # GA
             target = self._solve_ga
 
         max_st  = self.max_st_var.get()
         capacity= self.capacity_var.get()
         radius  = self.radius_var.get()
+        self.alternatives = []
 
         self.status_var.set("Building & solving model...")
         threading.Thread(target=target,
                         args=(max_st, evr, capacity, radius),
                         daemon=True).start()
 
+    def _check_backend(self):
+        """Shows an error and returns False when the selected MIP backend is not installed."""
+        backend = self.backend_combo.get()
+        if backend_available(backend):
+            return True
+        messagebox.showerror("Solver not available",
+                             f"The '{backend}' backend requires the "
+                             f"'{_BACKEND_MODULE[backend]}' package. "
+                             "Install it or choose another backend.")
+        return False
+
+    def run_ensemble(self):
+        """Monte Carlo ensemble: R replications with different seeds in a process pool."""
+        if not len(self.home_lat) or not self.station_candidates:
+            messagebox.showinfo("Info", "Add home and station candidate points.")
+            return
+
+        method = self.method_combo.get()
+        if method in ("Docplex MIP", "Benders Decomposition") and not self._check_backend():
+            return
+        radius = self.radius_var.get()
+        reps   = self.reps_var.get()
+        lat, lon = self.home_lat, self.home_lon
+        c_lat = np.array([c['lat'] for c in self.station_candidates])
+        c_lon = np.array([c['lon'] for c in self.station_candidates])
+        st_pair = haversine_matrix(c_lat, c_lon, c_lat, c_lon) * 1000     # m
+        J = range(len(self.station_candidates))
+
+        shared = {
+            "lat": lat, "lon": lon,
+            "hc_km": haversine_matrix(lat, lon, c_lat, c_lon),
+            "consumption": VEHICLE_CATALOG.consumption_rate,
+            "share": VEHICLE_CATALOG.share,
+            "fixed": [POI_FIXED_COST[c['poi']] for c in self.station_candidates],
+            "conflicts": [(j, k) for j in J for k in J if j < k and st_pair[j, k] < radius],
+            "st_pair": st_pair.tolist(),
+            "evr": self.ev_rate_var.get(),
+            "capacity": self.capacity_var.get(),
+            "max_st": self.max_st_var.get(),
+            "radius": radius,
+            "method": method,
+            "backend": self.backend_combo.get(),
+        }
+        seeds = [SEED_CONST + r for r in range(reps)]
+
+        self.ensemble_results = []
+        self.ensemble_total = reps
+        self._open_ensemble_window()
+
+        def work():
+            try:
+                for res in run_ensemble(shared, seeds):
+                    self.ensemble_results.append(res)
+                    self.root.after(0, self._update_ensemble_window)
+                self.status_var.set(f"Ensemble completed ({reps} replications).")
+            except Exception as e:
+                self.status_var.set(f"Ensemble failed: {e}")
+
+        self.status_var.set(f"Running ensemble of {reps} replications ({method})...")
+        threading.Thread(target=work, daemon=True).start()
+
+    def _open_ensemble_window(self):
+        win = tk.Toplevel(self.root)
+        win.title("Results – Monte Carlo Ensemble")
+        win.geometry("650x520")
+
+        frm = tb.Frame(win, padding=10, bootstyle="dark")
+        frm.pack(fill=BOTH, expand=YES)
+
+        stats = tb.LabelFrame(frm, text="Ensemble Statistics", bootstyle="primary")
+        stats.pack(fill=X, pady=(0, 10))
+        self._ens_vars = {}
+        for lbl in ("Replications", "Infeasible", "Objective mean ± std (k€)",
+                    "Objective min / P50 / max (k€)", "Daily demand mean ± std (kWh)",
+                    "Daily demand min / max (kWh)"):
+            row = tb.Frame(stats)
+            row.pack(fill=X, pady=2)
+            var = tk.StringVar(master=win, value="-")
+            self._ens_vars[lbl] = var
+            tb.Label(row, text=lbl, font=("Segoe UI", 9, "bold")).pack(side=LEFT)
+            tb.Label(row, textvariable=var, font=("Segoe UI", 9)).pack(side=RIGHT)
+
+        cf = tb.LabelFrame(frm, text="Candidate Selection Frequency", bootstyle="info")
+        cf.pack(fill=BOTH, expand=YES)
+        cols = ("S-ID", "POI", "Selected", "Frequency")
+        self._ens_tree = ttk.Treeview(cf, columns=cols, show='headings', height=10)
+        for c in cols:
+            self._ens_tree.heading(c, text=c)
+            self._ens_tree.column(c, anchor=CENTER)
+        self._ens_tree.pack(fill=BOTH, expand=YES)
+
+        tb.Button(frm, text="Close", bootstyle="danger",
+                  command=win.destroy).pack(side=RIGHT, pady=(5, 0))
+        self._ens_win = win
+
+    def _update_ensemble_window(self):
+        if not self._ens_win.winfo_exists():
+            return
+        res  = self.ensemble_results
+        ok   = [r for r in res if r["open"] is not None]
+        dem  = np.array([r["demand"] for r in res])
+
+        v = self._ens_vars
+        v["Replications"].set(f"{len(res)} / {self.ensemble_total}")
+        v["Infeasible"].set(str(len(res) - len(ok)))
+        if ok:
+            objs = np.array([r["obj"] for r in ok])
+            v["Objective mean ± std (k€)"].set(f"{objs.mean():.2f} ± {objs.std():.2f}")
+            v["Objective min / P50 / max (k€)"].set(
+                f"{objs.min():.2f} / {np.median(objs):.2f} / {objs.max():.2f}")
+        else:
+            for k in ("Objective mean ± std (k€)", "Objective min / P50 / max (k€)"):
+                v[k].set("no feasible replications")
+        v["Daily demand mean ± std (kWh)"].set(f"{dem.mean():.1f} ± {dem.std():.1f}")
+        v["Daily demand min / max (kWh)"].set(f"{dem.min():.1f} / {dem.max():.1f}")
+
+        counts = np.zeros(len(self.station_candidates), dtype=int)
+        for r in ok:
+            counts[r["open"]] += 1
+        self._ens_tree.delete(*self._ens_tree.get_children())
+        for j in np.argsort(-counts, kind="stable"):
+            c = self.station_candidates[j]
+            self._ens_tree.insert('', 'end', values=(
+                c['tag'], c['poi'], int(counts[j]),
+                f"{counts[j] / max(len(ok), 1) * 100:.0f}%"))
+
     def build_heatmap(self):
         """
         edge_freq’e bakarak haritada renkli çizgiler oluşturur.
@@ -839,43 +3998,97 @@ class ChargingStationOptimizer:
             messagebox.showinfo("Info", "Run the optimization first to generate trips.")
             return
 
-        # yoğunluk aralıklarını belirle
-        max_cnt = max(self.edge_freq.values())
-        def edge_color(cnt):
-            ratio = cnt / max_cnt
-            if ratio > 0.75:  return "#dc3545"   # kırmızı
-            if ratio > 0.50:  return "#fd7e14"   # turuncu
-            if ratio > 0.25:  return "#ffc107"   # sarı
-            return "#28a745"                    # yeşil
-
-        # Önce eski heat-map çizgilerini temizleyelim (varsa)
-        if hasattr(self, "_heat_lines"):
-            for line in self._heat_lines:
-                line.delete()
-        self._heat_lines = []
-
-        # Her segment için map’te polyline
-        for (a, b), cnt in self.edge_freq.items():
-            line = self.map_widget.set_path([a, b], color=edge_color(cnt), width=4, name="heat")
-            self._heat_lines.append(line)
-
-        self.status_var.set("Heat-map drawn (green → red)")
-
-    def divert_to_charger(self, home):
-        min_dist = float('inf'); nearest=None
-        for c in self.station_candidates:
-            d = road_distance_km(home['lat'], home['lon'], c['lat'], c['lon'])
-            if d < min_dist:
-                min_dist = d; nearest=c
-        return nearest
+        # tek raster katman; yakınlaştırma başına önbelleklenir
+        t0 = time.perf_counter()
+        self.heat_overlay.set_edges(self.edge_freq, getattr(self, "edge_lod", None))
+
+        self.status_var.set(f"Heat-map drawn (green → red): {len(self.edge_freq)} segments "
+                            f"in {time.perf_counter() - t0:.2f} s")
+
+    def simulate_day(self):
+        """Runs the discrete-event charging simulation for the current solution."""
+        if not getattr(self, "trip_log", None) or not self.selected_stations:
+            messagebox.showinfo("Info", "Run the optimization first to generate trips and stations.")
+            return
+
+        # trip_log → düz diziler (EV ve yolculuk sırasına göre zaten sıralı)
+        ev_idx  = [int(r["ev_id"][1:]) - 1 for r in self.trip_log]
+        trip_km = [r["dist_km"] for r in self.trip_log]
+        dest_lat = np.array([r["dest"][0] for r in self.trip_log])
+        dest_lon = np.array([r["dest"][1] for r in self.trip_log])
+        fleet = self.fleet
+        stations = self.selected_stations
+
+        def work():
+            rep = simulate_charging_day(
+                ev_idx, trip_km, dest_lat, dest_lon,
+                fleet.battery_capacity, fleet.charge_rate, fleet.consumption_rate,
+                [s["lat"] for s in stations], [s["lon"] for s in stations],
+                [CHARGERS_PER_STATION[s["poi"]] for s in stations])
+            self.sim_report = rep
+            self.root.after(0, self._show_sim_report)
+            self.status_var.set(f"Simulation completed: service level "
+                                f"{rep['service_level']*100:.1f}%")
+
+        self.status_var.set("Simulating 24 h of trips and charging queues...")
+        threading.Thread(target=work, daemon=True).start()
+
+    def _show_sim_report(self):
+        rep = self.sim_report
+        win = tk.Toplevel(self.root)
+        win.title("Daily Charging Simulation")
+        win.geometry("600x420")
+
+        frm = tb.Frame(win, padding=10, bootstyle="dark")
+        frm.pack(fill=BOTH, expand=YES)
 
-    def debug_od(self, selected_homes, station_candidates, d_mat, export_csv=False):
+        kpi = tb.LabelFrame(frm, text="Service Level", bootstyle="info")
+        kpi.pack(fill=X, pady=(0, 10))
+        for lbl, val in [("EVs / Trips", f"{rep['n_ev']} / {rep['n_trips']}"),
+                         ("Charging requests", rep["requests"]),
+                         (f"Served within {SIM_MAX_WAIT_MIN} min",
+                          f"{rep['service_level']*100:.1f}%"),
+                         ("Mean / P95 / Max wait (min)",
+                          f"{rep['mean_wait_min']:.1f} / {rep['p95_wait_min']:.1f} / "
+                          f"{rep['max_wait_min']:.1f}"),
+                         ("Stranded EVs", rep["stranded"])]:
+            row = tb.Frame(kpi)
+            row.pack(fill=X, pady=2)
+            tb.Label(row, text=lbl, font=("Segoe UI", 9, "bold")).pack(side=LEFT)
+            tb.Label(row, text=str(val), font=("Segoe UI", 9)).pack(side=RIGHT)
+
+        sf = tb.LabelFrame(frm, text="Station Occupancy", bootstyle="warning")
+        sf.pack(fill=BOTH, expand=YES)
+        cols = ("S-ID", "Chargers", "Sessions", "Max Queue", "Energy (kWh)", "Utilization")
+        tree = ttk.Treeview(sf, columns=cols, show='headings', height=8)
+        for c in cols:
+            tree.heading(c, text=c)
+            tree.column(c, anchor=CENTER, width=90)
+        tree.pack(fill=BOTH, expand=YES)
+        for s, st in zip(self.selected_stations, rep["stations"]):
+            tree.insert('', 'end', values=(
+                s['tag'], CHARGERS_PER_STATION[s['poi']], st['sessions'],
+                st['max_queue'], st['energy_kwh'], f"{st['utilization']*100:.1f}%"))
+
+        tb.Button(frm, text="Close", bootstyle="danger",
+                  command=win.destroy).pack(side=RIGHT, pady=(5, 0))
+
+    def divert_to_charger(self, points):
+        """En yakın (yol km) istasyon adayı, her (lat, lon) noktası için;
+        tüm nokta × aday çiftleri tek routes() çağrısıyla getirilir."""
+        cands = [(c, (c['lat'], c['lon'])) for c in self.station_candidates]
+        if not points or not cands:
+            return [None] * len(points)
+        routes = self.route_cache.routes([(p, q) for p in points for _, q in cands])
+        return [min(cands, key=lambda cq: routes[(p, cq[1])][0])[0] for p in points]
+
+    def debug_od(self, ev_home, station_candidates, d_mat, export_csv=False):
             """
             Seçilen EV-ler ile istasyon adayları arasındaki mesafeleri
             ve enerji/SOC tablolarını terminale (ve opsiyonel CSV’ye) döker.
             """
             import csv, pprint, time
-            I = range(len(selected_homes))
+            I = range(len(ev_home))
             J = range(len(station_candidates))
 
             print("\n----- OD DISTANCE MATRIX (km) -----")
@@ -894,16 +4107,20 @@ class ChargingStationOptimizer:
 
 
             # enerji & SOC ayrıntısı (isteğe bağlı)
+            fleet = self.fleet
+            d_arr = np.asarray(d_mat, dtype=float).reshape(len(I), len(J))
+            cons  = np.round(d_arr * fleet.consumption_rate[:, None], 2)
+            rem   = np.round(fleet.battery_capacity[:, None] - cons, 2)
+            dist  = np.round(d_arr, 2)
+            brand = fleet.brand
             table = []
-            for i, sh in enumerate(selected_homes):
-                v  = sh['vehicle']
-                row = {"EV": f"E{i+1:02d}", "Brand": v.brand,
-                    "Batt(kWh)": v.battery_capacity}
-                for j, (sc, dist) in enumerate(zip(station_candidates, d_mat[i])):
-                    cons = round(dist * v.consumption_rate, 2)
-                    row[f"{sc['tag']} dist(km)"] = round(dist, 2)
-                    row[f"{sc['tag']} cons(kWh)"] = cons
-                    row[f"{sc['tag']} remSOC"]    = round(v.battery_capacity - cons, 2)
+            for i in I:
+                row = {"EV": f"E{i+1:02d}", "Brand": brand[i],
+                    "Batt(kWh)": fleet.battery_capacity[i]}
+                for j, sc in enumerate(station_candidates):
+                    row[f"{sc['tag']} dist(km)"] = dist[i, j]
+                    row[f"{sc['tag']} cons(kWh)"] = cons[i, j]
+                    row[f"{sc['tag']} remSOC"]    = rem[i, j]
                 table.append(row)
 
             pprint.pprint(table, width=150)
@@ -915,94 +4132,262 @@ class ChargingStationOptimizer:
                     w.writeheader(); w.writerows(table)
                 print(f"... detailed table written to file '{fn}'.")
             
-    def _solve_model(self, max_st, evr, capacity, radius):
-        # 1) EV/araç örneklemesi gerekiyorsa yap
-        if not self.selected_homes:
-            self.ensure_selected_homes(evr)
-
-        # ------------------------------------------------------------
-        # 2) Artık self.selected_homes DOLU –> doğrudan kullanabiliriz
-        I = list(range(len(self.selected_homes)))
-        J = list(range(len(self.station_candidates)))
-
-        # === Trip-based daily energy demand =================================
+    def _trip_demand(self):
+        """D[i] = kWh EV i consumes over the day's trips (shared by MIP and GA)."""
         # Eğer henüz trip üretmemişsek güvenlik amaçlı hemen üret
         if not getattr(self, "trip_log", []):
             self.generate_daily_trips()
 
         # D[i]  =  o EV’nin gün boyu tükettiği toplam kWh
-        D = [0.0] * len(self.selected_homes)
+        D = [0.0] * len(self.ev_home)
         for rec in self.trip_log:
             ev_idx = int(rec["ev_id"][1:]) - 1          # "E01" → 0
             D[ev_idx] += rec["cons_kwh"]
+        return D
+
+    def _dist_store(self):
+        """DistanceStore of the current EV sample (reopened when the sample changes)."""
+        lat, lon = self._ev_coords()
+        if self.dist_store is None or self.dist_store.key != DistanceStore.key_for(lat, lon):
+            self.dist_store = DistanceStore(lat, lon)
+        return self.dist_store
+
+    def _distance_matrix(self):
+        """EV × candidate road distances (km), read from the on-disk distance store."""
+        if not self.station_candidates or not len(self.ev_home):
+            return np.zeros((len(self.ev_home), len(self.station_candidates)), dtype=np.float32)
+        store = self._dist_store()
+        return store.matrix(store.columns([(c['lat'], c['lon']) for c in self.station_candidates]))
+
+    def _pair_road_km(self, c, other_id):
+        """Cached road distance between candidate c and candidate id other_id."""
+        key = tuple(sorted((c['id'], other_id)))
+        if key not in self._pair_km:
+            o = next(s for s in self.station_candidates if s['id'] == other_id)
+            self._pair_km[key] = road_distance_km(c['lat'], c['lon'], o['lat'], o['lon'])
+        return self._pair_km[key]
+
+    def _conflict_pairs(self, radius):
+        """Candidate id pairs closer than the minimum radius (m)."""
+        cands = self.station_candidates
+        return [(a['id'], b['id'])
+                for j, a in enumerate(cands) for b in cands[j + 1:]
+                if self._pair_road_km(a, b['id']) * 1000 < radius]
+
+    def _presolve(self, D, d, fixed, capacity, max_st, conflicts):
+        """Runs presolve_candidates and keeps its report for the results window."""
+        t0 = time.perf_counter()
+        keep, must_open, rep = presolve_candidates(D, d, fixed, capacity, max_st, conflicts)
+        rep["presolve_s"] = time.perf_counter() - t0
+        self.presolve_report = rep
+        self.status_var.set(f"Presolve: removed {rep['n_removed']}/{rep['n_cand']} candidates, "
+                            f"fixed {rep['n_fixed_open']} open ({rep['presolve_s']:.3f} s)")
+        return keep, must_open
+
+    def _record_timing(self, method, key, build_s, solve_s):
+        """Build/solve wall times per scenario, with and without presolve, for the speedup report."""
+        reduced = self.presolve_var.get()
+        self._timings[(method, key, reduced)] = (build_s, solve_s)
+        rep = getattr(self, "presolve_report", None)
+        if reduced and rep is not None:
+            rep["build_s"], rep["solve_s"] = build_s, solve_s
+            rep["baseline"] = self._timings.get((method, key, False))
+
+    def _solve_aggregated(self, D, d, fixed, capacity, max_st, radius, backend="CPLEX",
+                          cands=None, must_open=()):
+        """Grid-aggregated solve; keeps the aggregation report for the results window."""
+        cands = self.station_candidates if cands is None else cands
+        lat, lon = self._ev_coords()
+        labels, point_D = aggregate_demand(lat, lon, D, capacity)
+        pos = {c['id']: j for j, c in enumerate(cands)}
+        conflicts = [(pos[a], pos[b]) for a, b in self._conflict_pairs(radius)
+                     if a in pos and b in pos]
+        res, rep = solve_aggregated(D, d, labels, point_D, fixed, capacity, max_st,
+                                    conflicts, backend=backend, must_open=must_open)
+        if rep:
+            self.agg_report = rep
+            self.status_var.set(f"Aggregation: {rep['n_ev']} EVs → {rep['n_points']} demand points, "
+                                f"gap to full-model bound {rep['gap'] * 100:.2f}%")
+        return res
+
+    def export_model(self):
+        """Writes the current scenario's MIP as an LP or MPS file for offline solving."""
+        if not len(self.ev_home) or not self.station_candidates:
+            messagebox.showinfo("Info", "Run the optimization first to select EVs.")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Export Model",
+            defaultextension=".lp",
+            filetypes=[("CPLEX LP", "*.lp"), ("Free MPS", "*.mps")]
+        )
+        if not path:
+            return
 
-        print(f"[Trip-based demand] Total of {sum(r['cons_kwh'] for r in self.trip_log):.2f} kWh "
-              f"from {len(self.trip_log)} trips")                # DEBUG satırı
-        # ====================================================================
+        def work():
+            try:
+                pos = {c['id']: j for j, c in enumerate(self.station_candidates)}
+                spec = build_location_spec(
+                    self._trip_demand(), self._distance_matrix(),
+                    [POI_FIXED_COST[c['poi']] for c in self.station_candidates],
+                    self.capacity_var.get(), self.max_st_var.get(),
+                    [(pos[a], pos[b]) for a, b in self._conflict_pairs(self.radius_var.get())])
+                (write_mps if path.lower().endswith(".mps") else write_lp)(spec, path)
+                self.status_var.set(f"Model written to {os.path.basename(path)} "
+                                    f"({spec.n_vars} vars, {spec.n_rows} rows)")
+            except Exception as e:
+                self.status_var.set(f"Model export failed: {e}")
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _publish_solution(self, method, open_idx, assign, obj, lower_bound=None, d=None):
+        """Freezes a solver result into self.solution and the selected-station list."""
+        d = self._distance_matrix() if d is None else d
+        sol = LocationSolution.build(
+            method, obj, open_idx, assign, d,
+            self.fleet.consumption_rate,
+            [c['poi'] for c in self.station_candidates], lower_bound)
+        self.solution = sol
+        self.selected_stations = [
+            { 'id': pt['id'], 'lat': pt['lat'], 'lon': pt['lon'], 'poi': pt['poi'],
+            'type': pt['poi'], 'tag': pt.get('tag', f"S{pt.get('id', j+1):02d}-{pt['poi']}") }
+            for j, pt in ((j, self.station_candidates[j]) for j in sol.open_idx)
+        ]
+        self.solution_obj = self.solution.obj
+        self.solution_bound = lower_bound
+        return self.solution
+
+    @staticmethod
+    def _scenario_hash(D, d, *params):
+        """Stable digest of the demand, distances and model parameters."""
+        h = hashlib.sha1(np.asarray(D, dtype=float).tobytes())
+        # aday-majör float32: depodan gelen görünümde kopya yok
+        h.update(np.ascontiguousarray(np.asarray(d).T, dtype=np.float32))
+        h.update(repr(params).encode())
+        return h.hexdigest()
+
+    def apply_alternative(self, rank):
+        """Shows the rank-th pooled station set on the map (no re-solve, no OSRM)."""
+        if rank >= len(self.alternatives):      # adaylar değişti → havuz temizlendi
+            self.status_var.set("Alternatives are out of date; run the optimization again.")
+            return
+        alt = self.alternatives[rank]
+        pos = {c['id']: j for j, c in enumerate(self.station_candidates)}
+        self._publish_solution("Docplex MIP", [pos[cid] for cid in alt['open']],
+                               [pos[cid] for cid in alt['assign']], alt['obj'], d=self._alt_d)
+        self._update_markers()
+        self.status_var.set(f"Showing alternative #{rank + 1}: {alt['obj']:.2f} k€")
 
-        # Mesafe matrisi
-        d = [[road_distance_km(self.selected_homes[i]['home']['lat'],
-                            self.selected_homes[i]['home']['lon'],
-                            self.station_candidates[j]['lat'],
-                            self.station_candidates[j]['lon'])
-            for j in J] for i in I]
+    def _solve_model(self, max_st, evr, capacity, radius):
+        # 1) EV/araç örneklemesi gerekiyorsa yap
+        if not len(self.ev_home):
+            self.ensure_selected_homes(evr)
 
-        self.debug_od(self.selected_homes, self.station_candidates, d)
-        
-        # --- Docplex modeli -------------------------------------------------
-        m = Model(name="ev_location_extended")
-        x = {j: m.binary_var(name=f"x_{j}") for j in J}
-        y = {(i, j): m.binary_var(name=f"y_{i}_{j}") for i in I for j in J}
+        # ------------------------------------------------------------
+        # 2) Artık self.ev_home DOLU –> doğrudan kullanabiliriz
 
-        m.minimize(
-            m.sum(POI_FIXED_COST[self.station_candidates[j]['poi']] * x[j] for j in J) +
-            m.sum(D[i] * d[i][j] * y[i, j] for i in I for j in J)
-        )
+        # === Trip-based daily energy demand =================================
+        D = self._trip_demand()
+        # ====================================================================
 
-        for i in I:
-            m.add_constraint(m.sum(y[i, j] for j in J) == 1)
-            for j in J:
-                m.add_constraint(y[i, j] <= x[j])
-        for j in J:
-            m.add_constraint(
-                m.sum(D[i] * y[i, j] for i in I) <= capacity * x[j]
-            )
-        for j in J:
-            for k2 in range(j + 1, len(J)):
-                if road_distance_km(self.station_candidates[j]['lat'], self.station_candidates[j]['lon'],
-                             self.station_candidates[k2]['lat'], self.station_candidates[k2]['lon']) * 1000 < radius:
-                    m.add_constraint(x[j] + x[k2] <= 1)
-        m.add_constraint(m.sum(x[j] for j in J) <= max_st)
-
-        sol = m.solve(log_output=False)
-        if not sol:
-            self.status_var.set("Model çözülemedi.")
+        # Mesafe matrisi (aday başına sütun önbelleği)
+        d = d_all = self._distance_matrix()
+
+        self.debug_od(self.ev_home, self.station_candidates, d)
+
+        # --- Aday ön işlemi (baskın adaylar çıkar, gerekli olanlar açık sabitlenir)
+        cands = self.station_candidates
+        fixed = [POI_FIXED_COST[c['poi']] for c in cands]
+        self.presolve_report = None
+        must_ids = set()
+        if self.presolve_var.get():
+            pos = {c['id']: j for j, c in enumerate(cands)}
+            keep, must_open = self._presolve(
+                D, d, fixed, capacity, max_st,
+                [(pos[a], pos[b]) for a, b in self._conflict_pairs(radius)])
+            must_ids = {cands[j]['id'] for j in must_open}
+            cands, d, fixed = [cands[j] for j in keep], d[:, keep], [fixed[j] for j in keep]
+
+        # --- Docplex modeli (canlı; yalnızca değişen adaylar eklenir/çıkarılır)
+        ids   = [c['id'] for c in cands]
+        key   = (tuple(D), capacity, max_st, radius)
+        eng   = self._mip_engine
+        self.agg_report = None
+        aggregate = self.aggregate_var.get()
+        backend   = self.backend_combo.get()
+        k_best    = 1 if aggregate else self.kbest_var.get()
+        scen      = (self._scenario_hash(D, d, ids, fixed, capacity, max_st, radius,
+                                         sorted(must_ids), backend), k_best)
+        cached = k_best > 1 and scen in self._pool_cache
+        t0 = time.perf_counter()
+        t_build = None
+        if cached:
+            pool = self._pool_cache[scen]           # aynı senaryo: yeniden çözme yok
+        elif aggregate or backend != "CPLEX" or Model is None:
+            pos = {cid: j for j, cid in enumerate(ids)}
+            must_open = [pos[cid] for cid in must_ids]
+            if aggregate:
+                res = self._solve_aggregated(D, d, fixed, capacity, max_st, radius,
+                                             backend, cands=cands, must_open=must_open)
+                pool = [res] if res else []
+            else:
+                # matris biçimli model, açık kaynak arka uç
+                conflicts = [(pos[a], pos[b]) for a, b in self._conflict_pairs(radius)
+                             if a in pos and b in pos]
+                pool = location_pool(D, d, fixed, capacity, max_st, conflicts, k_best,
+                                     backend=backend, must_open=must_open)
+            for r in pool:
+                r['open']   = [ids[j] for j in r['open']]
+                r['assign'] = [ids[j] for j in r['assign']]
+        else:
+            if eng is None or self._mip_engine_key != key:
+                eng = IncrementalLocationMIP(D, capacity, max_st)
+                eng.build(ids, fixed, d, [(a, b) for a, b in self._conflict_pairs(radius)
+                                          if a in ids and b in ids])
+                self._mip_engine, self._mip_engine_key = eng, key
+            else:
+                for cid in eng.active - set(ids):
+                    eng.remove_candidate(cid)
+                for j, c in enumerate(cands):
+                    if c['id'] not in eng.active:
+                        eng.add_candidate(c['id'], fixed[j], d[:, j],
+                                          [o for o in eng.active
+                                           if self._pair_road_km(c, o) * 1000 < radius])
+            eng.fix_open(must_ids)
+            t_build = time.perf_counter() - t0
+            pool = eng.solve_pool(k_best) if k_best > 1 else [r for r in [eng.solve()] if r]
+        elapsed = time.perf_counter() - t0
+        if not cached:
+            self._record_timing("MIP", (key, tuple(c['id'] for c in self.station_candidates),
+                                        aggregate, backend, k_best),
+                                t_build, elapsed - (t_build or 0.0))
+            if k_best > 1:
+                self._pool_cache[scen] = pool
+        self.alternatives = pool if len(pool) > 1 else []
+        self._alt_d = d_all
+        if not pool:
+            # gruplar bölünemez: kümelenmiş model, EV düzeyinde uygun olsa da çözümsüz kalabilir
+            self.status_var.set("Model çözülemedi." + (" Disable demand aggregation and retry."
+                                                       if aggregate else ""))
             return
+        res = dict(pool[0])
 
-        # --- Çözüm listeleri ------------------------------------------------
-        self.selected_stations = [
-            {
-                'lat': pt['lat'],
-                'lon': pt['lon'],
-                'poi': pt['poi'],
-                'type': pt['poi'],
-                'tag': pt.get('tag', f"S{pt.get('id', j+1):02d}-{pt['poi']}")  # <-- EK
-            }
-            for j, pt in enumerate(self.station_candidates)
-            if x[j].solution_value > 0.5
-        ]
+        # anahtar (aday id) → güncel sıra indeksi
+        pos = {c['id']: j for j, c in enumerate(self.station_candidates)}
+        res['open']   = [pos[cid] for cid in res['open']]
+        res['assign'] = [pos[cid] for cid in res['assign']]
 
-        self.solution_obj = m.objective_value
+        # --- Çözüm nesnesi (atama, mesafe, enerji bir kez hesaplanır) ---------
+        self._publish_solution("Docplex MIP", res['open'], res['assign'], res['obj'],
+                               d=d_all)
 
         # --- DEBUG: Ayrıntılı terminal raporu ------------------------------
         print("\n=== Selected Homes & Vehicles ===")
-        for i, sh in enumerate(self.selected_homes, 1):
-            h, v = sh['home'], sh['vehicle']
-            hid  = h.get('id', '?')
+        for i, hidx in enumerate(self.ev_home.tolist(), 1):
+            hid, v = self.home_id[hidx], self.fleet.vehicle(i - 1)
             # bağlı istasyonu bul
-            sel_j = next(j for j in J if y[i-1, j].solution_value > 0.5)
+            sel_j = res['assign'][i-1]
             st_rec = self.station_candidates[sel_j]
-            print(f"E{i:02d} [H{hid:02d}]  ({h['lat']:.5f}, {h['lon']:.5f})  "
+            print(f"E{i:02d} [H{hid:02d}]  ({self.home_lat[hidx]:.5f}, {self.home_lon[hidx]:.5f})  "
                   f"-> {v.brand:<6} {v.battery_capacity:>3}kWh  "
                   f"[{st_rec['tag']}]")
 
@@ -1019,25 +4404,22 @@ class ChargingStationOptimizer:
     def _solve_ga(self, max_st, evr, capacity, radius,
                 pop_size=20, n_gen=15, cx_p=0.9, mut_p=0.1):
 
-        if not self.selected_homes:
+        if not len(self.ev_home):
             self.ensure_selected_homes(evr)
 
-        I = list(range(len(self.selected_homes)))
+        I = list(range(len(self.ev_home)))
         J = list(range(len(self.station_candidates)))
 
-        # ------------------------------------------------ 0) Talep
-        D = self._haversine_demand()          # len(I)
+        # ------------------------------------------------ 0) Talep (MIP ile aynı D_i)
+        D = self._trip_demand()
 
         # ------------------------------------------- 1) EV→istasyon mesafesi
-        d = [[road_distance_km(self.selected_homes[i]['home']['lat'],
-                            self.selected_homes[i]['home']['lon'],
-                            self.station_candidates[j]['lat'],
-                            self.station_candidates[j]['lon'])
-            for j in J] for i in I]
+        d = self._distance_matrix()
 
         # ------------------------------------------- 2) İstasyon–istasyon mesafesi (ÖNBELLEK)
-        if (not hasattr(self, "_st_pair_dist") or
-                len(self._st_pair_dist) != len(J)):           # boyut değiştiyse yeniden hesapla
+        ids = tuple(c['id'] for c in self.station_candidates)
+        if getattr(self, "_st_pair_ids", None) != ids:         # aday kümesi değiştiyse yeniden hesapla
+            self._st_pair_ids = ids
             self._st_pair_dist = [
                 [haversine(s1['lat'], s1['lon'], s2['lat'], s2['lon']) * 1000   # m
                 for s2 in self.station_candidates]
@@ -1045,83 +4427,38 @@ class ChargingStationOptimizer:
             ]
         st_pair = self._st_pair_dist   # kısaltma
 
-        # ------------------------------------------- GA yardımcıları
-        def random_chrom():
-            k_max = min(max_st, len(J))
-            k_open = random.randint(1, k_max)
-            ones = random.sample(J, k_open)
-            return [1 if j in ones else 0 for j in J]
-
-        def repair(ch):
-            """Açık istasyon sayısı > max_st ise rastgele kapat."""
-            ones = [j for j, v in enumerate(ch) if v]
-            while len(ones) > max_st:
-                ch[random.choice(ones)] = 0
-                ones = [j for j, v in enumerate(ch) if v]
-            return ch
-
-        def fitness(ch):
-            if sum(ch) == 0:
-                return 1e9
-
-            # 2.1 EV’ler en yakın açık istasyona atanıyor
-            travel = 0
-            for i in I:
-                best_j = min((j for j in J if ch[j]), key=lambda j: d[i][j])
-                travel += D[i] * d[i][best_j]
-
-            # 2.2 Sabit kurulum maliyeti
-            fixed = sum(POI_FIXED_COST[self.station_candidates[j]['poi']]
-                        for j, v in enumerate(ch) if v)
-
-            # 2.3 Radius ihlali CEZASI  (hav. + önbellek)
-            penalty = 0
-            open_idx = [j for j, v in enumerate(ch) if v]
-            for a, b in itertools.combinations(open_idx, 2):
-                if st_pair[a][b] < radius:          # metre cinsinden
-                    penalty += 1e5                  # büyük ceza
-
-            return fixed + travel + penalty
-
-        # ------------------------------------------- 3) GA döngüsü
-        pop  = [random_chrom() for _ in range(pop_size)]
-        best = min(pop, key=fitness)
-
-        for gen in range(n_gen):
-            new_pop = []
-            while len(new_pop) < pop_size:
-                p1, p2 = random.sample(pop, 2)
-
-                # --- Crossover
-                if random.random() < cx_p:
-                    cut = random.randint(1, len(J) - 2)
-                    child = repair(p1[:cut] + p2[cut:])
-                else:
-                    child = p1[:]
-
-                # --- Mutation
-                if random.random() < mut_p:
-                    m = random.randint(0, len(J) - 1)
-                    child[m] ^= 1
-                    child = repair(child)
-
-                new_pop.append(child)
-
-            # Elitizm
-            pop  = sorted(new_pop, key=fitness)[:pop_size - 1] + [best]
-            best = min(pop + [best], key=fitness)
-            print(f"[GA] gen {gen+1}/{n_gen}  best = {fitness(best):.2f}")
-
-        # ------------------------------------------- 4) Çözümü GUI’ye aktar
-        self.selected_stations = [
-            { 'lat': pt['lat'], 'lon': pt['lon'], 'poi': pt['poi'],
-            'type': pt['poi'], 'tag': pt['tag'] }
-            for j, pt in enumerate(self.station_candidates) if best[j]
-        ]
-        self.solution_obj = fitness(best)
+        # ------------------------------------------- 3) Ön işlem (GA'nın yarıçap kuralıyla)
+        fixed = [POI_FIXED_COST[c['poi']] for c in self.station_candidates]
+        keep, must_open = list(J), []
+        self.presolve_report = None
+        if self.presolve_var.get():
+            conflicts = [(a, b) for a, b in itertools.combinations(J, 2)
+                         if st_pair[a][b] < radius]
+            keep, must_open = self._presolve(D, d, fixed, capacity, max_st, conflicts)
+        sub = {j: k for k, j in enumerate(keep)}
+
+        # ------------------------------------------- 4) GA döngüsü
+        t0 = time.perf_counter()
+        best_sub, best_fit = ga_search(D, d[:, keep], [fixed[j] for j in keep],
+                                       [[st_pair[a][b] for b in keep] for a in keep],
+                                       max_st, radius, capacity,
+                                       pop_size=pop_size, n_gen=n_gen,
+                                       cx_p=cx_p, mut_p=mut_p,
+                                       must_open=[sub[j] for j in must_open])
+        best = [0] * len(J)
+        for k, j in enumerate(keep):
+            best[j] = best_sub[k]
+        self._record_timing("GA", (tuple(D), ids, capacity, max_st, radius),
+                            None, time.perf_counter() - t0)
+
+        # ------------------------------------------- 5) Çözümü GUI’ye aktar
+        open_idx = [j for j, v in enumerate(best) if v]
+        _, assign, _ = capacitated_assignment(D, d[:, open_idx], capacity)
+        self._publish_solution("Genetic Algorithm", open_idx,
+                               [open_idx[k] for k in assign], best_fit, d=d)
 
         # EV-istasyon mesafe raporu
-        self.debug_od(self.selected_homes,
+        self.debug_od(self.ev_home,
                     self.selected_stations,
                     [[d[i][j] for j in [k for k, v in enumerate(best) if v]]
                     for i in I])
@@ -1130,6 +4467,74 @@ class ChargingStationOptimizer:
         self.root.after(0, self.open_results_window)
         self.status_var.set("GA completed.")
 
+    def _solve_lagrangian(self, max_st, evr, capacity, radius, n_iter=300):
+        """Lagrangian relaxation: feasible cost and dual bound without CPLEX."""
+        if not len(self.ev_home):
+            self.ensure_selected_homes(evr)
+
+        D = self._trip_demand()
+        d = self._distance_matrix()
+        fixed = [POI_FIXED_COST[c['poi']] for c in self.station_candidates]
+        pos = {c['id']: j for j, c in enumerate(self.station_candidates)}
+        conflicts = [(pos[a], pos[b]) for a, b in self._conflict_pairs(radius)]
+
+        def progress(it, lb, ub):
+            if it % 10 == 0 or it == 1:
+                gap = (ub - lb) / abs(ub) * 100 if np.isfinite(ub) and ub else float("inf")
+                self.status_var.set(f"[LR] it {it}/{n_iter}  best = {ub:.2f}  "
+                                    f"bound = {lb:.2f}  gap = {gap:.2f}%")
+
+        res = lagrangian_solve(D, d, fixed, capacity, max_st, conflicts,
+                               n_iter=n_iter, progress=progress)
+        if res["obj"] is None:
+            self.status_var.set("Lagrangian relaxation found no feasible station set.")
+            return
+
+        self._publish_solution("Lagrangian Relaxation", res["open"], res["assign"],
+                               res["obj"], res["lower_bound"], d=d)
+
+        self.root.after(0, self._update_markers)
+        self.root.after(0, self.open_results_window)
+        self.status_var.set(f"Lagrangian relaxation completed: {res['obj']:.2f} k€ "
+                            f"(lower bound {res['lower_bound']:.2f})")
+
+    def _solve_benders(self, max_st, evr, capacity, radius, max_iter=100):
+        """Benders decomposition: master over x, transportation cuts from worker processes."""
+        if not len(self.ev_home):
+            self.ensure_selected_homes(evr)
+
+        D = self._trip_demand()
+        d = self._distance_matrix()
+        fixed = [POI_FIXED_COST[c['poi']] for c in self.station_candidates]
+        pos = {c['id']: j for j, c in enumerate(self.station_candidates)}
+        conflicts = [(pos[a], pos[b]) for a, b in self._conflict_pairs(radius)]
+
+        def progress(it, lb, ub):
+            gap = (ub - lb) / abs(ub) * 100 if np.isfinite(ub) and ub else float("inf")
+            self.status_var.set(f"[Benders] it {it}/{max_iter}  best = {ub:.2f}  "
+                                f"bound = {lb:.2f}  gap = {gap:.2f}%")
+
+        try:
+            res = benders_solve(D, d, fixed, capacity, max_st, conflicts,
+                                backend=self.backend_combo.get(), max_iter=max_iter,
+                                progress=progress)
+        except Exception as e:
+            self.status_var.set(f"Benders decomposition failed: {e}")
+            return
+        if res is None:
+            self.status_var.set("Benders decomposition found no feasible station set "
+                                "with single-station assignments.")
+            return
+
+        self._publish_solution("Benders Decomposition", res["open"], res["assign"],
+                               res["obj"], res["lower_bound"], d=d)
+
+        self.root.after(0, self._update_markers)
+        self.root.after(0, self.open_results_window)
+        self.status_var.set(f"Benders completed in {res['iterations']} iterations: "
+                            f"{res['obj']:.2f} k€ (lower bound {res['lower_bound']:.2f}, "
+                            f"gap {res['gap'] * 100:.2f}%)")
+
     def open_results_window(self):
         win = tk.Toplevel(self.root)
         win.title("Results and Graphs")
@@ -1144,61 +4549,37 @@ class ChargingStationOptimizer:
         sf = tb.LabelFrame(frm, text="Selected Stations", bootstyle="info")
         sf.pack(fill=X, pady=(0,10))
         
-        # Add a scrollbar for the station list
-        station_frame = tb.Frame(sf)
-        station_frame.pack(fill=X, expand=YES)
-        
-        scols = ("#", "S-ID", "POI", "Lat", "Lon")
-        stree = ttk.Treeview(station_frame, columns=scols, show='headings', height=5)
-        for c in scols:
-            stree.heading(c, text=c)
-            stree.column(c, anchor=CENTER)
-
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(station_frame, orient="vertical", command=stree.yview)
-        scrollbar.pack(side=RIGHT, fill=Y)
-        stree.configure(yscrollcommand=scrollbar.set)
-        stree.pack(side=LEFT, fill=X, expand=YES)
-
-        for i, s in enumerate(self.selected_stations, 1):
-            stree.insert('', 'end', values=(
-                i,               # sıra numarası
-                s['tag'],        # S-ID  ->  S01-Home, S02-Parking ...
-                s['poi'],        # POI   ->  Home / Parking / Fuel
-                f"{s['lat']:.5f}",
-                f"{s['lon']:.5f}"
-            ))
+        st = self.selected_stations
+        VirtualTable(sf, [
+            ("#",    np.arange(1, len(st) + 1)),
+            ("S-ID", [s['tag'] for s in st]),           # S01-Home, S02-Parking ...
+            ("POI",  [s['poi'] for s in st]),           # Home / Parking / Fuel
+            ("Lat",  [s['lat'] for s in st], "{:.5f}".format),
+            ("Lon",  [s['lon'] for s in st], "{:.5f}".format),
+        ], height=5).pack(fill=X, expand=YES)
 
         # -------- Selected Homes & Vehicles -------------------------
         hf = tb.LabelFrame(frm, text="Selected Homes", bootstyle="success")
         hf.pack(fill=X, pady=(0,10))
-        
-        home_frame = tb.Frame(hf)
-        home_frame.pack(fill=X, expand=YES)
-        
-        hcols = ("#", "H-ID", "Lat", "Lon", "Vehicle", "Batt (kWh)", "Charge (kW)")
-        htree = ttk.Treeview(home_frame, columns=hcols, show='headings', height=6)
-        for c in hcols:
-            htree.heading(c, text=c)
-            htree.column(c, anchor=CENTER)
-
-        # Add scrollbar
-        hscrollbar = ttk.Scrollbar(home_frame, orient="vertical", command=htree.yview)
-        hscrollbar.pack(side=RIGHT, fill=Y)
-        htree.configure(yscrollcommand=hscrollbar.set)
-        htree.pack(side=LEFT, fill=X, expand=YES)
-
-        for i, sh in enumerate(self.selected_homes, 1):
-            h, v = sh['home'], sh['vehicle']
-            htree.insert('', 'end', values=(
-                i,                              # sıra #
-                h.get('id', '?'),               # H-ID
-                f"{h['lat']:.5f}",              # Lat
-                f"{h['lon']:.5f}",              # Lon
-                v.brand,                        # Vehicle
-                v.battery_capacity,             # Batt
-                v.charge_rate                   # Charge
-            ))
+
+        # Sütun dizileri bir kez kurulur; tablo yalnızca görünen satırları yazar
+        homes = self.ev_home
+        sol = self.solution
+        tags = np.array([c['tag'] for c in self.station_candidates] or [""])
+        blank = np.full(len(homes), np.nan)
+        hcols = [
+            ("#",            np.arange(1, len(homes) + 1)),
+            ("H-ID",         homes + 1),
+            ("Lat",          self.home_lat[homes], "{:.5f}".format),
+            ("Lon",          self.home_lon[homes], "{:.5f}".format),
+            ("Vehicle",      self.fleet.brand),
+            ("Batt (kWh)",   self.fleet.battery_capacity),
+            ("Charge (kW)",  self.fleet.charge_rate),
+            ("Station",      tags[sol.assign] if sol else np.full(len(homes), "")),
+            ("Dist (km)",    sol.dist_km if sol else blank, "{:.2f}".format),
+            ("Energy (kWh)", sol.energy_kwh if sol else blank, "{:.2f}".format),
+        ]
+        VirtualTable(hf, hcols, height=6).pack(fill=X, expand=YES)
 
         # Create a two-column layout for model info and summary
         info_frame = tb.Frame(frm)
@@ -1214,25 +4595,44 @@ class ChargingStationOptimizer:
                  font=("Segoe UI", 10, "bold"), bootstyle="primary").pack(anchor=W, pady=2)
         tb.Label(info, text=f"#Station Candidates: {len(self.station_candidates)}").pack(anchor=W, pady=2)
         tb.Label(info, text=f"#Selected Stations: {len(self.selected_stations)}").pack(anchor=W, pady=2)
-        tb.Label(info, text=f"#Selected Homes: {len(self.selected_homes)}").pack(anchor=W, pady=2)
+        tb.Label(info, text=f"#Selected Homes: {len(self.ev_home)}").pack(anchor=W, pady=2)
+        bound = getattr(self, "solution_bound", None)
+        if bound is not None:
+            tb.Label(info, text=f"Lower Bound: {bound:.2f} k€ "
+                                f"(gap {(self.solution_obj - bound) / max(abs(self.solution_obj), 1e-9) * 100:.2f}%)"
+                     ).pack(anchor=W, pady=2)
+        rep = getattr(self, "agg_report", None)
+        if rep:
+            tb.Label(info, text=f"Aggregation: {rep['n_ev']} EVs → {rep['n_points']} points, "
+                                f"reduced {rep['agg_obj']:.2f} → EV-level {rep['full_obj']:.2f} k€, "
+                                f"full-model bound {rep['lower_bound']:.2f} (gap {rep['gap'] * 100:.2f}%)"
+                     ).pack(anchor=W, pady=2)
+        pre = getattr(self, "presolve_report", None)
+        if pre:
+            tb.Label(info, text=f"Presolve: −{pre['n_removed']}/{pre['n_cand']} candidates, "
+                                f"−{pre['vars_before'] - pre['vars_after']} variables, "
+                                f"−{pre['rows_before'] - pre['rows_after']} rows, "
+                                f"{pre['n_fixed_open']} fixed open"
+                     ).pack(anchor=W, pady=2)
+            base = pre.get("baseline")
+            if "solve_s" in pre:
+                text = f"Solve time: {pre['solve_s']:.2f}s"
+                if base:
+                    text += f" (×{base[1] / max(pre['solve_s'], 1e-9):.1f} vs. unreduced)"
+                    if base[0] and pre.get("build_s"):
+                        text += f", build ×{base[0] / max(pre['build_s'], 1e-9):.1f}"
+                tb.Label(info, text=text).pack(anchor=W, pady=2)
 
         # -------- Summary KPIs ------------------------------------
         summary = tb.LabelFrame(info_frame, text="Summary", bootstyle="warning")
         summary.grid(row=0, column=1, sticky="nsew", padx=(5,0))
         
-        semi = sum(1 for s in self.selected_stations if s['type']=="Parking")
-        fast = sum(1 for s in self.selected_stations if s['type']=="Fuel")
-        chargers = semi*4 + fast*2
-        energy = int(sum(
-            h['vehicle'].consumption_rate * road_distance_km(
-                h['home']['lat'], h['home']['lon'], s['lat'], s['lon']
-            ) for h in self.selected_homes for s in self.selected_stations
-        ))
+        # KPI'lar çözücü tarafında hesaplandı; burada yalnızca gösterilir
         self.cost_var.set(f"{self.solution_obj:.2f}")
-        self.semi_var.set(str(semi))
-        self.fast_var.set(str(fast))
-        self.chargers_var.set(str(chargers))
-        self.energy_var.set(str(energy))
+        self.semi_var.set(str(sol.n_semi if sol else 0))
+        self.fast_var.set(str(sol.n_fast if sol else 0))
+        self.chargers_var.set(str(sol.n_chargers if sol else 0))
+        self.energy_var.set(f"{sol.energy_total:.0f}" if sol else "0")
 
         for lbl, var in [("Cost (k€)", self.cost_var),
                          ("Semi-fast CS", self.semi_var),
@@ -1244,6 +4644,27 @@ class ChargingStationOptimizer:
             tb.Label(row, text=lbl, font=("Segoe UI", 9, "bold")).pack(side=LEFT)
             tb.Label(row, textvariable=var, font=("Segoe UI", 9)).pack(side=RIGHT)
 
+        # -------- Alternatives (k-best) -----------------------------
+        if self.alternatives:
+            af = tb.LabelFrame(frm, text="Alternatives (double-click to show on map)",
+                               bootstyle="info")
+            af.pack(fill=X, pady=(0,10))
+            acols = ("Rank", "Objective (k€)", "Δ Best", "Stations")
+            atree = ttk.Treeview(af, columns=acols, show='headings',
+                                 height=min(len(self.alternatives), 5))
+            for c, w in zip(acols, (50, 110, 80, 500)):
+                atree.heading(c, text=c)
+                atree.column(c, width=w, anchor=CENTER if c != "Stations" else W)
+            atree.pack(fill=X)
+            tag_of = {c['id']: c['tag'] for c in self.station_candidates}
+            best_obj = self.alternatives[0]['obj']
+            for r, alt in enumerate(self.alternatives):
+                atree.insert('', 'end', iid=str(r), values=(
+                    r + 1, f"{alt['obj']:.2f}", f"+{alt['obj'] - best_obj:.2f}",
+                    ", ".join(tag_of.get(cid, str(cid)) for cid in alt['open'])))
+            atree.bind("<Double-1>", lambda e: atree.focus() and
+                       self.apply_alternative(int(atree.focus())))
+
         # -------- Cost vs EV Rate Grafiği --------------------------
         cf = tb.LabelFrame(frm, text="Cost vs EV Rate", bootstyle="info")
         cf.pack(fill=BOTH, expand=YES, pady=(0,5))
@@ -1327,17 +4748,27 @@ class ChargingStationOptimizer:
                  command=win.destroy).pack(side=RIGHT)
 
     def clear_map(self):
+        self.home_layer.clear(); self.cand_layer.clear()
         self.map_widget.delete_all_marker()
-        self.home_poi.clear(); self.station_candidates.clear()
-        self.selected_homes.clear(); self.selected_stations.clear()
+        self.station_candidates.clear()
+        self.home_layer.set_points([], [], [])
+        self.selected_stations.clear()
+        self.home_id = np.zeros(0, dtype=np.int64)
+        self.home_lat = self.home_lon = np.zeros(0)
+        self.ev_home = np.zeros(0, dtype=np.int64)
+        self.fleet = Fleet.from_models([])
+        self.trip_log = []; self.edge_freq = EdgeCounts.build([]); self.edge_lod = {}
+        self.dist_store = None; self._pair_km.clear(); self._st_pair_ids = None
+        self._mip_engine = self._mip_engine_key = None
+        self._timings.clear()
+        self._pool_cache.clear()
+        self.alternatives, self._alt_d = [], None
+        self.solution = None
         self._update_markers()
         for v in [self.cost_var, self.semi_var, self.fast_var,
                   self.chargers_var, self.energy_var]: v.set("0")
         self.ax.clear()
-        if hasattr(self, "_heat_lines"):
-            for ln in self._heat_lines:
-                ln.delete()
-            del self._heat_lines
+        self.heat_overlay.clear()
         if self.chart: self.chart.get_tk_widget().destroy()
         self.status_var.set("Map cleared")
 
@@ -1432,21 +4863,6 @@ class ChargingStationOptimizer:
         tb.Button(btn_frame, text="Close", bootstyle="danger", 
                  command=win.destroy).pack(side=RIGHT)
 
-    def clear_map(self):
-        self.map_widget.delete_all_marker()
-        self.home_poi.clear(); self.station_candidates.clear()
-        self.selected_homes.clear(); self.selected_stations.clear()
-        self._update_markers()
-        for v in [self.cost_var, self.semi_var, self.fast_var,
-                  self.chargers_var, self.energy_var]: v.set("0")
-        self.ax.clear()
-        if hasattr(self, "_heat_lines"):
-            for ln in self._heat_lines:
-                ln.delete()
-            del self._heat_lines
-        if self.chart: self.chart.get_tk_widget().destroy()
-        self.status_var.set("Map cleared")
-
     def run(self):
         self.root.mainloop()
 